@@ -0,0 +1,57 @@
+# attachment_store.py
+# 첨부파일 저장소 - 내용 해시(sha256)를 키로 디스크에 한 번만 저장하고 SQLite 에 색인
+# 같은 스크린샷을 여러 번 보내도 실제 바이트는 한 번만 올라오고, 이후엔 해시만 오감
+import hashlib
+import os
+from datetime import datetime
+from typing import Optional
+
+from database import pool
+
+ATTACHMENT_DIR = "attachments"
+PARTIAL_DIR = os.path.join(ATTACHMENT_DIR, "tmp")
+
+
+def attachment_path(file_hash: str) -> str:
+    # attachments/ab/abcdef... (한 폴더에 파일이 너무 많아지지 않도록 앞 2글자로 분산)
+    return os.path.join(ATTACHMENT_DIR, file_hash[:2], file_hash)
+
+
+def sha256_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+# 저장 폴더 준비 (서버 시작 시 1회 실행, 색인 테이블은 database.py 마이그레이션에서 생성)
+def init_attachment_store():
+    os.makedirs(PARTIAL_DIR, exist_ok=True)
+
+
+# 해시로 첨부파일 정보 조회 (없으면 None)
+async def get_attachment(file_hash: str) -> Optional[dict]:
+    async with pool.read() as db:
+        async with db.execute(
+            "SELECT hash, name, type, size FROM attachments WHERE hash = ?", (file_hash,)
+        ) as cursor:
+            row = await cursor.fetchone()
+
+    if row is None or not os.path.exists(attachment_path(row[0])):
+        return None
+    return {"id": row[0], "name": row[1], "type": row[2], "size": row[3]}
+
+
+# 업로드가 끝난 파일을 저장소로 옮기고 색인에 추가
+async def add_attachment(file_hash: str, src_path: str, name: str, ext: str, size: int, owner: str):
+    dst = attachment_path(file_hash)
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    os.replace(src_path, dst)
+
+    async with pool.write() as db:
+        await db.execute("""
+            INSERT OR IGNORE INTO attachments (hash, name, type, size, owner, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (file_hash, name, ext, size, owner, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        await db.commit()
@@ -0,0 +1,73 @@
+# avatar_store.py
+# 프로필 이미지(아바타) 저장소 - 내용 해시(sha256)를 키로 한 번만 저장
+# 메시지에는 해시만 싣고, 클라이언트는 처음 보는 해시만 한 번 받아서 캐시함
+import base64
+import binascii
+import hashlib
+from datetime import datetime
+from typing import Optional
+
+from database import pool
+from packet_fields import is_sha256
+
+MAX_AVATAR_BYTES = 1024 * 1024      # 디코딩한 이미지 최대 크기 (프로필 사진은 보통 수십 KB)
+
+# hash → base64 문자열 (서버 메모리 캐시)
+_avatars = {}
+# username → 현재 사용 중인 아바타 해시
+user_avatars = {}
+
+
+def avatar_hash(raw: bytes) -> str:
+    return hashlib.sha256(raw).hexdigest()
+
+
+# base64 아바타 저장 후 해시 반환 (이미 있으면 저장 생략)
+# 비어 있거나, 너무 크거나, base64 가 아니면 저장하지 않고 None
+async def put_avatar(data_b64: str) -> Optional[str]:
+    if not isinstance(data_b64, str) or not data_b64 or len(data_b64) > (MAX_AVATAR_BYTES + 2) // 3 * 4:
+        print("⚠️ 아바타 거절: 비어 있거나 크기 제한 초과")
+        return None
+    try:
+        raw = base64.b64decode(data_b64, validate=True)
+    except (binascii.Error, ValueError) as e:
+        print(f"⚠️ 아바타 디코딩 실패: {e}")
+        return None
+    if not raw:
+        return None
+
+    h = avatar_hash(raw)
+    if h in _avatars:
+        return h
+
+    async with pool.write() as db:
+        await db.execute("""
+            INSERT OR IGNORE INTO avatars (hash, data, created_at)
+            VALUES (?, ?, ?)
+        """, (h, raw, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        await db.commit()
+
+    _avatars[h] = base64.b64encode(raw).decode("utf-8")
+    return h
+
+
+# 해시로 아바타(base64) 조회 (해시 형식이 아니면 None)
+async def get_avatar(h: str) -> Optional[str]:
+    if not is_sha256(h):
+        return None
+    if h in _avatars:
+        return _avatars[h]
+
+    async with pool.read() as db:
+        async with db.execute("SELECT data FROM avatars WHERE hash = ?", (h,)) as cursor:
+            row = await cursor.fetchone()
+
+    if row is None:
+        return None
+    _avatars[h] = base64.b64encode(row[0]).decode("utf-8")
+    return _avatars[h]
+
+
+# 저장소에 있는 아바타 해시인지 (클라이언트가 보낸 해시를 메시지에 싣기 전에 확인)
+async def has_avatar(h: str) -> bool:
+    return await get_avatar(h) is not None
@@ -0,0 +1,289 @@
+# bus.py
+# 워커(프로세스) 사이 메시지 전달 버스 - 브로드캐스트, 접속자(presence), 공지, 캐시 갱신 이벤트
+# 모든 이벤트는 publish → 각 워커의 핸들러가 자기에게 연결된 소켓으로만 전달
+#   LocalBus  : 한 프로세스 안에서만 (uvicorn 워커 1개, 기본값)
+#   SQLiteBus : 같은 서버의 여러 워커가 bus.db 파일 하나를 공유 (uvicorn --workers N)
+# DANI_BUS=local | sqlite 로 선택
+import asyncio
+import json
+import os
+import socket
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List
+
+import aiosqlite
+
+BUS_DB_PATH = os.getenv("DANI_BUS_PATH", "bus.db")
+POLL_INTERVAL = 0.02        # 다른 워커의 이벤트 확인 주기 (초)
+HEARTBEAT_INTERVAL = 5      # 워커 생존 신호 주기 (초)
+WORKER_TIMEOUT = 15         # 이 시간 동안 생존 신호가 없으면 죽은 워커로 보고 접속자 목록에서 제외
+EVENT_TTL = 60              # 처리된 이벤트 보관 시간 (초)
+
+
+class Bus:
+    """공통 부분: 채널별 핸들러 등록과 로컬 전달"""
+
+    def __init__(self):
+        self.worker = f"{socket.gethostname()}-{os.getpid()}"
+        self.handlers: Dict[str, List[Callable]] = defaultdict(list)
+        self.published = 0
+        self.received = 0
+
+    def subscribe(self, channel: str, handler: Callable):
+        """handler(payload) - 일반 함수 또는 코루틴 함수"""
+        self.handlers[channel].append(handler)
+
+    def publish(self, channel: str, payload: dict):
+        """기다리지 않음. 이 워커의 핸들러는 바로 실행, 다른 워커에는 백엔드가 전달"""
+        self.published += 1
+        self._dispatch(channel, payload)
+
+    def _dispatch(self, channel: str, payload: dict):
+        for handler in self.handlers.get(channel, ()):
+            try:
+                result = handler(payload)
+                if asyncio.iscoroutine(result):
+                    asyncio.ensure_future(result)
+            except Exception as e:
+                print(f"⚠️ 버스 핸들러 오류 ({channel}): {e}")
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def is_leader(self) -> bool:
+        """여러 워커 중 하나만 해야 하는 작업(DB 유지보수 등) 담당 여부"""
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self).__name__,
+            "worker": self.worker,
+            "published": self.published,
+            "received": self.received,
+        }
+
+
+class LocalBus(Bus):
+    """한 프로세스 안에서만 동작 (publish = 바로 로컬 핸들러 호출)"""
+
+    def __init__(self):
+        super().__init__()
+        self.presence: Dict[str, int] = defaultdict(int)   # username → 연결 수
+
+    async def set_presence(self, username: str, online: bool):
+        if online:
+            self.presence[username] += 1
+        elif self.presence.get(username, 0) > 1:
+            self.presence[username] -= 1
+        else:
+            self.presence.pop(username, None)
+        self.publish("presence", {"username": username, "online": online})
+
+    async def online_users(self) -> list:
+        return list(self.presence.keys())
+
+
+class SQLiteBus(Bus):
+    """
+    bus.db (WAL) 를 공유하는 워커 간 버스
+    - publish: 로컬 핸들러는 바로 실행, bus_events 에는 쓰기 task 가 모아서 INSERT
+    - 각 워커는 POLL_INTERVAL 마다 자기 것이 아닌 새 이벤트만 읽어서 핸들러 실행
+    - 접속자: bus_presence(worker, username) + bus_workers 생존 신호 → 죽은 워커의 접속자는 자동 제외
+    """
+
+    def __init__(self, path: str = BUS_DB_PATH, poll_interval: float = POLL_INTERVAL):
+        super().__init__()
+        self.path = path
+        self.poll_interval = poll_interval
+        self.db = None
+        self.lock = asyncio.Lock()
+        self.outbox: asyncio.Queue = None
+        self.tasks = []
+        self.last_id = 0
+        self.leader = False
+        self.presence: Dict[str, int] = defaultdict(int)   # 이 워커의 접속자 (username → 연결 수)
+
+    async def start(self):
+        self.db = await aiosqlite.connect(self.path)
+        await self.db.execute("PRAGMA journal_mode=WAL")
+        await self.db.execute("PRAGMA synchronous=NORMAL")
+        await self.db.execute("PRAGMA busy_timeout=5000")
+        await self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS bus_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                channel TEXT NOT NULL,
+                origin TEXT NOT NULL,       -- 보낸 워커
+                payload TEXT NOT NULL,      -- JSON
+                created_at INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS bus_workers (
+                worker TEXT PRIMARY KEY,
+                heartbeat INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS bus_presence (
+                worker TEXT NOT NULL,
+                username TEXT NOT NULL,
+                PRIMARY KEY (worker, username)
+            );
+        """)
+        async with self.db.execute("SELECT COALESCE(MAX(id), 0) FROM bus_events") as cursor:
+            self.last_id = (await cursor.fetchone())[0]     # 시작 전 이벤트는 무시
+        async with self.lock:
+            await self.db.execute("DELETE FROM bus_presence WHERE worker = ?", (self.worker,))
+            await self._beat()
+            await self.db.commit()
+
+        self.outbox = asyncio.Queue()
+        self.tasks = [
+            asyncio.create_task(self._flush_loop()),
+            asyncio.create_task(self._poll_loop()),
+            asyncio.create_task(self._heartbeat_loop()),
+        ]
+        print(f"✅ SQLite 버스 시작 ({self.worker})")
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        for task in self.tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self.tasks = []
+        if self.db is not None:
+            await self._flush_pending()
+            async with self.lock:
+                await self.db.execute("DELETE FROM bus_presence WHERE worker = ?", (self.worker,))
+                await self.db.execute("DELETE FROM bus_workers WHERE worker = ?", (self.worker,))
+                await self.db.commit()
+            await self.db.close()
+            self.db = None
+
+    def publish(self, channel: str, payload: dict):
+        super().publish(channel, payload)
+        if self.outbox is not None:
+            self.outbox.put_nowait((channel, self.worker, json.dumps(payload), int(time.time())))
+
+    async def _flush_loop(self):
+        while True:
+            first = await self.outbox.get()
+            await self._write_events([first])
+            await self._flush_pending()
+
+    async def _flush_pending(self):
+        batch = []
+        while self.outbox is not None and not self.outbox.empty():
+            batch.append(self.outbox.get_nowait())
+        if batch:
+            await self._write_events(batch)
+
+    async def _write_events(self, events):
+        async with self.lock:
+            await self.db.executemany(
+                "INSERT INTO bus_events (channel, origin, payload, created_at) VALUES (?, ?, ?, ?)", events)
+            await self.db.commit()
+
+    async def _poll_loop(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                async with self.db.execute(
+                        "SELECT id, channel, origin, payload FROM bus_events WHERE id > ? ORDER BY id LIMIT 1000",
+                        (self.last_id,)) as cursor:
+                    rows = await cursor.fetchall()
+            except Exception as e:
+                print(f"⚠️ 버스 이벤트 읽기 실패: {e}")
+                continue
+            for event_id, channel, origin, payload in rows:
+                self.last_id = event_id
+                if origin == self.worker:
+                    continue    # 내가 보낸 이벤트는 publish 때 이미 처리함
+                self.received += 1
+                self._dispatch(channel, json.loads(payload))
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            try:
+                async with self.lock:
+                    await self._beat()
+                    # 오래된 이벤트, 죽은 워커와 그 접속자 정리
+                    now = int(time.time())
+                    await self.db.execute("DELETE FROM bus_events WHERE created_at < ?", (now - EVENT_TTL,))
+                    cursor = await self.db.execute(
+                        "DELETE FROM bus_presence WHERE worker IN "
+                        "(SELECT worker FROM bus_workers WHERE heartbeat < ?)", (now - WORKER_TIMEOUT,))
+                    removed = cursor.rowcount
+                    await self.db.execute("DELETE FROM bus_workers WHERE heartbeat < ?", (now - WORKER_TIMEOUT,))
+                    await self.db.commit()
+                if removed:
+                    self.publish("presence", {"username": None, "online": False})
+            except Exception as e:
+                print(f"⚠️ 버스 생존 신호 실패: {e}")
+
+    async def _beat(self):
+        now = int(time.time())
+        await self.db.execute("""
+            INSERT INTO bus_workers (worker, heartbeat) VALUES (?, ?)
+            ON CONFLICT(worker) DO UPDATE SET heartbeat = excluded.heartbeat
+        """, (self.worker, now))
+        # 살아 있는 워커 중 이름이 가장 작은 워커가 leader
+        async with self.db.execute(
+                "SELECT MIN(worker) FROM bus_workers WHERE heartbeat >= ?", (now - WORKER_TIMEOUT,)) as cursor:
+            self.leader = (await cursor.fetchone())[0] == self.worker
+
+    async def set_presence(self, username: str, online: bool):
+        # 같은 워커에 같은 이름이 두 번 연결될 수 있어서 연결 수를 셈 (마지막 연결이 끊길 때만 삭제)
+        if online:
+            self.presence[username] += 1
+        elif self.presence.get(username, 0) > 1:
+            self.presence[username] -= 1
+        else:
+            self.presence.pop(username, None)
+
+        async with self.lock:
+            if username in self.presence:
+                await self.db.execute(
+                    "INSERT OR IGNORE INTO bus_presence (worker, username) VALUES (?, ?)", (self.worker, username))
+            else:
+                await self.db.execute(
+                    "DELETE FROM bus_presence WHERE worker = ? AND username = ?", (self.worker, username))
+            await self.db.commit()
+        self.publish("presence", {"username": username, "online": online})
+
+    async def online_users(self) -> list:
+        async with self.db.execute("""
+            SELECT DISTINCT p.username
+            FROM bus_presence p JOIN bus_workers w ON w.worker = p.worker
+            WHERE w.heartbeat >= ?
+            ORDER BY p.username
+        """, (int(time.time()) - WORKER_TIMEOUT,)) as cursor:
+            return [row[0] for row in await cursor.fetchall()]
+
+    def is_leader(self) -> bool:
+        return self.leader
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats.update({
+            "leader": self.leader,
+            "last_event_id": self.last_id,
+            "outbox": self.outbox.qsize() if self.outbox is not None else 0,
+        })
+        return stats
+
+
+def create_bus() -> Bus:
+    backend = os.getenv("DANI_BUS", "local").lower()
+    if backend == "sqlite":
+        return SQLiteBus()
+    if backend != "local":
+        print(f"⚠️ 알 수 없는 DANI_BUS={backend}, local 로 동작")
+    return LocalBus()
+
+
+bus = create_bus()
@@ -7,6 +7,9 @@ import packet
 import websockets
 import json
 import base64
+import bisect
+import hashlib
+import uuid
 from datetime import datetime
 from io import BytesIO
 from PIL import Image
@@ -14,7 +17,8 @@ from PIL import Image
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLineEdit,
     QPushButton, QLabel, QDialog, QDialogButtonBox, QScrollArea, QFrame,
-    QSizePolicy, QFileDialog, QTextEdit, QComboBox, QTextBrowser, QBoxLayout, QListWidget, QListWidgetItem
+    QSizePolicy, QFileDialog, QTextEdit, QComboBox, QTextBrowser, QBoxLayout, QListWidget, QListWidgetItem,
+    QCheckBox, QInputDialog
 )
 from PyQt5.QtGui import QFont, QFontDatabase, QPixmap, QTextOption
 from PyQt5.QtCore import Qt, QTimer, QPoint, QCoreApplication
@@ -70,6 +74,16 @@ def save_user_cache(nickname, image_path):
         print(f" 캐시 저장 실패: {e}")
 
 
+# 아바타 캐시 폴더 (해시.png) - 같은 아바타는 한 번만 받아옴
+AVATAR_CACHE_DIR = os.path.join(os.path.dirname(CACHE_FILE), "cache_images", "avatars")
+DEFAULT_PROFILE_PATH = os.path.join(os.path.dirname(__file__), "images/face.png")
+
+
+def avatar_hash_of(data_b64):
+    """서버 avatar_store 와 같은 방식(sha256(이미지 바이트))으로 해시 계산"""
+    return hashlib.sha256(base64.b64decode(data_b64)).hexdigest()
+
+
 def resize_image_to_base64(image_path, size=(128, 128)):
     img = Image.open(image_path)
     img = img.resize(size)
@@ -78,6 +92,158 @@ def resize_image_to_base64(image_path, size=(128, 128)):
     return base64.b64encode(buffer.getvalue()).decode("utf-8")
 
 
+# 받은 파일 캐시 폴더 (file_id + 확장자)
+FILE_CACHE_DIR = os.path.join(os.path.dirname(CACHE_FILE), "cache_images", "files")
+FILE_CHUNK_SIZE = 256 * 1024
+IMAGE_EXTS = [".png", ".jpg", ".jpeg", ".gif"]
+LOBBY_ROOM = "lobby"             # 서버 database.py 의 기본 방
+ROOM_JOIN_ITEM = "__join__"     # 방 선택 콤보박스의 "방 참여/만들기" 항목
+UNCONFIRMED_LIMIT = 200         # 재전송 대비로 들고 있는 보낸 메시지 최대 개수
+READ_REPORT_DELAY_MS = 3000     # 읽은 위치 보고 지연 (스크롤 중에는 계속 미뤄짐)
+
+
+class TransferCancelled(Exception):
+    pass
+
+
+def sha256_file(path, chunk_size=1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class SendPacer:
+    """서버 throttle 응답(rate_limit.py)에 맞춰 종류별(text/file/gpt/control)로 다음 전송을 미룸"""
+
+    def __init__(self):
+        self.resume_at = {}     # 종류 → 다시 보내도 되는 시각 (loop.time())
+
+    def pause(self, kind, seconds):
+        now = asyncio.get_event_loop().time()
+        self.resume_at[kind] = max(self.resume_at.get(kind, 0), now + seconds)
+
+    async def wait(self, kind):
+        delay = self.resume_at.get(kind, 0) - asyncio.get_event_loop().time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class FileTransferClient:
+    """
+    /files/{username} 채널로 청크 단위 업로드/다운로드
+    - 메모리는 청크 크기만큼만 사용
+    - 연결이 끊기면 다시 연결해서 서버가 알려준 offset(다운로드는 .part 크기)부터 이어서 전송
+    - file_id 는 sha256(파일) → 서버에 이미 있는 파일이면 해시만 보내고 끝
+    """
+    MAX_RETRIES = 5
+
+    def __init__(self, url):
+        self.url = url
+        self.ws = None
+        self.lock = asyncio.Lock()  # 요청/응답 한 쌍씩만 오가도록 (여러 전송은 청크 단위로 번갈아 진행)
+
+    async def _request(self, header, data=None):
+        async with self.lock:
+            if self.ws is None:
+                self.ws = await websockets.connect(self.url, max_size=None)
+            try:
+                await self.ws.send(json.dumps(header))
+                if data is not None:
+                    await self.ws.send(data)
+                reply = json.loads(await self.ws.recv())
+                payload = await self.ws.recv() if reply.get("op") == "data" else None
+            except Exception:
+                ws, self.ws = self.ws, None
+                try:
+                    await ws.close()
+                except Exception:
+                    pass
+                raise
+
+        if reply.get("op") == "error":
+            raise RuntimeError(reply.get("message"))
+        return reply, payload
+
+    async def _backoff(self, attempt, error):
+        if attempt > self.MAX_RETRIES:
+            raise error
+        print(f"⚠️ 파일 채널 끊김, 이어서 재시도 ({attempt}/{self.MAX_RETRIES}): {error}")
+        await asyncio.sleep(min(2 ** attempt, 10))
+
+    async def upload(self, path, on_progress=None, cancel_event=None):
+        name = os.path.basename(path)
+        ext = os.path.splitext(name)[1].lower()
+        size = os.path.getsize(path)
+        file_id = await asyncio.get_event_loop().run_in_executor(None, sha256_file, path)
+        attempt = 0
+
+        while True:
+            try:
+                reply, _ = await self._request({
+                    "op": "upload_init", "name": name, "size": size, "type": ext, "file_id": file_id
+                })
+                if reply["op"] == "throttle":
+                    # 업로드 시작이 너무 잦음 (여러 파일 드래그) → 서버가 알려준 만큼 쉬고 다시 시작
+                    await asyncio.sleep(float(reply.get("retry_after") or 1))
+                    continue
+                if reply["op"] == "upload_exists":
+                    if on_progress:
+                        on_progress(size, size)
+                    break
+
+                offset = reply["offset"]
+                chunk_size = reply.get("chunk_size", FILE_CHUNK_SIZE)
+                with open(path, "rb") as f:
+                    while offset < size:
+                        if cancel_event and cancel_event.is_set():
+                            await self._request({"op": "cancel", "file_id": file_id})
+                            raise TransferCancelled()
+                        f.seek(offset)
+                        reply, _ = await self._request(
+                            {"op": "chunk", "file_id": file_id, "offset": offset}, f.read(chunk_size))
+                        offset = reply["offset"]
+                        if on_progress:
+                            on_progress(offset, size)
+
+                await self._request({"op": "upload_done", "file_id": file_id})
+                break
+            except (OSError, websockets.exceptions.ConnectionClosed) as e:
+                attempt += 1
+                await self._backoff(attempt, e)
+
+        return {"id": file_id, "name": name, "size": size, "type": ext}
+
+    async def fetch_thumbnail(self, file_id):
+        _, data = await self._request({"op": "thumb", "file_id": file_id})
+        return data
+
+    async def download(self, file_id, dest_path, on_progress=None, cancel_event=None):
+        part = dest_path + ".part"     # 끊겨도 받은 만큼은 남겨두고 이어받기
+        attempt = 0
+
+        while True:
+            try:
+                offset = os.path.getsize(part) if os.path.exists(part) else 0
+                with open(part, "ab") as f:
+                    while True:
+                        if cancel_event and cancel_event.is_set():
+                            raise TransferCancelled()
+                        reply, data = await self._request({"op": "read", "file_id": file_id, "offset": offset})
+                        f.write(data)
+                        offset += len(data)
+                        if on_progress:
+                            on_progress(offset, reply["size"])
+                        if reply["eof"]:
+                            break
+                os.replace(part, dest_path)
+                return dest_path
+            except (OSError, websockets.exceptions.ConnectionClosed) as e:
+                attempt += 1
+                await self._backoff(attempt, e)
+
+
 class NicknameDialog(QDialog):
     def __init__(self):
         super().__init__()
@@ -238,7 +404,7 @@ class ChatClient(QWidget):
         for url in event.mimeData().urls():
             file_path = url.toLocalFile()
             if os.path.isfile(file_path):
-                asyncio.create_task(self._send_file_task(file_path))
+                asyncio.ensure_future(self._send_file_task(file_path))
 
     def __init__(self):
         super().__init__()
@@ -247,10 +413,12 @@ class ChatClient(QWidget):
         self.setObjectName("MainWindow")
         self.setAcceptDrops(True)  # ← 드래그앤드롭 허용
 
-        self.server_url = "ws://localhost:30006/ws/"
+        self.server_url = "ws://localhost:30006/mux"
 
         self.message_map = {}  # reply_id → {"bubble": QLabel, "frame": QFrame}
         self.thinking_timers = {}  # reply_id → QTimer
+        self.thinking_texts = {}   # reply_id → 깜빡이는 안내 문구 (대기 순번)
+        self.gpt_budget_text = ""  # 마지막으로 받은 이번 달 GPT 사용량 표시
 
         self.setStyleSheet("""
             QWidget#MainWindow {
@@ -260,9 +428,12 @@ class ChatClient(QWidget):
         """)
 
         self.profile_image = None
-        self.profiles = {}
+        self.avatar_hash = None
+        self.avatar_pixmaps = {}    # 아바타 해시 → QPixmap
+        self.avatar_waiters = {}    # 아바타 해시 → 도착하면 갱신할 QLabel 리스트
+        self.avatar_requested = set()
 
-        self.image_history = []  # base64 디코딩된 QPixmap 리스트
+        self.image_history = []  # 이미지 말풍선 handle 리스트 (thumb/full QPixmap 은 필요할 때 채워짐)
         self.current_image_index = 0  # 현재 미리보기 인덱스
 
         nickname_dialog = NicknameDialog()
@@ -272,9 +443,16 @@ class ChatClient(QWidget):
 
         if image_path:
             self.profile_image = resize_image_to_base64(image_path)
+            self.avatar_hash = avatar_hash_of(self.profile_image)
+            pixmap = QPixmap()
+            pixmap.loadFromData(base64.b64decode(self.profile_image))
+            self.avatar_pixmaps[self.avatar_hash] = pixmap
 
         self.websocket = None
-        self.server_url = "ws://localhost:30006/ws/"
+        # 채팅/공지/접속자/제어 채널을 소켓 하나로 (서버 main.py 의 /mux)
+        self.server_url = "ws://localhost:30006/mux"
+        self.file_server_url = "ws://localhost:30006/files/"
+        self.file_client = FileTransferClient(self.file_server_url + self.username)
 
         font_path = resource_path("fonts/NanumSquareRoundR.ttf")
         if os.path.exists(font_path):
@@ -297,7 +475,30 @@ class ChatClient(QWidget):
                 margin: 0;
             }
         """)
-        self.layout.addWidget(self.user_list_label)
+        # 접속자 목록 + 검색 버튼
+        header_layout = QHBoxLayout()
+        header_layout.addWidget(self.user_list_label, 1)
+        self.search_button = QPushButton("🔍")
+        self.search_button.setFixedSize(36, 30)
+        self.search_button.setStyleSheet("""
+            QPushButton {
+                background-color: #ffffff;
+                border: 1px solid #ddd;
+                border-radius: 8px;
+                font-size: 15px;
+            }
+            QPushButton:hover {
+                background-color: #f2f2f2;
+            }
+        """)
+        self.search_button.clicked.connect(self.open_search)
+        # 참여한 방 선택 → 방 창 열기 (방 메시지는 열어 둔 방 창에만 그림)
+        self.room_combo = QComboBox()
+        self.room_combo.setFixedHeight(30)
+        self.room_combo.activated[int].connect(self.on_room_selected)
+        header_layout.addWidget(self.room_combo)
+        header_layout.addWidget(self.search_button)
+        self.layout.addLayout(header_layout)
 
         self.scroll_area = QScrollArea()
         self.scroll_area.setWidgetResizable(True)
@@ -388,9 +589,37 @@ class ChatClient(QWidget):
         # read_message_count 저장 변수 추가
         #self.read_message_count = 0
 
-        self.last_received_message_id = None  # ✅ 메시지 ID 기반 읽은 위치 초기화
+        self.last_received_message_id = None  # ✅ 메시지 ID 기반 읽은 위치 초기화 (받은 메시지 중 가장 큰 ID)
+        self.oldest_message_id = None  # 화면에 있는 가장 오래된 메시지 ID (이전 메시지 불러오기 기준)
+        self.has_more_older = True
+        self.loading_older = False
+        self.prepend_at = None  # 이전 메시지를 맨 위에 끼워 넣는 중이면 다음 삽입 위치
+        self.message_widgets = {}  # 메시지 ID → 말풍선 프레임
+        self.pending_sent = {}  # 내가 보낸 메시지의 임시 ID(client_id) → 말풍선 프레임 (서버 ID 가 오면 연결)
+        self.search_window = None
+        self.presence_version = None  # 마지막으로 적용한 접속자 목록 버전 (서버 presence.py)
+        self.pacer = SendPacer()    # 서버 throttle 에 맞춘 종류별 전송 대기
+        self.unconfirmed = {}       # client_id → (종류, 보낸 패킷) - 서버 에코가 오기 전까지 (throttle 시 재전송용)
+        self.validate_waiters = {}  # 닉네임 → 확인 결과를 기다리는 Future (control 채널 validate)
+        self.online_users = set()
+        self.jump_target = None  # 검색 결과에서 이동하려는 메시지 ID (이전 메시지 도착 후 스크롤)
+        self.closing = False
+
+        # 스크롤이 맨 위에 닿으면 이전 메시지 한 페이지 요청
+        self.scroll_area.verticalScrollBar().valueChanged.connect(self.on_scroll_changed)
+
+        # 맨 아래까지 본 위치를 잠시 모아서 서버에 보고 (메시지/스크롤마다 보내지 않음)
+        self.reported_read_id = None
+        self.read_report_timer = QTimer(self)
+        self.read_report_timer.setSingleShot(True)
+        self.read_report_timer.setInterval(READ_REPORT_DELAY_MS)
+        self.read_report_timer.timeout.connect(self.report_read_position)
 
         self.private_chats = {} # 개인 채팅방 저장용 딕셔너리 초기화
+        self.joined_rooms = []  # 참여한 방 (lobby 제외, 서버 rooms.py)
+        self.room_windows = {}  # 방 이름 → 열려 있는 RoomChatWindow
+        self.room_unread = {}   # 방 이름 → 창이 닫혀 있는 동안 온 메시지 수
+        self.refresh_room_combo()
 
         # 유저 리스트 객체 이름 수정
         self.user_list = QListWidget(self)
@@ -398,8 +627,22 @@ class ChatClient(QWidget):
         self.layout.addWidget(self.user_list)   # 유저 목록도 레이아웃에 포함
 
     async def check_nickname_available(self,nickname):
+        # 접속 중이면 같은 소켓의 control 채널로 확인 (결과는 receive_messages 에서 전달됨)
+        if self.websocket:
+            future = self.validate_waiters.get(nickname)
+            if future is None:
+                future = asyncio.get_event_loop().create_future()
+                self.validate_waiters[nickname] = future
+                await self._safe_send(json.dumps({"ch": "control", "type": "validate", "nickname": nickname}))
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), 5)
+            except asyncio.TimeoutError:
+                self.validate_waiters.pop(nickname, None)
+                return False
+
+        # 접속 전이면 hello 없이 control 채널만 잠깐 사용
         async with websockets.connect(self.server_url) as ws:
-            await ws.send(json.dumps({"type": "validate", "nickname": nickname}))
+            await ws.send(json.dumps({"ch": "control", "type": "validate", "nickname": nickname}))
             response = await ws.recv()
             result = json.loads(response)
             return result.get("available", False)
@@ -415,34 +658,90 @@ class ChatClient(QWidget):
             self.loading_label.hide()
 
     async def connect(self):
-        try:
-            self.websocket = await websockets.connect(
-                self.server_url + self.username,
-                max_size=None  # ← 제한 해제
-            )
-            await self.receive_messages()
-
-
+        retry = 0
+        while not self.closing:
+            try:
+                self.websocket = await websockets.connect(
+                    self.server_url,
+                    max_size=None  # ← 제한 해제
+                )
+                retry = 0
+                # 첫 프레임은 control 채널 hello
+                # 재접속이면 마지막으로 받은 메시지 ID 이후만 받아옴 (오늘 기록 전체를 다시 받지 않음)
+                await self._safe_send(json.dumps({
+                    "ch": "control",
+                    "type": "hello",
+                    "username": self.username,
+                    "after_id": self.last_received_message_id
+                }))
+                # 아바타는 접속 시 1회만 올리고, 이후 메시지에는 해시만 실어 보냄
+                if self.profile_image:
+                    await self._safe_send(json.dumps({"type": "avatar_put", "data": self.profile_image}))
+                # 열어 둔 방 창은 새로 받아서 다시 그림
+                for room in list(self.room_windows):
+                    await self._safe_send(json.dumps({"type": "room_history", "room": room}))
+                await self.receive_messages()
 
+            except Exception as e:
+                if retry == 0:
+                    self.add_message(f"❌ 연결 실패: {e}", is_system=True)
+                print(f"❌ 연결 실패 ({retry}): {e}")
 
-        except Exception as e:
-            self.add_message(f"❌ 연결 실패: {e}", is_system=True)
+            self.websocket = None
+            if self.closing:
+                break
+            # 끊기면 잠시 후 재접속 (1, 2, 4 ... 최대 30초)
+            await asyncio.sleep(min(2 ** retry, 30))
+            retry += 1
 
     @asyncSlot()
     async def send_message(self):
         message = self.input_line.text().strip()
         if message and self.websocket:
+            client_id = uuid.uuid4().hex
             packet = {
                 "sender": self.username,
                 "message": message,
-                "profile": self.profile_image
+                "avatar": self.avatar_hash,
+                "client_id": client_id
             }
 
-            asyncio.create_task(self._safe_send(json.dumps(packet)))
+            kind = "gpt" if message.startswith("#") else "text"
+            asyncio.create_task(self._paced_send(kind, json.dumps(packet), client_id))
 
-            self.add_message(message, from_self=True, profile=self.profile_image)
+            self.pending_sent[client_id] = self.add_message(message, from_self=True, avatar=self.avatar_hash)
             self.input_line.clear()
 
+    # 서버가 throttle 로 돌려보낸 메시지는 retry_after 만큼 쉬었다가 다시 보냄 (종류별로 따로 대기)
+    async def _paced_send(self, kind, data, client_id=None):
+        if client_id is not None:
+            self.unconfirmed[client_id] = (kind, data)
+            while len(self.unconfirmed) > UNCONFIRMED_LIMIT:
+                self.unconfirmed.pop(next(iter(self.unconfirmed)))
+        await self.pacer.wait(kind)
+        await self._safe_send(data)
+
+    def on_throttle(self, packet):
+        kind = packet.get("kind", "control")
+        retry_after = float(packet.get("retry_after") or 1)
+        self.pacer.pause(kind, retry_after)
+        print(f"⏳ 서버 속도 제한 ({kind}): {retry_after}초 뒤 재전송")
+        pending = self.unconfirmed.pop(packet.get("client_id"), None)
+        if pending is not None:
+            asyncio.ensure_future(self._paced_send(pending[0], pending[1], packet.get("client_id")))
+
+    def on_gpt_status(self, packet):
+        reply_id = packet.get("reply_id")
+        budget = packet.get("budget")
+        if budget and budget.get("limit"):
+            self.gpt_budget_text = f" · 이번 달 ${budget.get('used', 0):.2f} / ${budget['limit']:.2f}"
+        position = packet.get("position")
+        if position:
+            text = f"⏳ 대기 중 ({position}번째)"
+        else:
+            text = "⏳ 답변을 생성 중입니다"
+        self.thinking_texts[reply_id] = text
+
     # WebSocket 전송을 한 Task 안에서만 처리하도록 보장
     async def _safe_send(self, data: str):
         try:
@@ -457,33 +756,54 @@ class ChatClient(QWidget):
 
         for file_path in file_paths:
             if file_path:
-                await self._send_file_task(file_path)
+                asyncio.ensure_future(self._send_file_task(file_path))
 
     async def _send_file_task(self, file_path):
-        try:
-            with open(file_path, "rb") as f:
-                data = base64.b64encode(f.read()).decode("utf-8")
-
-            filename = os.path.basename(file_path)
-            ext = os.path.splitext(filename)[1].lower()
-
-            packet = {
-                "sender": self.username,
-                "message": f"[파일] {filename}",
-                "profile": self.profile_image,
-                "file": {
-                    "name": filename,
-                    "data": data,
-                    "type": ext 
-                }
-            }
-
-            await self._safe_send(json.dumps(packet))
+        filename = os.path.basename(file_path)
+        ext = os.path.splitext(filename)[1].lower()
 
-            self.add_file_message(filename, data, ext, from_self=True, profile=self.profile_image)
+        # 내 화면에는 로컬 파일로 바로 표시, 업로드는 파일 채널에서 청크 단위로 진행
+        handle = self.add_file_message(filename, ext, local_path=file_path, from_self=True, avatar=self.avatar_hash)
+        cancel_event = asyncio.Event()
+        self.set_transfer_status(handle, "⬆️ 0% (클릭하면 취소)", cancel_event)
 
+        try:
+            file_ref = await self.file_client.upload(
+                file_path,
+                on_progress=lambda done, total: self.set_transfer_status(
+                    handle, f"⬆️ {done * 100 // max(total, 1)}% (클릭하면 취소)", cancel_event),
+                cancel_event=cancel_event,
+            )
+        except TransferCancelled:
+            self.set_transfer_status(handle, "⛔ 전송 취소됨")
+            return
         except Exception as e:
+            self.set_transfer_status(handle, "❌ 전송 실패")
             self.add_message(f"❌ 파일 전송 실패: {e}")
+            return
+
+        self.set_transfer_status(handle, "")
+
+        # 채팅 메시지에는 파일 참조만 실어 보냄
+        client_id = uuid.uuid4().hex
+        self.pending_sent[client_id] = handle["frame"]
+        packet = {
+            "sender": self.username,
+            "message": f"[파일] {filename}",
+            "avatar": self.avatar_hash,
+            "file": file_ref,
+            "client_id": client_id
+        }
+        await self._paced_send("text", json.dumps(packet), client_id)
+
+    def set_transfer_status(self, handle, text, cancel_event=None):
+        label = handle["status"]
+        label.setText(text)
+        label.setVisible(bool(text))
+        if cancel_event is not None:
+            label.mousePressEvent = lambda e: cancel_event.set()
+        else:
+            label.mousePressEvent = lambda e: None
 
     async def receive_messages(self):
 
@@ -491,6 +811,53 @@ class ChatClient(QWidget):
             async for raw in self.websocket:
                 packet = json.loads(raw)
 
+                # control 채널: 서버 하트비트 → 바로 pong (응답이 없으면 서버가 유휴 연결로 보고 끊음)
+                if packet.get("type") == "ping":
+                    asyncio.create_task(self._safe_send(json.dumps({"ch": "control", "type": "pong"})))
+                    continue
+
+                if packet.get("type") == "validate_result":
+                    future = self.validate_waiters.pop(packet.get("nickname"), None)
+                    if future is not None and not future.done():
+                        future.set_result(bool(packet.get("available")))
+                    continue
+
+                # notice 채널: 공지 (예전에는 /notice 소켓을 따로 열어야 했음)
+                if packet.get("ch") == "notice":
+                    if packet.get("type") == "announcement":
+                        self.add_message(f"📢 [공지] {packet.get('sender')}: {packet.get('message')}", is_system=True)
+                    continue
+
+                # 보내는 속도가 서버 예산을 넘음 → 그 종류는 잠시 멈췄다가 보낸 메시지를 다시 전송
+                if packet.get("type") == "throttle":
+                    self.on_throttle(packet)
+                    continue
+
+                # GPT 예산 확인 / 대기 순번 → 생성 중 말풍선 문구 갱신
+                if packet.get("type") == "gpt_status":
+                    self.on_gpt_status(packet)
+                    continue
+
+                # GPT 답변 조각 → 생성 중 말풍선 뒤에 이어 붙임 (마지막에 전체 답변 message 패킷이 한 번 더 옴)
+                if packet.get("type") == "gpt_delta":
+                    self.add_message(packet.get("delta", ""), reply_id=packet.get("reply_id"), append=True)
+                    continue
+
+                # 방 목록 / 방 오류
+                if packet.get("type") == "rooms":
+                    self.joined_rooms = [r for r in packet.get("joined", []) if r != LOBBY_ROOM]
+                    self.refresh_room_combo()
+                    continue
+
+                if packet.get("type") == "room_error":
+                    self.add_message(f"⚠️ 방 요청 실패 ({packet.get('room')}): {packet.get('reason')}", is_system=True)
+                    continue
+
+                # lobby 가 아닌 방의 메시지/히스토리는 그 방 창으로 (lobby 화면과 마지막 ID 에는 섞지 않음)
+                if packet.get("room") is not None:
+                    self.on_room_packet(packet)
+                    continue
+
                 """개인톡 분기 처리"""
                 if packet["type"] == "private_room":
                     sender = packet["sender"]
@@ -500,9 +867,23 @@ class ChatClient(QWidget):
                     # 현재 내가 수신자 or 발신자인 경우만 해당 창 띄우기
                     if receiver == self.username or sender == self.username:
                         partner = sender if sender != self.username else receiver
-                        if partner not in self.private_chats:
-                            self.open_private_chat(QListWidgetItem(partner))
-                        self.private_chats[partner].receive_message(sender, msg)
+                        self.open_private_chat(QListWidgetItem(partner))
+                        self.private_chats[partner].add_messages([packet])
+                    continue    # 1:1 메시지 ID 는 lobby 메시지 ID 와 별개
+
+                # 접속해 있지 않는 동안 받은 1:1 메시지 → 보낸 사람별로 창을 열어 표시
+                if packet.get("type") == "private_pending":
+                    for msg in packet.get("messages", []):
+                        self.open_private_chat(QListWidgetItem(msg["sender"]))
+                        self.private_chats[msg["sender"]].add_messages([msg])
+                    continue
+
+                # 1:1 대화 히스토리 한 페이지
+                if packet.get("type") == "private_history":
+                    window = self.private_chats.get(packet.get("partner"))
+                    if window is not None:
+                        window.add_messages(packet.get("messages", []), packet.get("has_more"))
+                    continue
 
 
 
@@ -511,12 +892,30 @@ class ChatClient(QWidget):
 
 
 
+                # 요청했던 아바타 도착 → 캐시 저장 후 기본 이미지로 그려둔 라벨 갱신
+                if packet.get("type") == "avatar":
+                    self.on_avatar_received(packet.get("hash"), packet.get("data"))
+                    continue
+
+                # 누군가 읽은 위치가 바뀜 → 해당 구간 말풍선의 안 읽은 수만 갱신
+                if packet.get("type") == "read_receipts":
+                    self.apply_read_receipts(packet)
+                    continue
+
                 if "sender" in packet and "message" in packet:
                     sender = packet["sender"]
                     message = packet["message"]
-                    profile = packet.get("profile")
+                    avatar = packet.get("avatar")
                     is_me = (sender == self.username)
 
+                    # 내가 보낸 메시지가 서버 ID 를 받아 돌아옴 → 내 말풍선에 ID 연결 (읽음 표시용)
+                    if is_me and packet.get("client_id") in self.pending_sent and isinstance(packet.get("id"), int):
+                        self.unconfirmed.pop(packet["client_id"], None)
+                        self.message_widgets[packet["id"]] = self.pending_sent.pop(packet["client_id"])
+                        self.set_unread_count(packet["id"], packet.get("unread", 0))
+                        self.note_message_id(packet["id"])
+                        continue
+
                     # 히스토리 이후, 처음 도착한 타인 메세지에 구분선 삽입
                     if self.history_loaded and not is_me and not self.separator_shown:
                         self.add_separator()
@@ -529,76 +928,102 @@ class ChatClient(QWidget):
 
                         self.add_file_message(
                             filename=file_info["name"],
-                            data_b64=file_info["data"],
                             ext=os.path.splitext(file_info["name"])[1].lower(),
+                            file_id=file_info.get("id"),
+                            local_path=self.cache_legacy_file(file_info),
+                            thumb_b64=file_info.get("thumb"),
+                            message_id=packet.get("id"),
                             from_self=False,
-                            profile=profile,
+                            avatar=avatar,
                             sender_name=sender,  #여기 추가
 
                         )
+                        self.set_unread_count(packet.get("id"), packet.get("unread", 0))
                         continue
 
-                    self.profiles[sender] = profile
                     if sender != self.username:
                         self.add_message(
                             f"{sender}: {message}",
+                            reply_id=packet.get("reply_id"),   # GPT 답변: 생성 중 말풍선을 교체
                             from_self=False,
-                            profile=profile,
+                            avatar=avatar,
+                            message_id=packet.get("id"),
                             is_system = False
                         )
-                        popup = PopupNotification(sender, message)
-                        popup.show()
+                        self.set_unread_count(packet.get("id"), packet.get("unread", 0))
+                        if not packet.get("reply_id") or packet.get("done"):   # "생성 중" 자리표시는 알림 없음
+                            popup = PopupNotification(sender, message)
+                            popup.show()
 
                 elif "users" in packet:
-                    self.update_user_list(packet["users"])
+                    self.update_user_list(packet["users"], packet.get("version"))
+
+                # 접속자 입장/퇴장 변화분
+                elif packet.get("type") == "presence_delta":
+                    self.apply_presence_delta(packet)
+                    continue
 
                 # type에 히스토리 있을 시, 이전 대화 불러옴(당일 한정)
                 elif packet.get("type") == "history":
                     self.set_loading_state(True)  # ⬅️ 로딩 시작 표시
                     self.last_read_id = packet.get("last_read_id")
 
-                    #self.read_message_count = packet.get("read_count", 0)  # ✅ 서버 응답 기준
+                    # 재접속 증분이면 기존 화면 뒤에 이어 붙이고, 아니면 새로 그림
+                    incremental = packet.get("incremental", False)
+                    if not incremental:
+                        self.clear_chat()
 
                     for i, msg in enumerate(packet["messages"]):
-                        message_id = msg["id"]
-                        is_me = (msg["sender"] == self.username)
-                        """내가 전송한 대화 기록은 잘못 불러오고 있음,,, 타인의 대화 기록은 정상적으로 로드"""
-                        self.add_message(
-                            text=f"{msg['sender']}:{msg['message']}",
-                            from_self=is_me,
-                            profile=msg.get("profile"),
-                            timestamp=msg.get("timestamp"), # time 추가
-                            is_system=False
-                        )
-
+                        if msg["id"] in self.message_widgets:
+                            continue    # 이미 그려진 메시지
+                        self.render_history_message(msg)
 
-                        if self.last_read_id is not None and message_id == self.last_read_id:
+                        if self.last_read_id is not None and msg["id"] == self.last_read_id:
                             print(f"👁 구분선 삽입 위치: {i}")
                             self.add_separator()
 
+                    self.apply_read_receipts(packet.get("receipts"))
+
                     # 상태 초기화
                     self.history_loaded = True
-                    self.separator_shown = False
+                    if not incremental:
+                        self.separator_shown = False
+                        #최하단 말고, 구분선 위치로 이동
+                        QTimer.singleShot(1000, self.scroll_to_separator)
                     self.set_loading_state(False)  # ⬅️ 로딩 끝
 
-                    #최하단 말고, 구분선 위치로 이동
-                    QTimer.singleShot(1000, self.scroll_to_separator)
-
-                # 메시지 수신할 때마다 마지막 ID 저장
+                # 이전 메시지 한 페이지 도착 → 맨 위에 순서대로 끼워 넣고 스크롤 위치 유지
+                elif packet.get("type") == "older":
+                    self.prepend_older_messages(packet["messages"], packet.get("has_more", False))
+                    self.apply_read_receipts(packet.get("receipts"))
+                    if packet.get("until_id"):
+                        self.finish_jump(packet.get("too_far", False))
+                    continue
+
+                # 검색 결과 한 페이지
+                elif packet.get("type") == "search_results":
+                    if self.search_window is not None:
+                        self.search_window.show_results(packet)
+                    continue
+
+                # 메시지 수신할 때마다 마지막 ID 저장 (재접속 시 이 ID 이후만 받아옴)
                 # 안전하게 접근하기
-                self.last_received_message_id = packet.get("id", self.last_received_message_id)
+                if isinstance(packet.get("id"), int):
+                    self.note_message_id(packet["id"])
 
         except Exception as e:
             self.add_message(f"❌ 연결 종료: {e}", is_system=True)
 
     """ 오버라이드해서 종료 직전에 읽은 메시지 수를 서버에 전송"""
     def closeEvent(self, event):
+        self.closing = True
+
         async def send_and_exit():
+            self.read_report_timer.stop()
             if self.websocket and self.last_received_message_id:
                 try:
                     await self._safe_send(json.dumps({
                         "type": "update_read_id",
-                        "username": self.username,
                         "message_id": self.last_received_message_id
                     }))
                     print("📤 마지막 읽은 ID 전송 완료")
@@ -612,13 +1037,241 @@ class ChatClient(QWidget):
 
     
     
+    """채팅 화면 관리: 삽입 위치, 히스토리 한 줄 그리기, 이전 메시지 페이지"""
+    def insert_chat_item(self, item):
+        # 평소엔 맨 아래(stretch 앞), 이전 메시지를 불러오는 중이면 맨 위(로딩 라벨 다음)부터 순서대로
+        if self.prepend_at is not None:
+            index = self.prepend_at
+            self.prepend_at += 1
+        else:
+            index = self.chat_layout.count() - 1
+        if isinstance(item, QWidget):
+            self.chat_layout.insertWidget(index, item)
+        else:
+            self.chat_layout.insertLayout(index, item)
+
+    def clear_chat(self):
+        # 로딩 라벨(0)과 맨 끝 stretch 만 남기고 모두 제거
+        while self.chat_layout.count() > 2:
+            self._dispose_layout_item(self.chat_layout.takeAt(1))
+        self.message_widgets.clear()
+        self.pending_sent.clear()
+        self.image_history.clear()
+        self.separator_label = None
+        self.oldest_message_id = None
+        self.has_more_older = True
+
+    def _dispose_layout_item(self, item):
+        if item.widget() is not None:
+            item.widget().deleteLater()
+        elif item.layout() is not None:
+            layout = item.layout()
+            while layout.count():
+                self._dispose_layout_item(layout.takeAt(0))
+            layout.deleteLater()
+
+    def note_message_id(self, message_id):
+        if self.last_received_message_id is None or message_id > self.last_received_message_id:
+            self.last_received_message_id = message_id
+            self.schedule_read_report()
+        if self.oldest_message_id is None or message_id < self.oldest_message_id:
+            self.oldest_message_id = message_id
+
+    def render_history_message(self, msg):
+        message_id = msg["id"]
+        is_me = (msg["sender"] == self.username)
+        file_info = msg.get("file")
+        if file_info:
+            # 첨부파일은 저장소 해시로 다시 받아올 수 있음
+            self.add_file_message(
+                filename=file_info["name"],
+                ext=os.path.splitext(file_info["name"])[1].lower(),
+                file_id=file_info["id"],
+                from_self=is_me,
+                avatar=msg.get("avatar"),
+                sender_name=msg["sender"],
+                message_id=message_id,
+                timestamp=msg.get("timestamp"),
+            )
+        else:
+            """내가 전송한 대화 기록은 잘못 불러오고 있음,,, 타인의 대화 기록은 정상적으로 로드"""
+            self.add_message(
+                text=f"{msg['sender']}:{msg['message']}",
+                from_self=is_me,
+                avatar=msg.get("avatar"),
+                timestamp=msg.get("timestamp"), # time 추가
+                is_system=False,
+                message_id=message_id,
+            )
+        self.note_message_id(message_id)
+
+    def on_scroll_changed(self, value):
+        if value == self.scroll_area.verticalScrollBar().maximum():
+            self.schedule_read_report()
+        if value == 0 and self.history_loaded and self.has_more_older and not self.loading_older \
+                and self.oldest_message_id is not None and self.websocket:
+            self.loading_older = True
+            asyncio.ensure_future(self._safe_send(json.dumps({
+                "type": "load_older",
+                "before_id": self.oldest_message_id,
+                "limit": 50
+            })))
+
+    def schedule_read_report(self):
+        # 창이 활성화되어 있고 맨 아래를 보고 있을 때만 "읽음"으로 취급
+        scroll_bar = self.scroll_area.verticalScrollBar()
+        if self.isActiveWindow() and scroll_bar.value() >= scroll_bar.maximum() - 20:
+            self.read_report_timer.start()     # 이미 대기 중이면 다시 처음부터 (debounce)
+
+    def report_read_position(self):
+        message_id = self.last_received_message_id
+        if not self.websocket or message_id is None:
+            return
+        if self.reported_read_id is not None and message_id <= self.reported_read_id:
+            return
+        self.reported_read_id = message_id
+        asyncio.ensure_future(self._safe_send(json.dumps({
+            "type": "update_read_id",
+            "message_id": message_id
+        })))
+
+    def apply_read_receipts(self, receipts):
+        # {"after": a, "steps": [[upper_id, count], ...]} → a < id ≤ upper_id 인 말풍선에 count 표시
+        if not receipts or not receipts.get("steps"):
+            return
+        after = receipts["after"]
+        steps = receipts["steps"]
+        uppers = [upper for upper, _ in steps]
+        for message_id in self.message_widgets:
+            if message_id <= after or message_id > uppers[-1]:
+                continue
+            self.set_unread_count(message_id, steps[bisect.bisect_left(uppers, message_id)][1])
+
+    def set_unread_count(self, message_id, count):
+        frame = self.message_widgets.get(message_id)
+        label = getattr(frame, "unread_label", None)
+        if label is None:
+            return
+        label.setText(str(count) if count else "")
+        label.setVisible(bool(count))
+
+    def prepend_older_messages(self, messages, has_more):
+        scroll_bar = self.scroll_area.verticalScrollBar()
+        old_max, old_value = scroll_bar.maximum(), scroll_bar.value()
+
+        self.prepend_at = 1     # 로딩 라벨 바로 다음
+        try:
+            for msg in messages:
+                if msg["id"] not in self.message_widgets:
+                    self.render_history_message(msg)
+        finally:
+            self.prepend_at = None
+
+        self.has_more_older = has_more
+        self.loading_older = False
+
+        # 보던 메시지가 그대로 보이도록 늘어난 높이만큼 스크롤 보정
+        QTimer.singleShot(0, lambda: scroll_bar.setValue(scroll_bar.maximum() - old_max + old_value))
+
+    """방(채널)"""
+    def refresh_room_combo(self):
+        self.room_combo.blockSignals(True)
+        self.room_combo.clear()
+        self.room_combo.addItem("💬 방", None)
+        for room in self.joined_rooms:
+            unread = self.room_unread.get(room, 0)
+            self.room_combo.addItem(f"# {room}" + (f" ({unread})" if unread else ""), room)
+        self.room_combo.addItem("＋ 방 참여/만들기", ROOM_JOIN_ITEM)
+        self.room_combo.setCurrentIndex(0)
+        self.room_combo.blockSignals(False)
+
+    def on_room_selected(self, index):
+        room = self.room_combo.itemData(index)
+        self.room_combo.setCurrentIndex(0)
+        if room == ROOM_JOIN_ITEM:
+            name, ok = QInputDialog.getText(self, "방 참여", "방 이름 (없으면 새로 만들어짐)")
+            if ok and name.strip() and self.websocket:
+                asyncio.ensure_future(self._safe_send(json.dumps({"type": "room_join", "room": name.strip()})))
+        elif room:
+            self.open_room(room)
+
+    def open_room(self, room):
+        window = self.room_windows.get(room)
+        if window is None:
+            window = RoomChatWindow(self, room)
+            self.room_windows[room] = window
+            asyncio.ensure_future(self._safe_send(json.dumps({"type": "room_history", "room": room})))
+        self.room_unread.pop(room, None)
+        self.refresh_room_combo()
+        window.show()
+        window.raise_()
+
+    def close_room(self, room):
+        self.room_windows.pop(room, None)
+
+    def on_room_packet(self, packet):
+        room = packet["room"]
+        window = self.room_windows.get(room)
+        if packet.get("type") == "room_history":
+            if window is not None:
+                window.show_history(packet.get("messages", []))
+        elif packet.get("type") == "older":
+            if window is not None:
+                window.prepend_older(packet.get("messages", []), packet.get("has_more", False))
+        elif "sender" in packet:
+            if window is not None:
+                window.append_message(packet)
+            elif packet["sender"] != self.username:
+                # 닫혀 있는 방은 그리지 않고 개수만 표시
+                self.room_unread[room] = self.room_unread.get(room, 0) + 1
+                self.refresh_room_combo()
+
+    """메시지 검색 / 검색 결과로 이동"""
+    def open_search(self):
+        if self.search_window is None:
+            self.search_window = SearchWindow(self)
+        self.search_window.show()
+        self.search_window.raise_()
+        self.search_window.query_input.setFocus()
+
+    def jump_to_message(self, message_id):
+        if message_id in self.message_widgets:
+            self.highlight_message(message_id)
+            return
+        if self.oldest_message_id is None or message_id > self.oldest_message_id or not self.websocket:
+            return
+        # 화면에 없는 예전 메시지 → 그 메시지까지 한 번에 받아서 위에 채워 넣은 뒤 이동
+        self.jump_target = message_id
+        self.loading_older = True
+        asyncio.ensure_future(self._safe_send(json.dumps({
+            "type": "load_older",
+            "before_id": self.oldest_message_id,
+            "until_id": message_id
+        })))
+
+    def finish_jump(self, too_far):
+        target, self.jump_target = self.jump_target, None
+        if too_far:
+            if self.search_window is not None:
+                self.search_window.set_status("⚠️ 너무 오래된 메시지라 채팅방에서 바로 이동할 수 없습니다")
+            return
+        if target in self.message_widgets:
+            self.highlight_message(target)
+
+    def highlight_message(self, message_id):
+        frame = self.message_widgets[message_id]
+        # 레이아웃이 높이를 다시 계산한 뒤에 스크롤
+        QTimer.singleShot(50, lambda: self.scroll_area.ensureWidgetVisible(frame, 0, 100))
+        frame.setStyleSheet("QFrame { background-color: #FFF3C4; border-radius: 10px; }")
+        QTimer.singleShot(2000, lambda: frame.setStyleSheet(""))
+
     """구분선 함수 정의"""
     def add_separator(self):
         print("✅ 구분선 추가됨")
         separator = QLabel("🔽 이후 새 메시지")
         separator.setAlignment(Qt.AlignCenter)
         separator.setStyleSheet("color: #999; font-size: 11px; margin: 8px;")
-        self.chat_layout.insertWidget(self.chat_layout.count() - 1, separator)
+        self.insert_chat_item(separator)
         
         self.separator_label = separator   # 나중에 스크롤 위치 확인용으로 저장
         print("✅ separator_label 설정 완료")
@@ -626,14 +1279,33 @@ class ChatClient(QWidget):
         # 삽입 후 렌더링 완료되면 스크롤 이동
         QTimer.singleShot(2000, self.scroll_to_separator)
 
-    def add_message(self, text, reply_id=None, from_self=False, is_system=False, profile=None, timestamp=None):
+    def format_time(self, timestamp):
         if timestamp:
             try:
-                time_str = datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S").strftime("%H:%M")
+                return datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S").strftime("%H:%M")
             except:
-                time_str = timestamp    # 형식이 맞지 않을 경우 그대로 출력
-        else:
-            time_str = datetime.now().strftime("%H:%M")
+                return timestamp    # 형식이 맞지 않을 경우 그대로 출력
+        return datetime.now().strftime("%H:%M")
+
+    def add_message(self, text, reply_id=None, from_self=False, is_system=False, avatar=None, timestamp=None,
+                    message_id=None, append=False):
+        # 👉 스트리밍 조각(append=True): 기존 말풍선 뒤에 이어 붙이기만 함 (text 는 답변 조각 그대로)
+        if append:
+            bundle = self.message_map.get(reply_id)
+            if bundle is None:
+                return  # 생성 중 말풍선이 없음 (화면을 새로 그린 뒤 등) → 마지막 전체 답변으로 표시됨
+            bubble = bundle["bubble"]
+            if reply_id in self.thinking_timers:
+                # 첫 조각: 깜빡이던 "생성 중" 문구를 지우고 시작
+                self.thinking_timers.pop(reply_id).stop()
+                self.thinking_texts.pop(reply_id, None)
+                bubble.setText("")
+            bubble.setText(bubble.text() + text)
+            if self.prepend_at is None:
+                QTimer.singleShot(10, self.scroll_to_bottom)
+            return bundle["frame"]
+
+        time_str = self.format_time(timestamp)
 
         # 이름: 메시지 형식일 경우, 분리
         if not from_self and not is_system and ":" in text:
@@ -656,6 +1328,7 @@ class ChatClient(QWidget):
             if reply_id in self.thinking_timers:
                 self.thinking_timers[reply_id].stop()
                 del self.thinking_timers[reply_id]
+            self.thinking_texts.pop(reply_id, None)
 
             return  # 업데이트만 하고 말풍선 새로 추가는 하지 않음
 
@@ -684,39 +1357,26 @@ class ChatClient(QWidget):
             layout_name = QVBoxLayout()
             layout_name.setContentsMargins(10, 0, 10, 0)
             layout_name.addWidget(name_label, alignment=Qt.AlignLeft)
-            self.chat_layout.insertLayout(self.chat_layout.count() - 1, layout_name)
+            self.insert_chat_item(layout_name)
+
+        # 안 읽은 사람 수 (0 이면 숨김)
+        unread_label = QLabel()
+        unread_label.setStyleSheet("color: #F5A300; font-size: 10px; font-weight: bold; margin: 1px;")
+        unread_label.hide()
 
         # 말풍선 + 시간 묶기
         bubble_container = QVBoxLayout()
         bubble_container.addWidget(bubble)
+        bubble_container.addWidget(unread_label, alignment=Qt.AlignRight if from_self else Qt.AlignLeft)
         bubble_container.addWidget(time_label, alignment=Qt.AlignRight if from_self else Qt.AlignLeft)
 
         profile_label = QLabel()
         profile_label.setFixedSize(36, 36)
-        if profile:
-            try:
-                # base64 길이 보정
-                missing_padding = len(profile) % 4
-                if missing_padding:
-                    profile += '=' * (4 - missing_padding)
-
-                pixmap = QPixmap()
-                pixmap.loadFromData(base64.b64decode(profile))
-            except Exception as e:
-                print(f"❌ 프로필 이미지 디코딩 실패: {e}")
-                default_path = os.path.join(os.path.dirname(__file__), "images/face.png")
-                pixmap = QPixmap(default_path)
-
-        else:
-            DEFAULT_PROFILE_PATH = os.path.join(os.path.dirname(__file__), "images/face.png")
-            pixmap = QPixmap(DEFAULT_PROFILE_PATH)
-            if pixmap.isNull():
-                print("❌ QPixmap failed to load face.png at", DEFAULT_PROFILE_PATH)
-
-        profile_label.setPixmap(pixmap.scaled(36, 36, Qt.KeepAspectRatio, Qt.SmoothTransformation))
+        self.set_avatar(profile_label, avatar)
 
         # 말풍선 프레임 구성
         bubble_frame = QFrame()
+        bubble_frame.unread_label = unread_label
         layout = QHBoxLayout(bubble_frame)
         layout.setContentsMargins(10, 4, 10, 4)
 
@@ -730,7 +1390,9 @@ class ChatClient(QWidget):
             layout.addStretch()
 
         # 말풍선 추가
-        self.chat_layout.insertWidget(self.chat_layout.count() - 1, bubble_frame)
+        self.insert_chat_item(bubble_frame)
+        if message_id is not None:
+            self.message_widgets[message_id] = bubble_frame
 
         # reply_id가 있으면 해당 말풍선을 기억해 둠 (GPT 응답 시 업데이트용)
         if reply_id:
@@ -741,8 +1403,66 @@ class ChatClient(QWidget):
                 "frame": bubble_frame
             }
             self.start_thinking_animation(reply_id)  # 👈 여기에 애니메이션 시작 호출!
-        # 스크롤 맨 아래로
-        QTimer.singleShot(10, self.scroll_to_bottom)
+        # 스크롤 맨 아래로 (이전 메시지를 위에 끼워 넣는 중에는 제외)
+        if self.prepend_at is None:
+            QTimer.singleShot(10, self.scroll_to_bottom)
+        return bubble_frame
+
+    """아바타: 해시로 캐시(메모리 → 디스크) 조회, 없으면 기본 이미지로 그리고 서버에 1회 요청"""
+    def set_avatar(self, label, avatar_hash):
+        pixmap = self.load_cached_avatar(avatar_hash) if avatar_hash else None
+        if pixmap is None:
+            pixmap = QPixmap(DEFAULT_PROFILE_PATH)
+            if pixmap.isNull():
+                print("❌ QPixmap failed to load face.png at", DEFAULT_PROFILE_PATH)
+            if avatar_hash:
+                self.avatar_waiters.setdefault(avatar_hash, []).append(label)
+                self.request_avatar(avatar_hash)
+        label.setPixmap(pixmap.scaled(36, 36, Qt.KeepAspectRatio, Qt.SmoothTransformation))
+
+    def load_cached_avatar(self, avatar_hash):
+        if avatar_hash in self.avatar_pixmaps:
+            return self.avatar_pixmaps[avatar_hash]
+
+        path = os.path.join(AVATAR_CACHE_DIR, f"{avatar_hash}.png")
+        if os.path.exists(path):
+            pixmap = QPixmap(path)
+            if not pixmap.isNull():
+                self.avatar_pixmaps[avatar_hash] = pixmap
+                return pixmap
+        return None
+
+    def request_avatar(self, avatar_hash):
+        if avatar_hash in self.avatar_requested or not self.websocket:
+            return
+        self.avatar_requested.add(avatar_hash)
+        asyncio.ensure_future(self._safe_send(json.dumps({"type": "avatar_get", "hash": avatar_hash})))
+
+    def on_avatar_received(self, avatar_hash, data_b64):
+        waiters = self.avatar_waiters.pop(avatar_hash, [])
+        if not avatar_hash or not data_b64:
+            return
+        try:
+            raw = base64.b64decode(data_b64)
+            if hashlib.sha256(raw).hexdigest() != avatar_hash:
+                print(f"⚠️ 아바타 해시 불일치: {avatar_hash}")
+                return
+
+            os.makedirs(AVATAR_CACHE_DIR, exist_ok=True)
+            with open(os.path.join(AVATAR_CACHE_DIR, f"{avatar_hash}.png"), "wb") as f:
+                f.write(raw)
+        except Exception as e:
+            print(f"❌ 아바타 캐시 저장 실패: {e}")
+            return
+
+        pixmap = QPixmap()
+        pixmap.loadFromData(raw)
+        self.avatar_pixmaps[avatar_hash] = pixmap
+        for label in waiters:
+            try:
+                label.setPixmap(pixmap.scaled(36, 36, Qt.KeepAspectRatio, Qt.SmoothTransformation))
+            except RuntimeError:
+                pass    # 이미 삭제된 라벨
 
     """깜빡이는 함수 추가"""
     def start_thinking_animation(self, reply_id):
@@ -755,7 +1475,7 @@ class ChatClient(QWidget):
         def update_text():
             self._thinking_dots = (self.thinking_dots + 1) % 4
             dots = "." * self._thinking_dots
-            bubble.setText(f"⏳ 답변을 생성 중입니다{dots}")
+            bubble.setText(self.thinking_texts.get(reply_id, "⏳ 답변을 생성 중입니다") + dots + self.gpt_budget_text)
 
         timer = QTimer(self)
         timer.timeout.connect(update_text)
@@ -764,9 +1484,14 @@ class ChatClient(QWidget):
 
 
 
-    def add_file_message(self, filename, data_b64, ext, from_self=False, profile=None, sender_name=None):
-        time_str = datetime.now().strftime("%H:%M")
-        is_image = ext in [".png", ".jpg", ".jpeg", ".gif"]
+    def add_file_message(self, filename, ext, file_id=None, local_path=None, from_self=False, avatar=None,
+                         sender_name=None, thumb_b64=None, message_id=None, timestamp=None):
+        """
+        파일 말풍선 추가. local_path 가 있으면 바로 표시하고,
+        없으면(받은 파일) 이미지일 때 서버가 만든 썸네일만 표시 (원본은 크게 보기/저장 시 받아옴)
+        """
+        time_str = self.format_time(timestamp)
+        is_image = ext in IMAGE_EXTS
 
         # 이름 라벨 처리 (본인이 보낸 게 아닐 때만, 그리고 sender_name이 존재할 때만)
         if not from_self and sender_name:
@@ -775,56 +1500,69 @@ class ChatClient(QWidget):
             layout_name = QVBoxLayout()
             layout_name.setContentsMargins(10, 0, 10, 0)
             layout_name.addWidget(name_label, alignment=Qt.AlignLeft)
-            self.chat_layout.insertLayout(self.chat_layout.count() - 1, layout_name)
+            self.insert_chat_item(layout_name)
 
         profile_label = QLabel()
         profile_label.setFixedSize(36, 36)
-        if profile:
-            pixmap = QPixmap()
-            pixmap.loadFromData(base64.b64decode(profile))
-        else:
-            default = QPixmap(os.path.join(os.path.dirname(__file__), "images/face.png"))
-            pixmap = default
-        profile_label.setPixmap(pixmap.scaled(36, 36, Qt.KeepAspectRatio, Qt.SmoothTransformation))
+        self.set_avatar(profile_label, avatar)
 
         content_widget = QWidget()
         layout = QVBoxLayout(content_widget)
         layout.setContentsMargins(10, 4, 10, 4)
 
+        handle = {"file_id": file_id, "local_path": local_path}
+
         if is_image:
             image_container = QFrame()
             image_container.setStyleSheet("border: none;")
             image_layout = QVBoxLayout(image_container)
             image_layout.setContentsMargins(0, 0, 0, 0)
 
-            image_label = QLabel()
-            pixmap = QPixmap()
-            pixmap.loadFromData(base64.b64decode(data_b64))
-
-            # 이미지 히스토리에 추가
-            self.image_history.append(pixmap)
-
-            image_label.setPixmap(pixmap.scaledToWidth(180))
+            image_label = QLabel("🖼 이미지 불러오는 중...")
             image_label.setCursor(Qt.PointingHandCursor)
 
-            # 현재 인덱스를 캡쳐해서 넘김
+            # 이미지 히스토리에 추가 (원본은 크게 볼 때 받아옴)
+            handle.update({"ext": ext, "image_label": image_label, "thumb": None, "full": None})
+            self.image_history.append(handle)
             index = len(self.image_history) - 1
             image_label.mousePressEvent = lambda e, idx=index: self.show_full_image(idx)
 
+            if local_path:
+                self.show_local_image(handle, local_path)
+            elif thumb_b64:
+                self.show_thumbnail(handle, base64.b64decode(thumb_b64))
+            elif file_id:
+                asyncio.ensure_future(self.fetch_thumbnail(handle))
+
             image_layout.addWidget(image_label)
             layout.addWidget(image_container)
 
-            file_label = QLabel(f"💾 {filename}")
-            file_label.setStyleSheet("color: blue; text-decoration: underline;")
-            file_label.setCursor(Qt.PointingHandCursor)
-            file_label.mousePressEvent = lambda e: self.save_file(filename, data_b64)
-            layout.addWidget(file_label)
+        file_label = QLabel(f"💾 {filename}")
+        file_label.setStyleSheet("color: blue; text-decoration: underline;")
+        file_label.setCursor(Qt.PointingHandCursor)
+        file_label.mousePressEvent = lambda e: self.save_file(filename, handle)
+        layout.addWidget(file_label)
+
+        # 업로드/다운로드 진행률 (전송 중일 때만 표시)
+        status_label = QLabel()
+        status_label.setStyleSheet("color: gray; font-size: 10px;")
+        status_label.setCursor(Qt.PointingHandCursor)
+        status_label.hide()
+        layout.addWidget(status_label)
+        handle["status"] = status_label
+
+        unread_label = QLabel()
+        unread_label.setStyleSheet("color: #F5A300; font-size: 10px; font-weight: bold;")
+        unread_label.hide()
+        layout.addWidget(unread_label, alignment=Qt.AlignRight if from_self else Qt.AlignLeft)
 
         time_label = QLabel(time_str)
         time_label.setStyleSheet("color: gray; font-size: 10px;")
         layout.addWidget(time_label, alignment=Qt.AlignRight if from_self else Qt.AlignLeft)
 
         bubble_frame = QFrame()
+        bubble_frame.unread_label = unread_label
+        handle["frame"] = bubble_frame
         bubble_layout = QHBoxLayout(bubble_frame)
         bubble_layout.setContentsMargins(10, 4, 10, 4)
 
@@ -837,8 +1575,84 @@ class ChatClient(QWidget):
             bubble_layout.addWidget(content_widget)
             bubble_layout.addStretch()
 
-        self.chat_layout.insertWidget(self.chat_layout.count() - 1, bubble_frame)
-        QTimer.singleShot(10, self.scroll_to_bottom)
+        self.insert_chat_item(bubble_frame)
+        if message_id is not None:
+            self.message_widgets[message_id] = bubble_frame
+        if self.prepend_at is None:
+            QTimer.singleShot(10, self.scroll_to_bottom)
+        return handle
+
+    def show_local_image(self, handle, path):
+        pixmap = QPixmap(path)
+        if pixmap.isNull():
+            handle["image_label"].setText("❌ 이미지를 열 수 없음")
+            return
+        handle["local_path"] = path
+        handle["full"] = pixmap
+        handle["thumb"] = pixmap.scaledToWidth(180)
+        handle["image_label"].setPixmap(handle["thumb"])
+
+    def show_thumbnail(self, handle, data):
+        pixmap = QPixmap()
+        if not pixmap.loadFromData(data):
+            handle["image_label"].setText("🖼 미리보기 없음 (클릭해서 보기)")
+            return
+        handle["thumb"] = pixmap
+        handle["image_label"].setPixmap(pixmap)
+
+    def cached_file_path(self, file_id, ext):
+        os.makedirs(FILE_CACHE_DIR, exist_ok=True)
+        return os.path.join(FILE_CACHE_DIR, f"{file_id}{ext}")
+
+    def cache_legacy_file(self, file_info):
+        """구버전 클라이언트가 base64 로 통째로 보낸 파일은 캐시에 풀어두고 로컬 파일처럼 표시"""
+        if "data" not in file_info:
+            return None
+        ext = os.path.splitext(file_info["name"])[1].lower()
+        path = self.cached_file_path(hashlib.sha256(file_info["data"].encode()).hexdigest(), ext)
+        with open(path, "wb") as f:
+            f.write(base64.b64decode(file_info["data"]))
+        return path
+
+    async def fetch_thumbnail(self, handle):
+        """히스토리 등 썸네일이 실려오지 않은 이미지: 썸네일만 받아서 캐시"""
+        path = self.cached_file_path(handle["file_id"], "_thumb")
+        try:
+            if not os.path.exists(path):
+                data = await self.file_client.fetch_thumbnail(handle["file_id"])
+                with open(path, "wb") as f:
+                    f.write(data)
+            with open(path, "rb") as f:
+                self.show_thumbnail(handle, f.read())
+        except Exception as e:
+            print(f"❌ 썸네일 받기 실패: {e}")
+            handle["image_label"].setText("🖼 미리보기 없음 (클릭해서 보기)")
+
+    async def fetch_full_image(self, handle, on_loaded=None):
+        """크게 보기: 원본을 캐시 폴더로 받은 뒤 표시 (한 번 받으면 재사용)"""
+        if handle.get("full") is not None or handle.get("loading"):
+            return
+        handle["loading"] = True
+        path = self.cached_file_path(handle["file_id"], handle["ext"])
+        try:
+            if not os.path.exists(path):
+                await self.file_client.download(
+                    handle["file_id"], path,
+                    on_progress=lambda done, total: self.set_transfer_status(
+                        handle, f"⬇️ {done * 100 // max(total, 1)}%"),
+                )
+            self.set_transfer_status(handle, "")
+            pixmap = QPixmap(path)
+            if not pixmap.isNull():
+                handle["full"] = pixmap
+                handle["local_path"] = path
+            if on_loaded:
+                on_loaded()
+        except Exception as e:
+            print(f"❌ 이미지 다운로드 실패: {e}")
+            self.set_transfer_status(handle, "❌ 다운로드 실패")
+        finally:
+            handle["loading"] = False
 
     # 이미지 눌렀을 때 크게 해서 미리보기
     def show_full_image(self, index):
@@ -870,9 +1684,21 @@ class ChatClient(QWidget):
                 dialog_self.update_image()
 
             def update_image(dialog_self):
-                pixmap = self.image_history[self.current_image_index]
-                dialog_self.label.setPixmap(pixmap.scaled(
-                    580, 580, Qt.KeepAspectRatio, Qt.SmoothTransformation))
+                index = self.current_image_index
+                entry = self.image_history[index]
+                pixmap = entry.get("full") or entry.get("thumb")
+                if pixmap is not None:
+                    dialog_self.label.setPixmap(pixmap.scaled(
+                        580, 580, Qt.KeepAspectRatio, Qt.SmoothTransformation))
+                else:
+                    dialog_self.label.setText("🖼 불러오는 중...")
+
+                # 원본이 아직 없으면 받아와서, 그 사이 다른 이미지로 넘기지 않았을 때만 다시 그림
+                if entry.get("full") is None and entry.get("file_id"):
+                    asyncio.ensure_future(self.fetch_full_image(
+                        entry,
+                        on_loaded=lambda: dialog_self.isVisible() and self.current_image_index == index
+                                          and dialog_self.update_image()))
 
                 # 인덱스 정보 표시
                 dialog_self.page_label.setText(
@@ -901,7 +1727,7 @@ class ChatClient(QWidget):
         dialog = ImageDialog()
         dialog.exec_()
 
-    def save_file(self, filename, data_b64):
+    def save_file(self, filename, handle):
         save_path, _ = QFileDialog.getSaveFileName(self, "파일 저장", filename)
 
         if not save_path:
@@ -911,28 +1737,84 @@ class ChatClient(QWidget):
         if ext and not save_path.lower().endswith(ext):
             save_path += ext
 
+        # 이미 받아둔 파일이면 복사, 아니면 파일 채널에서 바로 저장 위치로 받기
+        local_path = handle.get("local_path")
+        if local_path and os.path.exists(local_path):
+            try:
+                shutil.copy(local_path, save_path)
+            except Exception as e:
+                print(f"❌ 파일 저장 실패: {e}")
+            return
+
+        if handle.get("file_id"):
+            asyncio.ensure_future(self._download_to(handle, save_path))
+
+    async def _download_to(self, handle, save_path):
+        cancel_event = asyncio.Event()
         try:
-            with open(save_path, "wb") as f:
-                f.write(base64.b64decode(data_b64))
+            await self.file_client.download(
+                handle["file_id"], save_path,
+                on_progress=lambda done, total: self.set_transfer_status(
+                    handle, f"⬇️ {done * 100 // max(total, 1)}% (클릭하면 취소)", cancel_event),
+                cancel_event=cancel_event,
+            )
+            self.set_transfer_status(handle, "✅ 저장 완료")
+        except TransferCancelled:
+            self.set_transfer_status(handle, "⛔ 저장 취소됨")
         except Exception as e:
             print(f"❌ 파일 저장 실패: {e}")
+            self.set_transfer_status(handle, "❌ 저장 실패")
 
     # 서버에서 받은 유저 목록 적용
-    def update_user_list(self, users):
+    # 스냅샷 (접속 직후 / 재동기화) - 목록 전체를 새로 그림
+    def update_user_list(self, users, version=None):
+        self.presence_version = version
+        self.online_users = set(users)
         self.user_list.clear()
-        for user in users:
+        for user in sorted(self.online_users):
+            if user != self.username:
+                self.user_list.addItem(user)
+        self.update_user_list_label()
+
+    # 변화분 - 들어온/나간 사람만 목록에 추가/삭제. 버전이 건너뛰면 스냅샷 재요청
+    def apply_presence_delta(self, packet):
+        version = packet.get("version")
+        if self.presence_version is None or version <= self.presence_version:
+            return      # 스냅샷 전이거나 이미 반영된 변화
+        if version != self.presence_version + 1:
+            self.presence_version = None    # 스냅샷이 올 때까지 delta 무시
+            asyncio.ensure_future(self._safe_send(json.dumps({"type": "presence_sync"})))
+            return
+        self.presence_version = version
+
+        for user in packet.get("left", []):
+            self.online_users.discard(user)
+            for item in self.user_list.findItems(user, Qt.MatchExactly):
+                self.user_list.takeItem(self.user_list.row(item))
+        for user in packet.get("joined", []):
+            if user in self.online_users:
+                continue
+            self.online_users.add(user)
             if user != self.username:
                 self.user_list.addItem(user)
-        self.user_list_label.setText(f"접속 중: {', '.join(users)}")
+        self.user_list.sortItems()
+        self.update_user_list_label()
+
+    def update_user_list_label(self):
+        self.user_list_label.setText(f"접속 중: {', '.join(sorted(self.online_users))}")
 
 
     # 채팅방 개설 함수
     def open_private_chat(self, item):
         partner = item.text()
-        chat_window = PrivateChatWindow(self.username, partner, self.websocket)
-        chat_window.setWindowTitle(f"{self.username} ↔ {partner}")
+        chat_window = self.private_chats.get(partner)
+        if chat_window is None:
+            # 처음 열 때 최근 대화를 서버에서 받아옴 (이후 위로 넘기면 한 페이지씩)
+            chat_window = PrivateChatWindow(self, partner)
+            chat_window.setWindowTitle(f"{self.username} ↔ {partner}")
+            self.private_chats[partner] = chat_window
+            chat_window.request_history()
         chat_window.show()
-        self.private_chats[partner] = chat_window
 
 
     """
@@ -961,20 +1843,25 @@ class ChatClient(QWidget):
             print("⚠️ 구분선이 아직 존재하지 않음!")
     
 class PrivateChatWindow(QDialog):
-    def __init__(self, sender, receiver, websocket):
+    def __init__(self, client, receiver):
         super().__init__()
-        self.sender = sender
+        self.client = client
+        self.sender = client.username
         self.receiver = receiver
-        self.websocket = websocket
+        self.messages = {}  # id → 메시지 (히스토리와 실시간 메시지가 겹쳐도 한 번만 표시)
 
         self.setWindowTitle(f"{self.sender} ↔ {self.receiver}")
         self.resize(400, 300)
 
+        self.older_button = QPushButton("이전 메시지")
+        self.older_button.setEnabled(False)
+        self.older_button.clicked.connect(self.load_older)
         self.chat_area = QTextBrowser()
         self.input = QLineEdit()
         self.send_button = QPushButton("보내기")
 
         layout = QVBoxLayout()  # ✅ 수직 레이아웃 명확히 지정
+        layout.addWidget(self.older_button)
         layout.addWidget(self.chat_area)
         layout.addWidget(self.input)
         layout.addWidget(self.send_button)
@@ -985,19 +1872,241 @@ class PrivateChatWindow(QDialog):
 
     def send_private_message(self):
         msg = self.input.text().strip()
-        if msg:
+        if msg and self.client.websocket:
             packet = {
                 "type": "private_room",
                 "sender": self.sender,
                 "receiver": self.receiver,
                 "message": msg
             }
-            asyncio.create_task(self.websocket.send(json.dumps(packet)))
+            asyncio.ensure_future(self.client._paced_send("text", json.dumps(packet)))
             #self.chat_area.append(f"나: {msg}")
             self.input.clear()
 
-    def receive_message(self, sender, message):  # ✅ 메서드명 수정 (recieve → receive)
-        self.chat_area.append(f"{sender}: {message}")
+    def request_history(self, before_id=None):
+        if self.client.websocket:
+            asyncio.ensure_future(self.client._safe_send(json.dumps({
+                "type": "private_history", "partner": self.receiver, "before_id": before_id, "limit": 50
+            })))
+
+    def load_older(self):
+        if self.messages:
+            self.older_button.setEnabled(False)
+            self.request_history(min(self.messages))
+
+    def add_messages(self, messages, has_more=None):
+        """실시간 메시지 / 히스토리 페이지 모두 여기로 - id 순으로 다시 그림"""
+        added = False
+        for msg in messages:
+            if isinstance(msg.get("id"), int) and msg["id"] not in self.messages:
+                self.messages[msg["id"]] = msg
+                added = True
+        if has_more is not None:
+            self.older_button.setEnabled(bool(has_more))
+        if added:
+            self.render()
+
+    def render(self):
+        scroll_bar = self.chat_area.verticalScrollBar()
+        at_bottom = scroll_bar.value() >= scroll_bar.maximum() - 4
+        lines = []
+        for message_id in sorted(self.messages):
+            msg = self.messages[message_id]
+            timestamp = msg.get("timestamp", "")[11:16]
+            lines.append((f"[{timestamp}] " if timestamp else "") + f"{msg['sender']}: {msg['message']}")
+        self.chat_area.setPlainText("\n".join(lines))
+        if at_bottom:
+            scroll_bar.setValue(scroll_bar.maximum())
+
+
+class RoomChatWindow(QDialog):
+    """방 하나의 대화 창 - 열려 있는 동안만 그 방 메시지를 그림"""
+
+    def __init__(self, client, room):
+        super().__init__()
+        self.client = client
+        self.room = room
+        self.oldest_id = None
+
+        self.setWindowTitle(f"# {room}")
+        self.resize(420, 420)
+
+        self.older_button = QPushButton("이전 메시지")
+        self.older_button.clicked.connect(self.load_older)
+        self.chat_area = QTextBrowser()
+        self.input = QLineEdit()
+        self.send_button = QPushButton("보내기")
+        self.leave_button = QPushButton("방 나가기")
+
+        buttons = QHBoxLayout()
+        buttons.addWidget(self.send_button)
+        buttons.addWidget(self.leave_button)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.older_button)
+        layout.addWidget(self.chat_area)
+        layout.addWidget(self.input)
+        layout.addLayout(buttons)
+        self.setLayout(layout)
+
+        self.send_button.clicked.connect(self.send_room_message)
+        self.input.returnPressed.connect(self.send_room_message)
+        self.leave_button.clicked.connect(self.leave_room)
+
+    @staticmethod
+    def format_message(msg):
+        text = msg.get("message", "")
+        if msg.get("file"):
+            text = f"📎 {msg['file'].get('name')}" + (f" {text}" if text else "")
+        timestamp = msg.get("timestamp", "")[11:16]
+        return (f"[{timestamp}] " if timestamp else "") + f"{msg.get('sender')}: {text}"
+
+    def show_history(self, messages):
+        self.chat_area.clear()
+        for msg in messages:
+            self.chat_area.append(self.format_message(msg))
+        self.oldest_id = messages[0]["id"] if messages else None
+
+    def prepend_older(self, messages, has_more):
+        if messages:
+            current = self.chat_area.toPlainText()
+            lines = "\n".join(self.format_message(m) for m in messages)
+            self.chat_area.setPlainText(lines + ("\n" + current if current else ""))
+            self.oldest_id = messages[0]["id"]
+        self.older_button.setEnabled(has_more)
+
+    def append_message(self, packet):
+        self.chat_area.append(self.format_message(packet))
+        if self.oldest_id is None and isinstance(packet.get("id"), int):
+            self.oldest_id = packet["id"]
+
+    def load_older(self):
+        if self.oldest_id is None or not self.client.websocket:
+            return
+        asyncio.ensure_future(self.client._safe_send(json.dumps({
+            "type": "load_older", "room": self.room, "before_id": self.oldest_id, "limit": 50
+        })))
+
+    def send_room_message(self):
+        msg = self.input.text().strip()
+        if msg and self.client.websocket:
+            asyncio.ensure_future(self.client._paced_send("text", json.dumps({
+                "sender": self.client.username,
+                "message": msg,
+                "avatar": self.client.avatar_hash,
+                "room": self.room
+            })))
+            self.input.clear()
+
+    def leave_room(self):
+        if self.client.websocket:
+            asyncio.ensure_future(self.client._safe_send(json.dumps({"type": "room_leave", "room": self.room})))
+        self.close()
+
+    def closeEvent(self, event):
+        self.client.close_room(self.room)
+        super().closeEvent(event)
+
+
+class SearchWindow(QDialog):
+    """채팅 기록 검색 창 - 결과를 더블클릭하면 채팅방에서 해당 메시지로 이동"""
+    PAGE_SIZE = 20
+
+    def __init__(self, chat_client):
+        super().__init__(chat_client)
+        self.chat_client = chat_client
+        self.query = None
+        self.page = 0
+
+        self.setWindowTitle("🔍 메시지 검색")
+        self.resize(380, 460)
+
+        self.query_input = QLineEdit()
+        self.query_input.setPlaceholderText("검색어 (3글자 이상이면 전체 기간 검색)")
+        self.sender_input = QLineEdit()
+        self.sender_input.setPlaceholderText("보낸 사람 (선택)")
+        self.date_from_input = QLineEdit()
+        self.date_from_input.setPlaceholderText("시작일 YYYY-MM-DD")
+        self.date_to_input = QLineEdit()
+        self.date_to_input.setPlaceholderText("종료일 YYYY-MM-DD")
+        self.search_button = QPushButton("검색")
+        self.archive_check = QCheckBox("보관된 오래된 메시지에서 검색")
+        self.results_list = QListWidget()
+        self.more_button = QPushButton("더 보기")
+        self.more_button.hide()
+        self.status_label = QLabel("")
+        self.status_label.setStyleSheet("color: gray; font-size: 11px;")
+
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(self.sender_input)
+        filter_layout.addWidget(self.date_from_input)
+        filter_layout.addWidget(self.date_to_input)
+
+        query_layout = QHBoxLayout()
+        query_layout.addWidget(self.query_input)
+        query_layout.addWidget(self.search_button)
+
+        layout = QVBoxLayout()
+        layout.addLayout(query_layout)
+        layout.addLayout(filter_layout)
+        layout.addWidget(self.archive_check)
+        layout.addWidget(self.results_list)
+        layout.addWidget(self.more_button)
+        layout.addWidget(self.status_label)
+        self.setLayout(layout)
+
+        self.search_button.clicked.connect(self.start_search)
+        self.query_input.returnPressed.connect(self.start_search)
+        self.more_button.clicked.connect(lambda: self.request_page(self.page + 1))
+        self.results_list.itemDoubleClicked.connect(self.on_result_activated)
+
+    def start_search(self):
+        text = self.query_input.text().strip()
+        if not text:
+            return
+        self.query = text
+        self.results_list.clear()
+        self.request_page(0)
+
+    def request_page(self, page):
+        if not self.chat_client.websocket or not self.query:
+            return
+        self.set_status("검색 중...")
+        self.more_button.setEnabled(False)
+        asyncio.ensure_future(self.chat_client._safe_send(json.dumps({
+            "type": "search",
+            "query": self.query,
+            "sender": self.sender_input.text().strip() or None,
+            "date_from": self.date_from_input.text().strip() or None,
+            "date_to": self.date_to_input.text().strip() or None,
+            "page": page,
+            "page_size": self.PAGE_SIZE,
+            "archive": self.archive_check.isChecked()
+        })))
+
+    def show_results(self, packet):
+        if packet.get("query") != self.query:
+            return      # 이전 검색어의 늦은 응답
+        self.page = packet.get("page", 0)
+        for result in packet.get("results", []):
+            item = QListWidgetItem(f"[{result['timestamp']}] {result['sender']}\n{result['snippet']}")
+            # 보관된 메시지는 채팅방에 다시 불러올 수 없으므로 목록에서만 보여줌
+            item.setData(Qt.UserRole, None if packet.get("archive") else result["id"])
+            self.results_list.addItem(item)
+        self.more_button.setVisible(packet.get("has_more", False))
+        self.more_button.setEnabled(True)
+        self.set_status(f"검색 결과 {self.results_list.count()}건" if self.results_list.count() else "검색 결과 없음")
+
+    def on_result_activated(self, item):
+        message_id = item.data(Qt.UserRole)
+        if message_id is None:
+            self.set_status("보관된 메시지는 채팅방으로 이동할 수 없습니다")
+            return
+        self.set_status("")
+        self.chat_client.jump_to_message(message_id)
+
+    def set_status(self, text):
+        self.status_label.setText(text)
 
 
 def main():
@@ -1,54 +1,529 @@
 # database.py
+import asyncio
+import os
+from collections import deque
+from contextlib import asynccontextmanager
+from time import perf_counter
 from typing import Optional
 
 import aiosqlite
-from datetime import datetime, date
+import sqlite3
+from datetime import datetime, date, time, timedelta
 
 # SQLite 파일 경로
 DB_PATH = "chat_log.db"
+# 모든 사용자가 자동으로 속한 기본 방 (rooms 이전의 메시지도 모두 이 방)
+LOBBY_ROOM = "lobby"
+
+# 읽기 전용 연결 개수 (쓰기 연결은 항상 1개)
+READER_COUNT = 3
+
+
+class ConnectionManager:
+    """
+    서버 수명 동안 유지되는 SQLite 연결 관리자
+    - 쓰기 연결 1개 (asyncio.Lock 으로 한 번에 한 트랜잭션만)
+    - 읽기 연결 풀 (WAL 모드라 읽기가 쓰기를 막지 않음)
+    - 연결마다 스레드 1개가 계속 유지되고, sqlite3 의 prepared statement 캐시도 재사용됨
+    """
+
+    def __init__(self, path: str, readers: int = READER_COUNT):
+        self.path = path
+        self.reader_count = readers
+        self.writer: Optional[aiosqlite.Connection] = None
+        self._readers: Optional[asyncio.Queue] = None
+        self._all_readers = []
+        self._write_lock = asyncio.Lock()
+        self._open_lock = asyncio.Lock()
+
+    async def _connect(self) -> aiosqlite.Connection:
+        db = await aiosqlite.connect(self.path, cached_statements=256)
+        # 새 DB 파일은 처음부터 증분 VACUUM 모드 (기존 파일에는 효과 없음 → maintenance.convert_auto_vacuum)
+        await db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        await db.execute("PRAGMA journal_mode=WAL")
+        await db.execute("PRAGMA synchronous=NORMAL")       # WAL 에서는 NORMAL 이어도 DB 가 깨지지 않음
+        await db.execute("PRAGMA cache_size=-16000")        # 16MB 페이지 캐시
+        await db.execute("PRAGMA mmap_size=268435456")      # 256MB 메모리 맵
+        await db.execute("PRAGMA temp_store=MEMORY")
+        await db.execute("PRAGMA busy_timeout=5000")
+        return db
+
+    async def open(self):
+        async with self._open_lock:
+            if self.writer is not None:
+                return
+            self.writer = await self._connect()
+            self._readers = asyncio.Queue()
+            for _ in range(self.reader_count):
+                reader = await self._connect()
+                self._all_readers.append(reader)
+                self._readers.put_nowait(reader)
+            print(f"✅ DB 연결 준비 완료 (쓰기 1 + 읽기 {self.reader_count}, WAL)")
+
+    async def close(self):
+        async with self._open_lock:
+            if self.writer is None:
+                return
+            for reader in self._all_readers:
+                await reader.close()
+            self._all_readers.clear()
+            self._readers = None
+            await self.writer.close()
+            self.writer = None
+            print("✅ DB 연결 종료")
+
+    @asynccontextmanager
+    async def read(self):
+        if self.writer is None:
+            await self.open()
+        db = await self._readers.get()
+        try:
+            yield db
+        finally:
+            self._readers.put_nowait(db)
+
+    @asynccontextmanager
+    async def write(self):
+        """쓰기 연결 (호출하는 쪽에서 commit). 블록이 끝날 때까지 다른 쓰기는 대기"""
+        if self.writer is None:
+            await self.open()
+        async with self._write_lock:
+            try:
+                yield self.writer
+            except Exception:
+                await self.writer.rollback()
+                raise
+
+
+pool = ConnectionManager(DB_PATH)
+
+
+# ---------------------------------------------------------------------------
+# 메시지 저장 묶음 커밋 (write-behind)
+# save_message 는 큐에 넣고 future 로 message_id 만 기다림. 쓰기 task 하나가 몇 ms 동안 모인
+# 메시지를 트랜잭션 하나로 INSERT → commit 1번 (공지에 40명이 동시에 답장해도 디스크 sync 는 몇 번뿐)
+#
+# DANI_DB_DURABILITY (환경변수)
+#   strict  : synchronous=FULL, commit 이 디스크에 반영된 뒤에 message_id 반환
+#   normal  : synchronous=NORMAL(WAL), commit 후 message_id 반환 (기본값, 정전 시 마지막 묶음 유실 가능)
+#   relaxed : INSERT 직후 바로 message_id 반환, commit 은 묶음 끝에서 (서버가 죽으면 마지막 묶음 유실 가능)
+# ---------------------------------------------------------------------------
+DURABILITY_MODES = ("strict", "normal", "relaxed")
+DURABILITY = os.getenv("DANI_DB_DURABILITY", "normal").lower()
+BATCH_INTERVAL = 0.005      # 첫 메시지 이후 묶음을 모으는 최대 시간 (초)
+BATCH_MAX_ROWS = 200        # 묶음 하나의 최대 행 수
+BATCH_SAMPLES = 1024        # 통계용 샘플 개수
+
+# 쓰기 task 종료 신호
+_STOP = object()
+
+
+class MessageWriter:
+    """messages INSERT 를 모아서 한 트랜잭션으로 커밋하는 단일 쓰기 task"""
+
+    def __init__(self, durability: str = DURABILITY, interval: float = BATCH_INTERVAL,
+                 max_rows: int = BATCH_MAX_ROWS):
+        if durability not in DURABILITY_MODES:
+            print(f"⚠️ 알 수 없는 DANI_DB_DURABILITY={durability}, normal 로 동작")
+            durability = "normal"
+        self.durability = durability
+        self.interval = interval
+        self.max_rows = max_rows
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+        self.rows = 0
+        self.batches = 0
+        self.failed = 0
+        self.last_write = 0.0       # 마지막 커밋 시각 (perf_counter, maintenance.py 의 한가함 판단용)
+        self.batch_sizes = deque(maxlen=BATCH_SAMPLES)
+        self.commit_latencies = deque(maxlen=BATCH_SAMPLES)
+
+    def start(self):
+        if self.task is None:
+            self.queue = asyncio.Queue()
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """남은 메시지를 모두 커밋한 뒤 종료"""
+        if self.task is None:
+            return
+        self.queue.put_nowait(_STOP)
+        await self.task
+        self.task = None
+
+    async def submit(self, row: tuple) -> int:
+        if self.task is None:
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((row, future))
+        return await future
+
+    async def _collect(self, first) -> tuple:
+        """첫 항목 이후 interval 동안(또는 max_rows 까지) 들어온 항목을 모음"""
+        batch = [first]
+        deadline = perf_counter() + self.interval
+        while len(batch) < self.max_rows:
+            remaining = deadline - perf_counter()
+            try:
+                item = self.queue.get_nowait() if remaining <= 0 else \
+                    await asyncio.wait_for(self.queue.get(), remaining)
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _run(self):
+        if self.durability == "strict":
+            async with pool.write() as db:
+                await db.execute("PRAGMA synchronous=FULL")
+        stopping = False
+        while not stopping:
+            first = await self.queue.get()
+            if first is _STOP:
+                break
+            batch, stopping = await self._collect(first)
+            await self._commit(batch)
+
+    async def _commit(self, batch):
+        started = perf_counter()
+        saved = []      # (future, message_id)
+        try:
+            async with pool.write() as db:
+                for row, future in batch:
+                    # 잘못된 행 하나(바인딩할 수 없는 값 등)는 그 메시지만 실패시킴
+                    # SQLite 는 실패한 문장만 되돌리고 트랜잭션은 유지하므로 같은 묶음의 다른 메시지는 그대로 커밋
+                    try:
+                        cursor = await db.execute("""
+                            INSERT INTO messages (sender, message, timestamp, ts, avatar, attachment, room)
+                            VALUES (?, ?, ?, ?, ?, ?, ?)
+                        """, row)
+                    except (sqlite3.Error, ValueError, OverflowError) as e:
+                        self.failed += 1
+                        print(f"⚠️ 메시지 저장 실패 (1건, 묶음의 나머지는 저장): {e}")
+                        if not future.done():
+                            future.set_exception(e)
+                        continue
+                    saved.append((future, cursor.lastrowid))
+                    if self.durability == "relaxed" and not future.done():
+                        future.set_result(cursor.lastrowid)
+                await db.commit()
+        except Exception as e:
+            pending = [future for _, future in batch if not future.done()]
+            self.failed += len(pending)
+            print(f"⚠️ 메시지 묶음 저장 실패 ({len(pending)}건): {e}")
+            for future in pending:
+                future.set_exception(e)
+            return
+
+        for future, message_id in saved:
+            if not future.done():
+                future.set_result(message_id)
+
+        self.rows += len(saved)
+        self.batches += 1
+        self.last_write = perf_counter()
+        self.batch_sizes.append(len(batch))
+        self.commit_latencies.append(perf_counter() - started)
+
+    def stats(self) -> dict:
+        sizes = sorted(self.batch_sizes)
+        latencies = sorted(self.commit_latencies)
+
+        def pct(samples, p):
+            if not samples:
+                return 0
+            return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+        return {
+            "durability": self.durability,
+            "rows": self.rows,
+            "batches": self.batches,
+            "failed": self.failed,
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "batch_size_avg": round(sum(sizes) / len(sizes), 2) if sizes else 0,
+            "batch_size_max": sizes[-1] if sizes else 0,
+            "commit_ms_p50": round(pct(latencies, 0.50) * 1000, 3),
+            "commit_ms_p99": round(pct(latencies, 0.99) * 1000, 3),
+        }
+
+
+message_writer = MessageWriter()
+
+
+async def close_db():
+    await message_writer.stop()
+    await pool.close()
 
 # DB 초기화 함수 (서버 시작 시 1회 실행)
-# 메시지 저장용 테이블이 없을 경우 생성
+# schema_version 테이블에 기록된 버전 이후의 마이그레이션만 순서대로 적용
 async def init_db():
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with pool.write() as db:
         await db.execute("""
-            CREATE TABLE IF NOT EXISTS messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,   -- 메시지 고유 ID
-                sender TEXT NOT NULL,
-                message TEXT NOT NULL,
-                timestamp TEXT NOT NULL -- ISO 8601 형식(yyyy-mm--ddTHH:MM:SS)
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TEXT NOT NULL
             )
         """)
-        await add_created_at_column()
         await db.commit()
 
+        async with db.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version") as cursor:
+            current = (await cursor.fetchone())[0]
 
-# 메시지 저장 함수( 채팅 시마다 호출)
-# sender와 message를 DB에 삽입, timestamp는 현재 시간 자동 생성, 새로 삽입된 ID 반환
-async def save_message(sender: str, message: str) -> int:
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    async with aiosqlite.connect(DB_PATH) as db:
-        cursor = await db.execute("""
-            INSERT INTO messages (sender, message, timestamp)
-            VALUES (?, ?, ?)
-        """, (sender, message, timestamp))
-        await db.commit()
-        return cursor.lastrowid # <- 삽입된 행의 ID 반환, timestamp 함께 반환
+        for version, description, migrate in MIGRATIONS:
+            if version <= current:
+                continue
+            # 마이그레이션 하나 = 트랜잭션 하나 (실패하면 해당 버전 전체 롤백)
+            # 워커 여러 개가 동시에 시작해도 IMMEDIATE 로 한 프로세스씩, 잠금을 잡은 뒤 다시 확인
+            await db.execute("BEGIN IMMEDIATE")
+            async with db.execute("SELECT 1 FROM schema_version WHERE version = ?", (version,)) as cursor:
+                applied = await cursor.fetchone() is not None
+            if applied:
+                await db.rollback()
+                continue
+            try:
+                await migrate(db)
+                await db.execute(
+                    "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                    (version, description, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+            print(f"✅ DB 마이그레이션 {version} 적용: {description}")
 
-# 읽은 메시지 위치를 저장할 테이블 생성
-async def init_read_state():
-    async with aiosqlite.connect(DB_PATH) as db:
+
+# 컬럼이 없을 때만 추가 (이미 있으면 아무 것도 하지 않음)
+async def ensure_column(db, table: str, column: str, decl: str) -> bool:
+    async with db.execute(f"PRAGMA table_info({table})") as cursor:
+        columns = [row[1] for row in await cursor.fetchall()]
+    if column not in columns:
+        await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+        return True
+    return False
+
+
+# ---------------------------------------------------------------------------
+# 마이그레이션 목록 - 새 스키마 변경은 항상 맨 뒤에 다음 번호로 추가 (기존 항목은 수정하지 않음)
+# 버전 관리 이전에 만들어진 DB 에도 안전하게 적용되도록 IF NOT EXISTS / ensure_column 사용
+# ---------------------------------------------------------------------------
+async def _migrate_base_tables(db):
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,   -- 메시지 고유 ID
+            sender TEXT NOT NULL,
+            message TEXT NOT NULL,
+            timestamp TEXT NOT NULL -- ISO 8601 형식(yyyy-mm--ddTHH:MM:SS)
+        )
+    """)
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS read_state (
+            username TEXT PRIMARY KEY,
+            last_read_id INTEGER -- 마지막 읽은 메시지의 ID 저장
+        )
+    """)
+
+
+async def _migrate_created_at(db):
+    # 예전 add_created_at_column() 이 하던 일 (view_logs.py 가 사용)
+    if await ensure_column(db, "messages", "created_at", "TEXT"):
+        await db.execute("UPDATE messages SET created_at = datetime('now') WHERE created_at IS NULL")
+
+
+async def _migrate_avatars(db):
+    await ensure_column(db, "messages", "avatar", "TEXT")  # 보낸 사람 아바타 해시
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS avatars (
+            hash TEXT PRIMARY KEY,      -- sha256(이미지 바이트)
+            data BLOB NOT NULL,         -- PNG 원본 바이트
+            created_at TEXT NOT NULL
+        )
+    """)
+
+
+async def _migrate_attachments(db):
+    await ensure_column(db, "messages", "attachment", "TEXT")  # 첨부파일 해시 (attachment_store)
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS attachments (
+            hash TEXT PRIMARY KEY,      -- sha256(파일 바이트)
+            name TEXT NOT NULL,         -- 처음 올라온 파일 이름
+            type TEXT NOT NULL,         -- 확장자 (.png 등)
+            size INTEGER NOT NULL,
+            owner TEXT NOT NULL,        -- 처음 올린 사용자
+            created_at TEXT NOT NULL
+        )
+    """)
+
+
+async def _migrate_epoch_timestamps(db):
+    # TEXT timestamp(로컬 시간) → 정수 epoch 초. DATE(timestamp) 처럼 함수를 씌우지 않고 범위로 조회하기 위함
+    await ensure_column(db, "messages", "ts", "INTEGER")
+    await db.execute("""
+        UPDATE messages SET ts = CAST(strftime('%s', timestamp, 'utc') AS INTEGER)
+        WHERE ts IS NULL
+    """)
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_messages_ts ON messages (ts)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_messages_sender_id ON messages (sender, id)")
+
+
+async def _migrate_fts(db):
+    # 메시지 전문 검색 색인 (external content: 본문은 messages 에만 저장, 색인만 따로)
+    # trigram 은 띄어쓰기 없는 한국어도 부분 문자열로 찾을 수 있음 (SQLite 3.34+, 없으면 단어 단위 unicode61)
+    try:
         await db.execute("""
-            CREATE TABLE IF NOT EXISTS read_state (
-                username TEXT PRIMARY KEY,
-                last_read_id INTEGER -- 마지막 읽은 메시지의 ID 저장
-            )
+            CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts
+            USING fts5(message, content='messages', content_rowid='id', tokenize='trigram')
         """)
-        await db.commit()
+    except sqlite3.OperationalError:
+        await db.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts
+            USING fts5(message, content='messages', content_rowid='id', tokenize='unicode61')
+        """)
+    # 쓰기 경로와 상관없이 항상 같이 갱신되도록 트리거로 동기화
+    await db.execute("""
+        CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, message) VALUES (new.id, new.message);
+        END
+    """)
+    await db.execute("""
+        CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, message) VALUES ('delete', old.id, old.message);
+        END
+    """)
+    await db.execute("""
+        CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF message ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, message) VALUES ('delete', old.id, old.message);
+            INSERT INTO messages_fts (rowid, message) VALUES (new.id, new.message);
+        END
+    """)
+    await db.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")     # 기존 메시지 색인
+
+
+async def _migrate_rooms(db):
+    # 방(채널): 기존 메시지는 모두 lobby. 방별 조회는 (room, id) / (room, ts) 인덱스 범위 스캔
+    await ensure_column(db, "messages", "room", f"TEXT NOT NULL DEFAULT '{LOBBY_ROOM}'")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_messages_room_id ON messages (room, id)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_messages_room_ts ON messages (room, ts)")
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS rooms (
+            name TEXT PRIMARY KEY,
+            created_by TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        )
+    """)
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS room_members (
+            room TEXT NOT NULL,
+            username TEXT NOT NULL,
+            joined_at TEXT NOT NULL,
+            PRIMARY KEY (room, username)
+        )
+    """)
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_room_members_username ON room_members (username)")
+
+
+async def _migrate_private_messages(db):
+    # 1:1 대화 저장 - conv_key 는 두 사람 이름을 정렬해서 붙인 값 (conversation_key)
+    # (conv_key, id) 인덱스로 대화 하나의 최근 페이지를 바로 찾고, 받는 사람이 없을 때 쌓인 메시지는 부분 인덱스로 찾음
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS private_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            conv_key TEXT NOT NULL,
+            sender TEXT NOT NULL,
+            receiver TEXT NOT NULL,
+            message TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            delivered INTEGER NOT NULL DEFAULT 0    -- 받는 사람 연결에 전달했으면 1
+        )
+    """)
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_private_conv_id ON private_messages (conv_key, id)")
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_private_undelivered ON private_messages (receiver, id)
+        WHERE delivered = 0
+    """)
+
+
+async def _migrate_gpt_cache(db):
+    # GPT 답변 캐시 (gpt_cache.py) - key 는 정규화한 질문 + 모델 + system 프롬프트의 해시
+    # created_at 으로 TTL, last_used 로 LRU 정리 (둘 다 epoch 초)
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS gpt_cache (
+            key TEXT PRIMARY KEY,
+            prompt TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            model TEXT NOT NULL,
+            created_at INTEGER NOT NULL,
+            last_used INTEGER NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_gpt_cache_last_used ON gpt_cache (last_used)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_gpt_cache_created_at ON gpt_cache (created_at)")
+
+
+async def _migrate_gpt_usage(db):
+    # GPT 사용량 원장 (gpt_usage.py) - 호출 1번 = 1행, API 가 돌려준 실제 usage 토큰 (없으면 추정, estimated = 1)
+    # 사용자/월 합계는 gpt_usage_monthly 에 같은 트랜잭션으로 누적 → 예산 확인은 기본키 조회 한 번
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS gpt_usage (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL,
+            month TEXT NOT NULL,                -- YYYY-MM
+            ts INTEGER NOT NULL,
+            model TEXT NOT NULL,
+            prompt_tokens INTEGER NOT NULL,
+            completion_tokens INTEGER NOT NULL,
+            cost REAL NOT NULL,                 -- USD
+            estimated INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_gpt_usage_user_ts ON gpt_usage (username, ts)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_gpt_usage_month ON gpt_usage (month)")
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS gpt_usage_monthly (
+            month TEXT NOT NULL,
+            username TEXT NOT NULL,
+            requests INTEGER NOT NULL DEFAULT 0,
+            prompt_tokens INTEGER NOT NULL DEFAULT 0,
+            completion_tokens INTEGER NOT NULL DEFAULT 0,
+            cost REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (month, username)
+        )
+    """)
+
+
+MIGRATIONS = [
+    (1, "messages / read_state 기본 테이블", _migrate_base_tables),
+    (2, "messages.created_at", _migrate_created_at),
+    (3, "아바타 저장소 (messages.avatar, avatars)", _migrate_avatars),
+    (4, "첨부파일 저장소 (messages.attachment, attachments)", _migrate_attachments),
+    (5, "정수 epoch 시간 messages.ts + (ts), (sender, id) 인덱스", _migrate_epoch_timestamps),
+    (6, "전문 검색 색인 messages_fts (FTS5)", _migrate_fts),
+    (7, "방(rooms, room_members) + messages.room", _migrate_rooms),
+    (8, "1:1 대화 저장 private_messages + (conv_key, id) 인덱스", _migrate_private_messages),
+    (9, "GPT 답변 캐시 gpt_cache", _migrate_gpt_cache),
+    (10, "GPT 사용량 원장 gpt_usage + 사용자/월 합계 gpt_usage_monthly", _migrate_gpt_usage),
+]
+
+
+# 메시지 저장 함수( 채팅 시마다 호출)
+# sender와 message를 DB에 삽입, timestamp는 현재 시간 자동 생성, 새로 삽입된 ID 반환
+# avatar 는 avatar_store 의 해시 (base64 이미지 자체는 저장하지 않음), attachment 는 첨부파일 해시
+# 실제 INSERT/commit 은 message_writer 가 다른 메시지들과 묶어서 처리
+async def save_message(sender: str, message: str, avatar: Optional[str] = None,
+                       attachment: Optional[str] = None, now: Optional[datetime] = None,
+                       room: str = LOBBY_ROOM) -> int:
+    now = now or datetime.now()
+    timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
+    return await message_writer.submit(
+        (sender, message, timestamp, int(now.timestamp()), avatar, attachment, room))
 
 # 읽은 메시지 수 저장
 async def save_read_count(username: str, count: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with pool.write() as db:
         await db.execute("""
             INSERT INTO read_state (username, count)
             VALUES (?, ?)
@@ -69,58 +544,300 @@ async def load_read_count(username: str) -> int:
 """
 # 마지막 읽은 ID 불러오기
 async def load_last_read_id(username: str) -> Optional[int]:
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with pool.read() as db:
         async with db.execute("SELECT last_read_id FROM read_state WHERE username = ?", (username,)) as cursor:
             row = await cursor.fetchone()
             return row[0] if row else None
 
+# 전체 사용자의 마지막 읽은 ID (읽음 표시 초기화용)
+async def load_all_last_read_ids() -> dict:
+    async with pool.read() as db:
+        async with db.execute("SELECT username, last_read_id FROM read_state") as cursor:
+            return {row[0]: row[1] or 0 for row in await cursor.fetchall()}
+
+# 가장 최근 메시지 ID
+async def load_latest_message_id(room: Optional[str] = None) -> int:
+    # room 을 주면 그 방의 최신 ID ((room, id) 인덱스)
+    sql, params = "SELECT COALESCE(MAX(id), 0) FROM messages", ()
+    if room is not None:
+        sql, params = sql + " WHERE room = ?", (room,)
+    async with pool.read() as db:
+        async with db.execute(sql, params) as cursor:
+            return (await cursor.fetchone())[0]
+
 # 마지막 읽은 ID 저장하기
 async def save_last_read_id(username: str, message_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("""
+    await save_last_read_ids([(username, message_id)])
+
+# 여러 사용자의 마지막 읽은 ID 를 한 트랜잭션으로 저장 (read_state.py 가 주기적으로 호출)
+# 이미 저장된 값보다 작은 ID 로는 되돌리지 않음
+async def save_last_read_ids(positions):
+    async with pool.write() as db:
+        await db.executemany("""
             INSERT INTO read_state (username, last_read_id)
             VALUES (?, ?)
-            ON CONFLICT(username) DO UPDATE SET last_read_id = excluded.last_read_id
-        """, (username, message_id))
+            ON CONFLICT(username) DO UPDATE
+            SET last_read_id = MAX(COALESCE(last_read_id, 0), excluded.last_read_id)
+        """, list(positions))
         await db.commit()
 
 
 
 
+# 메시지 조회 공통 SELECT (첨부파일 정보 포함)
+MESSAGE_SELECT = """
+    SELECT m.id, m.sender, m.message, m.timestamp, m.avatar, a.hash, a.name, a.type, a.size, m.room
+    FROM messages m LEFT JOIN attachments a ON a.hash = m.attachment
+"""
+
+
 # 오늘 날짜의 메시지 불러오가ㅣ
 # 서버에서 클라이언트가 접속하면 오늘 채팅 내용을 보내기 위해 호출
-async def load_today_messages():
-    today_str = date.today().isoformat()    # "2025-04-21"
-    async with aiosqlite.connect(DB_PATH) as db:
-        cursor = await db.execute("""
-        SELECT id, sender, message, timestamp FROM messages
-        WHERE DATE(timestamp) = ?
-        ORDER BY id ASC
-        """, (today_str,))
+async def load_today_messages(room: str = LOBBY_ROOM):
+    midnight = datetime.combine(date.today(), time.min)     # 오늘 00:00 (로컬)
+    return await load_messages_between(midnight, midnight + timedelta(days=1), room=room)
+
+
+# [start, end) 구간 메시지 - (room, ts) 인덱스 범위 스캔
+async def load_messages_between(start: datetime, end: datetime, limit: int = -1, room: str = LOBBY_ROOM):
+    async with pool.read() as db:
+        cursor = await db.execute(MESSAGE_SELECT + """
+        WHERE m.room = ? AND m.ts >= ? AND m.ts < ?
+        ORDER BY m.ts, m.id     -- (room, ts) 인덱스 순서 그대로 → 별도 정렬 없음
+        LIMIT ?
+        """, (room, int(start.timestamp()), int(end.timestamp()), limit))
         rows = await cursor.fetchall()
 
     # 결과를 딕셔너리 리스트 형태로 반환
-    return [
-        {   "id": row[0],
-            "sender": row[1],
-            "message": row[2],
-            "timestamp": row[3]
-        }
-        for row in rows
-    ]
+    return [row_to_message(row) for row in rows]
 
 
-async def add_created_at_column():
-    async with aiosqlite.connect(DB_PATH) as db:
-        try:
-            # 1. 컬럼만 추가
-            await db.execute("ALTER TABLE messages ADD COLUMN created_at TEXT")
-            await db.commit()
-            print("✅ created_at 컬럼 추가 완료 (기본값 없음)")
-
-            # 2. 기존 데이터에 시간 채워주기
-            await db.execute("UPDATE messages SET created_at = datetime('now') WHERE created_at IS NULL")
-            await db.commit()
-            print("✅ created_at 컬럼 추가 완료")
-        except Exception as e:
-            print("⚠️ 이미 컬럼이 있거나 실패: ", e)
\ No newline at end of file
+# 재접속 동기화: 클라이언트가 가진 마지막 ID 이후의 메시지만 (오래된 것부터, 최대 limit 개)
+async def load_messages_after(after_id: int, limit: int, room: str = LOBBY_ROOM):
+    async with pool.read() as db:
+        cursor = await db.execute(MESSAGE_SELECT + """
+        WHERE m.room = ? AND m.id > ?
+        ORDER BY m.id ASC
+        LIMIT ?
+        """, (room, after_id, limit))
+        rows = await cursor.fetchall()
+    return [row_to_message(row) for row in rows]
+
+
+# 이전 메시지 불러오기: before_id 보다 오래된 메시지를 최신 쪽부터 limit 개 (날짜 구분 없이 ID 기준)
+# min_id 를 주면 그 ID 까지만 (검색 결과로 이동할 때). 반환은 화면에 그리기 좋게 오래된 것부터
+async def load_messages_before(before_id: int, limit: int, min_id: int = 0, room: str = LOBBY_ROOM):
+    async with pool.read() as db:
+        cursor = await db.execute(MESSAGE_SELECT + """
+        WHERE m.room = ? AND m.id < ? AND m.id >= ?
+        ORDER BY m.id DESC
+        LIMIT ?
+        """, (room, before_id, min_id, limit))
+        rows = await cursor.fetchall()
+    return [row_to_message(row) for row in reversed(rows)]
+
+
+# 방 목록과 구성원 (rooms.py 가 서버 시작 시 메모리 색인으로 올림)
+async def load_room_members() -> dict:
+    async with pool.read() as db:
+        async with db.execute("SELECT name FROM rooms") as cursor:
+            members = {row[0]: set() for row in await cursor.fetchall()}
+        async with db.execute("SELECT room, username FROM room_members") as cursor:
+            for room, username in await cursor.fetchall():
+                members.setdefault(room, set()).add(username)
+    return members
+
+
+# 방 참여 (없는 방이면 만듦). 새로 참여했으면 True
+async def add_room_member(room: str, username: str) -> bool:
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    async with pool.write() as db:
+        await db.execute("INSERT OR IGNORE INTO rooms (name, created_by, created_at) VALUES (?, ?, ?)",
+                         (room, username, now))
+        cursor = await db.execute(
+            "INSERT OR IGNORE INTO room_members (room, username, joined_at) VALUES (?, ?, ?)",
+            (room, username, now))
+        await db.commit()
+        return cursor.rowcount > 0
+
+
+# 방 나가기. 실제로 나갔으면 True
+async def remove_room_member(room: str, username: str) -> bool:
+    async with pool.write() as db:
+        cursor = await db.execute("DELETE FROM room_members WHERE room = ? AND username = ?", (room, username))
+        await db.commit()
+        return cursor.rowcount > 0
+
+
+# ---------------------------------------------------------------------------
+# 1:1 대화 (private_messages)
+# ---------------------------------------------------------------------------
+def conversation_key(user_a: str, user_b: str) -> str:
+    # 누가 보내든 같은 키 (이름 순서 정렬, 이름에 쓰기 어려운 구분 문자)
+    return "\x1f".join(sorted((user_a, user_b)))
+
+
+PRIVATE_SELECT = "SELECT id, sender, receiver, message, timestamp FROM private_messages"
+
+
+def row_to_private(row) -> dict:
+    return {"id": row[0], "sender": row[1], "receiver": row[2], "message": row[3], "timestamp": row[4]}
+
+
+# 1:1 메시지 저장 → (id, timestamp)
+async def save_private_message(sender: str, receiver: str, message: str,
+                               now: Optional[datetime] = None) -> tuple:
+    now = now or datetime.now()
+    timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
+    async with pool.write() as db:
+        cursor = await db.execute("""
+            INSERT INTO private_messages (conv_key, sender, receiver, message, timestamp, ts)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (conversation_key(sender, receiver), sender, receiver, message, timestamp, int(now.timestamp())))
+        await db.commit()
+        return cursor.lastrowid, timestamp
+
+
+# 대화 하나의 최근 메시지 한 페이지 (before_id 를 주면 그보다 오래된 것) - (conv_key, id) 인덱스 역순 스캔
+# 반환: (오래된 것부터 정렬한 메시지, 더 오래된 메시지 존재 여부)
+async def load_private_messages(user_a: str, user_b: str, before_id: Optional[int] = None, limit: int = 50):
+    async with pool.read() as db:
+        cursor = await db.execute(PRIVATE_SELECT + """
+        WHERE conv_key = ? AND id < ?
+        ORDER BY id DESC
+        LIMIT ?
+        """, (conversation_key(user_a, user_b), before_id or 2 ** 63 - 1, limit + 1))
+        rows = await cursor.fetchall()
+    return [row_to_private(row) for row in reversed(rows[:limit])], len(rows) > limit
+
+
+# 받는 사람이 접속해 있지 않아서 아직 전달되지 않은 메시지 (오래된 것부터)
+async def load_undelivered_private(receiver: str, limit: int = 500) -> list:
+    async with pool.read() as db:
+        cursor = await db.execute(PRIVATE_SELECT + """
+        WHERE receiver = ? AND delivered = 0
+        ORDER BY id
+        LIMIT ?
+        """, (receiver, limit))
+        rows = await cursor.fetchall()
+    return [row_to_private(row) for row in rows]
+
+
+async def mark_private_delivered(ids):
+    ids = list(ids)
+    if not ids:
+        return
+    async with pool.write() as db:
+        await db.executemany("UPDATE private_messages SET delivered = 1 WHERE id = ?", [(i,) for i in ids])
+        await db.commit()
+
+
+# 검색
+# - 3글자 이상 단어는 FTS5 색인(trigram)으로 찾고, 최신 매치 RANK_WINDOW 개 안에서 관련도(bm25) 순 정렬
+# - 2글자 이하 단어(예: "회의")는 trigram 색인을 쓸 수 없어서 본문 LIKE 필터로 처리
+#   → 긴 단어 없이 짧은 단어만 있으면 최근 SHORT_QUERY_DAYS 일(또는 지정한 기간) 안에서만 최신순으로 찾음
+SEARCH_MIN_TERM = 3
+SHORT_QUERY_DAYS = 31
+SNIPPET_CHARS = 40
+RANK_WINDOW = 500           # 관련도 정렬 대상 (최신 매치 몇 개까지)
+
+
+def _like_pattern(term: str) -> str:
+    return "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def _short_snippet(message: str, terms) -> str:
+    # LIKE 로 찾은 결과용 간단한 발췌 (FTS5 snippet() 과 같은 [ ] 표시)
+    lower = message.lower()
+    pos = min((lower.find(t.lower()) for t in terms if t.lower() in lower), default=0)
+    begin = max(0, pos - SNIPPET_CHARS // 2)
+    text = message[begin:begin + SNIPPET_CHARS]
+    for t in terms:
+        text = text.replace(t, f"[{t}]")
+    return ("…" if begin > 0 else "") + text + ("…" if begin + SNIPPET_CHARS < len(message) else "")
+
+
+# 반환: (결과 리스트, 다음 페이지 존재 여부). 보낸 사람/기간(ts 범위) 필터는 선택
+async def search_messages(text: str, sender: Optional[str] = None, start: Optional[datetime] = None,
+                          end: Optional[datetime] = None, limit: int = 20, offset: int = 0,
+                          room: str = LOBBY_ROOM):
+    terms = text.split()
+    long_terms = [t for t in terms if len(t) >= SEARCH_MIN_TERM]
+    short_terms = [t for t in terms if len(t) < SEARCH_MIN_TERM]
+    if not terms:
+        return [], False
+    if not long_terms and start is None:
+        start = datetime.now() - timedelta(days=SHORT_QUERY_DAYS)
+
+    conditions, params = ["m.room = ?"], [room]
+    if long_terms:
+        # 단어마다 따옴표로 감싸서 AND 검색 (FTS5 연산자/특수문자는 글자 그대로)
+        conditions.append("messages_fts MATCH ?")
+        params.append(" ".join('"' + t.replace('"', '""') + '"' for t in long_terms))
+    for t in short_terms:
+        conditions.append("m.message LIKE ? ESCAPE '\\'")
+        params.append(_like_pattern(t))
+    if sender:
+        conditions.append("m.sender = ?")
+        params.append(sender)
+    if start is not None:
+        conditions.append("m.ts >= ?")
+        params.append(int(start.timestamp()))
+    if end is not None:
+        conditions.append("m.ts < ?")
+        params.append(int(end.timestamp()))
+    where = " AND ".join(conditions)
+
+    if long_terms:
+        # 최신 매치부터 RANK_WINDOW 개만 색인 순서(rowid 역순)로 읽고, 그 안에서만 bm25 관련도 정렬
+        # → 흔한 단어라도 전체 매치를 정렬하지 않으므로 테이블 크기와 상관없이 비용이 일정함
+        sql = f"""
+            WITH hits AS (
+                SELECT m.id, m.sender, m.timestamp,
+                       snippet(messages_fts, 0, '[', ']', '…', 16) AS snippet,
+                       bm25(messages_fts) AS score
+                FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid
+                WHERE {where}
+                ORDER BY messages_fts.rowid DESC
+                LIMIT {max(RANK_WINDOW, offset + limit + 1)}
+            )
+            SELECT id, sender, timestamp, snippet FROM hits
+            ORDER BY score, id DESC
+            LIMIT ? OFFSET ?
+        """
+    else:
+        sql = f"""
+            SELECT m.id, m.sender, m.timestamp, m.message
+            FROM messages m
+            WHERE {where}
+            ORDER BY m.id DESC
+            LIMIT ? OFFSET ?
+        """
+
+    async with pool.read() as db:
+        cursor = await db.execute(sql, (*params, limit + 1, offset))
+        rows = await cursor.fetchall()
+
+    results = [{
+        "id": r[0],
+        "sender": r[1],
+        "timestamp": r[2],
+        "snippet": r[3] if long_terms else _short_snippet(r[3], short_terms),
+    } for r in rows[:limit]]
+    return results, len(rows) > limit
+
+
+# messages(+attachments) 조회 결과 한 줄 → 클라이언트로 보낼 딕셔너리
+def row_to_message(row) -> dict:
+    message = {
+        "id": row[0],
+        "sender": row[1],
+        "message": row[2],
+        "timestamp": row[3],
+        "avatar": row[4]
+    }
+    if row[5]:
+        message["file"] = {"id": row[5], "name": row[6], "type": row[7], "size": row[8]}
+    if row[9] != LOBBY_ROOM:
+        message["room"] = row[9]    # lobby 메시지는 예전과 같은 모양 그대로
+    return message
@@ -0,0 +1,180 @@
+# fanout.py
+# 연결별 송신 큐 + writer task 기반 브로드캐스트 엔진
+# - 브로드캐스트는 각 연결의 큐에 넣기만 하고 바로 반환 (느린 클라이언트가 다른 사람을 막지 않음)
+# - 큐가 가득 찬 연결(느린 소비자)은 끊어버리고, 재접속 시 히스토리로 다시 동기화되게 함
+import asyncio
+import time
+from collections import deque
+from typing import Dict, Iterable, Optional
+
+from fastapi import WebSocket
+
+# 연결당 대기 가능한 최대 송신 프레임 수
+SEND_QUEUE_SIZE = 256
+# 지연시간 통계용 샘플 개수
+LATENCY_SAMPLES = 2048
+
+# writer task 종료 신호
+_CLOSE = object()
+
+
+class ClientConnection:
+    """WebSocket 하나 + 전용 송신 큐 + writer task"""
+
+    def __init__(self, username: str, websocket: WebSocket, hub: "FanoutHub", queue_size: int = SEND_QUEUE_SIZE):
+        self.username = username
+        self.websocket = websocket
+        self.hub = hub
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.closed = False
+        self.writer_task: Optional[asyncio.Task] = None
+        self.last_seen = time.monotonic()   # 마지막으로 프레임을 받은 시각 (reaper 가 확인)
+        self.answers_ping = False           # JSON ping 에 pong 하는 클라이언트 (/mux 또는 ping/pong 을 보낸 적 있음)
+        self.channels = frozenset()         # /mux 연결이 받는 논리 채널 (비어 있으면 예전 단일 용도 소켓)
+
+    def start(self):
+        self.writer_task = asyncio.create_task(self._writer())
+
+    def touch(self):
+        """클라이언트에게서 프레임(pong 포함)을 받을 때마다 호출"""
+        self.last_seen = time.monotonic()
+
+    def enqueue(self, text: str) -> bool:
+        """송신 큐에 넣기 (대기하지 않음). 큐가 가득 차면 False"""
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait((time.perf_counter(), text))
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def _writer(self):
+        try:
+            while True:
+                item = await self.queue.get()
+                if item is _CLOSE:
+                    break
+                enqueued_at, text = item
+                await self.websocket.send_text(text)
+                self.hub.record_latency(time.perf_counter() - enqueued_at)
+        except Exception as e:
+            print(f"⚠️ {self.username} 에게 전송 실패: {e}")
+        finally:
+            self.closed = True
+            self.hub.discard(self)
+
+    async def close(self, code: int = 1000):
+        """writer 정리 + 소켓 닫기"""
+        if self.closed:
+            return
+        self.closed = True
+        # 남은 프레임은 버리고 writer 를 깨워서 종료
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(_CLOSE)
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+
+class FanoutHub:
+    """username → ClientConnection 관리 및 동시 브로드캐스트"""
+
+    def __init__(self, name: str, queue_size: int = SEND_QUEUE_SIZE):
+        self.name = name
+        self.queue_size = queue_size
+        self.clients: Dict[str, ClientConnection] = {}
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.sent = 0
+        self.dropped_slow = 0
+
+    def __contains__(self, username):
+        return username in self.clients
+
+    def __len__(self):
+        return len(self.clients)
+
+    def usernames(self):
+        return list(self.clients.keys())
+
+    def register(self, username: str, websocket: WebSocket) -> ClientConnection:
+        # 같은 닉네임으로 재접속하면 이전 연결은 정리
+        old = self.clients.get(username)
+        if old is not None:
+            asyncio.create_task(old.close())
+
+        conn = ClientConnection(username, websocket, self, self.queue_size)
+        self.clients[username] = conn
+        conn.start()
+        return conn
+
+    def discard(self, conn: ClientConnection):
+        # 같은 이름의 새 연결을 지우지 않도록 객체까지 비교
+        if self.clients.get(conn.username) is conn:
+            del self.clients[conn.username]
+
+    async def unregister(self, conn: ClientConnection):
+        self.discard(conn)
+        await conn.close()
+
+    def send_to(self, username: str, text: str) -> bool:
+        conn = self.clients.get(username)
+        if conn is None:
+            return False
+        return self._offer(conn, text)
+
+    def send_to_many(self, usernames: Iterable[str], text: str) -> int:
+        count = 0
+        for username in usernames:
+            if self.send_to(username, text):
+                count += 1
+        return count
+
+    def broadcast(self, text: str, exclude: Optional[str] = None, channel: Optional[str] = None) -> int:
+        """이미 직렬화된 프레임을 모든 연결의 큐에 넣음 (await 없음 → dict 변경 문제 없음)
+        channel 을 주면 그 채널을 구독한 연결에만"""
+        count = 0
+        for conn in list(self.clients.values()):
+            if conn.username == exclude:
+                continue
+            if channel is not None and channel not in conn.channels:
+                continue
+            if self._offer(conn, text):
+                count += 1
+        return count
+
+    def _offer(self, conn: ClientConnection, text: str) -> bool:
+        if conn.enqueue(text):
+            self.sent += 1
+            return True
+        if conn.closed:
+            return False
+        # 큐 오버플로 → 느린 소비자는 끊고, 재접속 시 히스토리로 재동기화
+        self.dropped_slow += 1
+        print(f"🐢 [{self.name}] 송신 큐 초과로 연결 끊음: {conn.username}")
+        self.discard(conn)
+        asyncio.create_task(conn.close(code=1013))  # 1013 = Try Again Later
+        return False
+
+    def record_latency(self, seconds: float):
+        self.latencies.append(seconds)
+
+    def stats(self) -> dict:
+        samples = sorted(self.latencies)
+
+        def pct(p):
+            if not samples:
+                return 0.0
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))] * 1000, 3)
+
+        return {
+            "connections": len(self.clients),
+            "multiplexed": sum(1 for c in self.clients.values() if c.channels),
+            "sent": self.sent,
+            "dropped_slow": self.dropped_slow,
+            "queued": sum(c.queue.qsize() for c in self.clients.values()),
+            "latency_ms_p50": pct(0.50),
+            "latency_ms_p99": pct(0.99),
+        }
@@ -0,0 +1,250 @@
+# file_transfer.py
+# 채팅 소켓과 분리된 파일 전송 채널 (/files/{username})
+# - 고정 크기 청크 단위 업로드/다운로드 → 메모리 사용량은 파일 크기가 아니라 청크 크기에 비례
+# - file_id = sha256(파일 바이트). 서버에 이미 있는 파일이면 업로드 없이 바로 끝남 (attachment_store)
+# - 업로드 중 끊겨도 같은 해시로 upload_init 하면 받은 곳부터 이어서 올릴 수 있음
+# - 채팅 메시지에는 파일 참조({"id", "name", "size", "type"})만 실림
+#
+# 프로토콜 (텍스트 프레임 = JSON 헤더, 데이터는 바로 뒤의 바이너리 프레임)
+#   upload_init {file_id, name, size, type}  → upload_exists {file_id, size}            (이미 있음)
+#                                            → upload_ready {file_id, offset, chunk_size}
+#   chunk {file_id, offset} + <bytes>        → chunk_ack {file_id, offset}
+#   upload_done {file_id}                    → upload_complete {file_id, size}
+#   cancel {file_id}                         → cancelled {file_id}
+#   read {file_id, offset}                   → data {file_id, offset, size, eof} + <bytes>
+#   thumb {file_id}                          → data {file_id, offset, size, eof} + <bytes>  (이미지 썸네일)
+#   (업로드 시작 속도 제한 초과)               → throttle {file_id, retry_after}   (rate_limit.py 의 file 예산)
+#   (실패 시)                                 → error {file_id, message}
+import asyncio
+import json
+import os
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from attachment_store import PARTIAL_DIR, attachment_path, get_attachment, add_attachment, sha256_file
+from thumbnails import thumbnail_service
+from rate_limit import rate_limiter
+from packet_fields import is_sha256
+
+CHUNK_SIZE = 256 * 1024     # 256 KiB (start_server.bat 의 --ws-max-size 보다 충분히 작게)
+MAX_FILE_SIZE = 1024 * 1024 * 1024
+
+class FileTransferError(Exception):
+    pass
+
+
+def _check_id(file_id) -> str:
+    if not is_sha256(file_id):
+        raise FileTransferError("잘못된 file_id")
+    return file_id
+
+
+def _check_offset(value, name: str) -> int:
+    # size / offset: 없으면 0, 정수(또는 정수 문자열)가 아니거나 음수면 거절
+    if value is None:
+        return 0
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise FileTransferError(f"잘못된 {name}")
+    try:
+        value = int(value)
+    except ValueError:
+        raise FileTransferError(f"잘못된 {name}")
+    if value < 0:
+        raise FileTransferError(f"잘못된 {name}")
+    return value
+
+
+def partial_path(file_id: str) -> str:
+    return os.path.join(PARTIAL_DIR, f"{file_id}.part")
+
+
+def _meta_path(path: str) -> str:
+    return path + ".json"
+
+
+def load_partial_meta(file_id: str):
+    try:
+        with open(_meta_path(partial_path(file_id)), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_meta(path: str, meta: dict):
+    with open(_meta_path(path), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+
+def _remove_partial(file_id: str):
+    path = partial_path(file_id)
+    for p in (path, _meta_path(path)):
+        try:
+            os.remove(p)
+        except FileNotFoundError:
+            pass
+
+
+def _append_chunk(path: str, offset: int, data: bytes) -> int:
+    with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+        f.seek(offset)
+        f.write(data)
+        f.truncate()
+        return f.tell()
+
+
+def _read_chunk(path: str, offset: int, size: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return f.read(size)
+
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+
+class FileChannel:
+    """연결 하나의 파일 전송 세션 (요청/응답이 순서대로 오가는 단순한 구조)"""
+
+    def __init__(self, websocket: WebSocket, username: str):
+        self.websocket = websocket
+        self.username = username
+        self.limits = rate_limiter.connection(username)
+
+    async def send(self, packet: dict, data: bytes = None):
+        await self.websocket.send_text(json.dumps(packet))
+        if data is not None:
+            await self.websocket.send_bytes(data)
+
+    async def run(self):
+        os.makedirs(PARTIAL_DIR, exist_ok=True)
+        try:
+            while True:
+                header = json.loads(await self.websocket.receive_text())
+                if not isinstance(header, dict):
+                    header = {}
+                op = header.get("op")
+                try:
+                    handler = getattr(self, f"op_{op}", None)
+                    if handler is None:
+                        raise FileTransferError(f"알 수 없는 op: {op}")
+                    await handler(header)
+                except FileTransferError as e:
+                    await self.send({"op": "error", "file_id": header.get("file_id"), "message": str(e)})
+        except WebSocketDisconnect:
+            print(f"📁 파일 채널 종료: {self.username}")
+        except (RuntimeError, json.JSONDecodeError) as e:
+            print(f"⚠️ 파일 채널 오류 ({self.username}): {e}")
+
+    async def op_upload_init(self, header):
+        file_id = _check_id(header.get("file_id"))
+        retry_after = self.limits.check("file")
+        if retry_after:
+            await self.send({"op": "throttle", "file_id": file_id, "retry_after": retry_after})
+            return
+        size = _check_offset(header.get("size"), "size")
+        if size > MAX_FILE_SIZE:
+            raise FileTransferError("파일 크기 제한 초과")
+
+        # 이미 저장된 파일이면 바이트를 다시 받을 필요 없음
+        existing = await get_attachment(file_id)
+        if existing is not None:
+            await self.send({"op": "upload_exists", "file_id": file_id, "size": existing["size"]})
+            return
+
+        meta = load_partial_meta(file_id)
+        if meta is None or meta["size"] != size:
+            _remove_partial(file_id)
+            _write_meta(partial_path(file_id), {
+                "name": os.path.basename(str(header.get("name", "file"))),
+                "size": size,
+                "type": str(header.get("type", "")),
+            })
+
+        # 이어 올리기: 이미 받은 만큼의 offset 을 알려줌
+        await self.send({
+            "op": "upload_ready",
+            "file_id": file_id,
+            "offset": _file_size(partial_path(file_id)),
+            "chunk_size": CHUNK_SIZE,
+        })
+
+    async def op_chunk(self, header):
+        data = await self.websocket.receive_bytes()     # 헤더 바로 뒤의 바이너리 프레임 (검사 전에 먼저 소비)
+        file_id = _check_id(header.get("file_id"))
+        offset = _check_offset(header.get("offset"), "offset")
+
+        meta = load_partial_meta(file_id)
+        path = partial_path(file_id)
+        if meta is None:
+            raise FileTransferError("진행 중인 업로드가 없음")
+        if len(data) > CHUNK_SIZE or offset != _file_size(path) or offset + len(data) > meta["size"]:
+            # 순서가 어긋나면 현재 offset 을 알려주고 클라이언트가 거기서부터 다시 보냄
+            await self.send({"op": "chunk_ack", "file_id": file_id, "offset": _file_size(path), "resync": True})
+            return
+
+        new_offset = await asyncio.to_thread(_append_chunk, path, offset, data)
+        await self.send({"op": "chunk_ack", "file_id": file_id, "offset": new_offset})
+
+    async def op_upload_done(self, header):
+        file_id = _check_id(header.get("file_id"))
+        meta = load_partial_meta(file_id)
+        path = partial_path(file_id)
+        if meta is None:
+            existing = await get_attachment(file_id)     # 다른 사람이 먼저 올림
+            if existing is not None:
+                await self.send({"op": "upload_complete", "file_id": file_id, "size": existing["size"]})
+                return
+            raise FileTransferError("진행 중인 업로드가 없음")
+        if _file_size(path) != meta["size"]:
+            raise FileTransferError("업로드가 아직 끝나지 않음")
+
+        if not os.path.exists(path):
+            open(path, "wb").close()    # 빈 파일
+
+        # 받은 바이트가 해시와 맞는지 확인 후 저장소에 등록
+        actual = await asyncio.to_thread(sha256_file, path)
+        if actual != file_id:
+            _remove_partial(file_id)
+            raise FileTransferError("해시 불일치, 처음부터 다시 올려 주세요")
+
+        await add_attachment(file_id, path, meta["name"], meta["type"], meta["size"], self.username)
+        _remove_partial(file_id)
+        thumbnail_service.schedule(file_id, meta["type"])   # 채팅 메시지가 오기 전에 미리 만들어 둠
+        await self.send({"op": "upload_complete", "file_id": file_id, "size": meta["size"]})
+
+    async def op_cancel(self, header):
+        file_id = _check_id(header.get("file_id"))
+        _remove_partial(file_id)
+        await self.send({"op": "cancelled", "file_id": file_id})
+
+    async def op_read(self, header):
+        file_id = _check_id(header.get("file_id"))
+        offset = _check_offset(header.get("offset"), "offset")
+        path = attachment_path(file_id)
+        if not os.path.exists(path):
+            raise FileTransferError("파일 없음")
+
+        total = _file_size(path)
+        data = await asyncio.to_thread(_read_chunk, path, offset, CHUNK_SIZE) if offset < total else b""
+        await self.send({
+            "op": "data",
+            "file_id": file_id,
+            "offset": offset,
+            "size": total,
+            "eof": offset + len(data) >= total,
+        }, data)
+
+    async def op_thumb(self, header):
+        file_id = _check_id(header.get("file_id"))
+        if not os.path.exists(attachment_path(file_id)):
+            raise FileTransferError("파일 없음")
+
+        path = await thumbnail_service.ensure(file_id)
+        if path is None:
+            raise FileTransferError("썸네일을 만들 수 없음")
+
+        data = await asyncio.to_thread(_read_chunk, path, 0, CHUNK_SIZE)
+        await self.send({"op": "data", "file_id": file_id, "offset": 0, "size": len(data), "eof": True}, data)
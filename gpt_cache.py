@@ -0,0 +1,182 @@
+# gpt_cache.py
+# GPT 답변 캐시 - 같은 질문("#오늘 점심 메뉴 추천")은 업스트림을 다시 부르지 않고 저장된 답변으로 응답
+# - key = sha256(정규화한 질문 + 모델 + system 프롬프트) → 모델이나 프롬프트가 바뀌면 자동으로 새 키
+# - SQLite(gpt_cache 테이블)에 저장 → 재시작, 여러 워커에서도 공유
+# - TTL 이 지난 답변은 사용하지 않고, 항목 수가 GPT_CACHE_MAX 를 넘으면 가장 오래 안 쓴 것부터 삭제 (LRU)
+# - single-flight: 같은 질문이 동시에 여러 번 오면 업스트림 호출은 하나, 나머지는 그 스트림을 따라 받음 (워커 단위)
+# DANI_GPT_CACHE_TTL (초), DANI_GPT_CACHE_MAX (항목 수) 로 조정, TTL 0 이면 캐시 사용 안 함
+import asyncio
+import hashlib
+import os
+import re
+import time
+import unicodedata
+from typing import Dict, Optional
+
+from database import pool
+
+GPT_CACHE_TTL = int(os.getenv("DANI_GPT_CACHE_TTL", str(7 * 24 * 3600)))
+GPT_CACHE_MAX = int(os.getenv("DANI_GPT_CACHE_MAX", "5000"))
+PROMPT_MAX = 2000       # 이보다 긴 질문은 캐시하지 않음 (다시 올 가능성이 거의 없음)
+
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """전각/반각, 대소문자, 공백, 끝의 물음표/마침표 차이는 같은 질문으로 봄"""
+    text = unicodedata.normalize("NFKC", prompt).casefold()
+    text = _SPACES.sub(" ", text).strip()
+    return text.rstrip("?!.~ ")
+
+
+def cache_key(prompt: str, model: str, system_prompt: str) -> str:
+    raw = "\x1f".join((normalize_prompt(prompt), model, system_prompt))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class Flight:
+    """
+    진행 중인 업스트림 호출 하나 - 먼저 온 요청이 조각을 push, 나중에 온 요청은 follow 로 처음부터 따라 받음
+    실패(업스트림 오류, 먼저 온 요청이 중간에 나감)로 끝나면 error 문구가 마지막 조각으로 붙음
+    먼저 온 요청이 호출 전에 포기하면(개인 예산 초과) abandoned → 따라 받던 요청이 직접 다시 시도
+    """
+
+    def __init__(self):
+        self.parts = []
+        self.done = False
+        self.error: Optional[str] = None
+        self.abandoned = False
+        self.followers = 0
+        self.changed = asyncio.Event()
+
+    def push(self, delta: str):
+        self.parts.append(delta)
+        self._wake()
+
+    def finish(self, error: Optional[str] = None):
+        if self.done:
+            return
+        self.error = error
+        self.done = True
+        self._wake()
+
+    def _wake(self):
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    async def follow(self):
+        sent = 0
+        while True:
+            changed = self.changed
+            while sent < len(self.parts):
+                yield self.parts[sent]
+                sent += 1
+            if self.done:
+                if self.error:
+                    yield self.error
+                return
+            await changed.wait()
+
+
+class GPTCache:
+    def __init__(self, ttl: int = GPT_CACHE_TTL, max_entries: int = GPT_CACHE_MAX):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.flights: Dict[str, Flight] = {}
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0         # 진행 중인 호출에 합류한 요청
+        self.stored = 0
+        self.evicted = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    async def get(self, key: str) -> Optional[str]:
+        """TTL 안의 저장된 답변 (없으면 None). 찾으면 last_used 갱신"""
+        if not self.enabled:
+            return None
+        now = int(time.time())
+        async with pool.read() as db:
+            async with db.execute("SELECT answer FROM gpt_cache WHERE key = ? AND created_at >= ?",
+                                  (key, now - self.ttl)) as cursor:
+                row = await cursor.fetchone()
+        if row is None:
+            return None
+        async with pool.write() as db:
+            await db.execute("UPDATE gpt_cache SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            await db.commit()
+        self.hits += 1
+        return row[0]
+
+    def join(self, key: str) -> Optional[Flight]:
+        """같은 질문이 이미 업스트림에 나가 있으면 그 Flight"""
+        flight = self.flights.get(key)
+        if flight is not None:
+            flight.followers += 1
+            self.shared += 1
+        return flight
+
+    def begin(self, key: str) -> Flight:
+        """캐시에도, 진행 중에도 없음 → 이 요청이 업스트림을 부름"""
+        self.misses += 1
+        flight = self.flights[key] = Flight()
+        return flight
+
+    def end(self, key: str, flight: Flight, error: Optional[str] = None):
+        """호출이 끝남 → 아직 안 끝난 Flight 는 error 로 마무리하고 목록에서 제거
+        정상 완료는 flight.finish() 후 캐시에 저장까지 마친 뒤 호출 (그 사이 온 같은 질문은 이 Flight 에 합류)"""
+        flight.finish(error)
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+
+    def abandon(self, key: str, flight: Flight):
+        """업스트림을 부르기 전에 포기 (조각 없음) → 따라 받던 요청은 빈 채로 끝나고 스스로 다시 시도"""
+        flight.abandoned = True
+        self.end(key, flight)
+
+    async def put(self, key: str, prompt: str, answer: str, model: str):
+        if not self.enabled or not answer.strip() or len(prompt) > PROMPT_MAX:
+            return
+        now = int(time.time())
+        async with pool.write() as db:
+            await db.execute("""
+                INSERT OR REPLACE INTO gpt_cache (key, prompt, answer, model, created_at, last_used, hits)
+                VALUES (?, ?, ?, ?, ?, ?, 0)
+            """, (key, prompt, answer, model, now, now))
+            # 만료된 항목 + 최대 개수를 넘는 만큼 오래 안 쓴 항목 삭제 (저장은 업스트림 호출 1번마다라 드묾)
+            cursor = await db.execute("DELETE FROM gpt_cache WHERE created_at < ?", (now - self.ttl,))
+            evicted = cursor.rowcount
+            cursor = await db.execute("""
+                DELETE FROM gpt_cache WHERE key IN (
+                    SELECT key FROM gpt_cache ORDER BY last_used
+                    LIMIT MAX(0, (SELECT COUNT(*) FROM gpt_cache) - ?)
+                )
+            """, (self.max_entries,))
+            evicted += cursor.rowcount
+            await db.commit()
+        self.stored += 1
+        self.evicted += max(0, evicted)
+
+    async def count(self) -> int:
+        async with pool.read() as db:
+            async with db.execute("SELECT COUNT(*) FROM gpt_cache") as cursor:
+                return (await cursor.fetchone())[0]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.shared
+        return {
+            "ttl": self.ttl,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared": self.shared,
+            "hit_rate": round((self.hits + self.shared) / lookups, 3) if lookups else 0.0,
+            "in_flight": len(self.flights),
+            "stored": self.stored,
+            "evicted": self.evicted,
+        }
+
+
+gpt_cache = GPTCache()
@@ -0,0 +1,141 @@
+# gpt_scheduler.py
+# GPT 호출 순서 정하기 - 사용자별 대기열 + 라운드로빈 (공정 분배), 동시에 실행하는 호출 수 제한
+# 한 사람이 질문 10개를 연달아 보내도 다른 사람의 질문은 그 10개 뒤가 아니라 사이사이에 실행됨
+# - 빈 자리가 있고 기다리는 사람이 없으면 바로 실행
+# - 아니면 그 사용자 대기열 끝에 넣고, 자리가 날 때마다 차례가 된 사용자의 맨 앞 작업을 실행
+#   (실행한 사용자는 차례 맨 뒤로, 대기열이 비면 차례에서 빠짐)
+# - 대기 순번이 바뀔 때마다 notify(position) 호출 (0 = 실행 시작) → 질문한 클라이언트에 표시
+# 캐시 답변/진행 중인 같은 질문에 합류한 요청은 여기를 거치지 않음 (gpt_service.stream_gpt_with_tracking)
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Callable, Optional
+
+GPT_SCHEDULER_CONCURRENCY = int(os.getenv("DANI_GPT_CONCURRENCY", os.getenv("GPT_MAX_CONCURRENCY", "4")))
+WAIT_SAMPLES = 512
+
+
+class Job:
+    __slots__ = ("username", "future", "notify", "position", "queued_at")
+
+    def __init__(self, username: str, future: asyncio.Future, notify: Optional[Callable[[int], None]]):
+        self.username = username
+        self.future = future
+        self.notify = notify
+        self.position = None
+        self.queued_at = time.perf_counter()
+
+    def report(self, position: int):
+        if position == self.position or self.notify is None:
+            return
+        self.position = position
+        try:
+            self.notify(position)
+        except Exception as e:
+            print(f"⚠️ GPT 대기 순번 알림 실패 ({self.username}): {e}")
+
+
+class GPTScheduler:
+    def __init__(self, concurrency: int = GPT_SCHEDULER_CONCURRENCY):
+        self.concurrency = max(1, concurrency)
+        self.running = 0
+        self.queues: "OrderedDict[str, deque]" = OrderedDict()     # username → 대기 작업 (순서 = 라운드로빈 차례)
+        self.granted = 0
+        self.queued = 0
+        self.waits = deque(maxlen=WAIT_SAMPLES)
+
+    @asynccontextmanager
+    async def slot(self, username: str, notify: Optional[Callable[[int], None]] = None):
+        """실행 차례가 올 때까지 기다렸다가 자리 하나를 잡고, 끝나면 반납"""
+        await self._acquire(username, notify)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, username: str, notify):
+        if self.running < self.concurrency and not self.queues:
+            self.running += 1
+            self.granted += 1
+            self.waits.append(0.0)
+            Job(username, None, notify).report(0)
+            return
+
+        job = Job(username, asyncio.get_running_loop().create_future(), notify)
+        self.queues.setdefault(username, deque()).append(job)
+        self.queued += 1
+        self._announce()
+        try:
+            await job.future
+        except asyncio.CancelledError:
+            if job.future.done() and not job.future.cancelled():
+                self._release()     # 자리를 받은 직후에 취소됨 → 바로 반납
+            else:
+                self._remove(job)
+            raise
+
+    def _release(self):
+        self.running -= 1
+        self._dispatch()
+
+    def _remove(self, job: Job):
+        queue = self.queues.get(job.username)
+        if queue is None:
+            return
+        try:
+            queue.remove(job)
+        except ValueError:
+            return
+        if not queue:
+            del self.queues[job.username]
+        self._announce()
+
+    def _dispatch(self):
+        while self.running < self.concurrency and self.queues:
+            username, queue = next(iter(self.queues.items()))
+            job = queue.popleft()
+            if queue:
+                self.queues.move_to_end(username)   # 다음 작업은 다른 사용자들 뒤에
+            else:
+                del self.queues[username]
+            if job.future.done():
+                continue    # 기다리다 취소됨
+            self.running += 1
+            self.granted += 1
+            self.waits.append(time.perf_counter() - job.queued_at)
+            job.future.set_result(None)
+            job.report(0)
+        self._announce()
+
+    def _announce(self):
+        """대기 중인 작업마다 실행 순번 계산 (라운드 k 에서는 각 사용자의 k 번째 작업이 차례대로 실행)"""
+        lengths = [len(queue) for queue in self.queues.values()]
+        for index, queue in enumerate(self.queues.values()):
+            for k, job in enumerate(queue):
+                ahead = sum(min(length, k) for length in lengths)
+                ahead += sum(1 for length in lengths[:index] if length > k)
+                job.report(ahead + 1)
+
+    def stats(self) -> dict:
+        samples = sorted(self.waits)
+
+        def pct(p):
+            if not samples:
+                return 0.0
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))] * 1000, 1)
+
+        return {
+            "concurrency": self.concurrency,
+            "running": self.running,
+            "waiting": sum(len(queue) for queue in self.queues.values()),
+            "waiting_users": len(self.queues),
+            "granted": self.granted,
+            "queued": self.queued,
+            "wait_ms_p50": pct(0.50),
+            "wait_ms_p99": pct(0.99),
+        }
+
+
+gpt_scheduler = GPTScheduler()
@@ -1,132 +1,360 @@
 # gpt_service.py
-from flask import Flask, request, jsonify
-import openai
+# GPT(Together.ai, OpenAI 호환 API) 호출
+# - 서버가 떠 있는 동안 httpx.AsyncClient 하나를 재사용 (keep-alive, h2 패키지가 있으면 HTTP/2)
+#   → 질문마다 TCP/TLS 연결을 새로 맺지 않음. main.py 의 startup/shutdown 에서 열고 닫음
+# - 동시에 나가는 요청 수는 세마포어로 제한, 연결/응답 대기 시간은 명시적으로 지정
+# - 429 / 5xx / 네트워크 오류는 지터를 섞은 지수 백오프로 재시도 (Retry-After 헤더가 있으면 따름)
+# - GPT_BASE_URL 로 주소를 바꿀 수 있어서 로컬 가짜 서버로도 시험 가능
+# - stream_gpt_with_tracking: SSE("stream": true) 로 답변 조각을 생성되는 대로 전달
+# - 같은 질문은 gpt_cache 의 저장된 답변으로 (비용 0), 동시에 온 같은 질문은 업스트림 호출 하나를 공유
+# - 업스트림 호출은 gpt_scheduler 의 사용자별 공정 대기열을 거치고, 사용량은 gpt_usage 원장에 사용자별로 기록
+import asyncio
+import json
 import os
+import random
+import time
+from collections import deque
+from typing import Optional
+
 import httpx
-import asyncio
-from openai import OpenAI
 from dotenv import load_dotenv
-from openai.types.completion_usage import PromptTokensDetails
-
-# OpenAI API 키
-
-
-# 가격 기준(3.5)
-PROMPT_COST = 0.5 / 1_000_000
-COMPLETION_COST = 1.5 / 1_000_000
-MAX_BUDGET = 5.0 # 달러 기준
 
-# 누적 토근/요금 추적
-used_tokens = 0
-used_cost = 0.0
+from gpt_cache import gpt_cache, cache_key
+from gpt_scheduler import gpt_scheduler
+from gpt_usage import usage_ledger
 
 load_dotenv()   #.env 파일을 불러와 환경변수로 등록
 API_KEY = os.getenv("TOGETHER_API_KEY")
-print("API_KEY", API_KEY)
+print("API_KEY 설정됨" if API_KEY else "⚠️ TOGETHER_API_KEY 없음")
+
+GPT_BASE_URL = os.getenv("GPT_BASE_URL", "https://api.together.xyz/v1")
+GPT_MAX_CONCURRENCY = int(os.getenv("GPT_MAX_CONCURRENCY", "4"))    # 동시에 나가는 요청 수
+GPT_CONNECT_TIMEOUT = float(os.getenv("GPT_CONNECT_TIMEOUT", "5"))  # 초
+GPT_READ_TIMEOUT = float(os.getenv("GPT_READ_TIMEOUT", "60"))       # 초 (긴 답변 생성 시간 포함)
+GPT_MAX_RETRIES = int(os.getenv("GPT_MAX_RETRIES", "3"))
+RETRY_BASE_DELAY = 0.5      # 초, 시도마다 2배
+RETRY_MAX_DELAY = 8.0
+RETRY_STATUS = {429, 500, 502, 503, 504}
+LATENCY_SAMPLES = 512
 
 #Together.ai에서 사용할 모델(최신 고성능 무료 모델)
 TOGETHER_MODEL = "meta-llama/Llama-4-Maverick-17B-128E-Instruct-FP8"
+SYSTEM_PROMPT = "당신은 친절하고 유익한 AI이며, 항상 한국어로 응답해야 합니다."
 # 비용 기준( opneAI 대비 단가는 정확히 없지만, 대략 동일 기준 사용 가능)
 PROMPT_COST = 0.5 / 1_000_000          # 입력 토큰 단가 (USD)
 COMPLETION_COST = 1.5 / 1_000_000      # 출력 토큰 단가 (USD)
-MAX_BUDGET = 5.0                       # 최대 허용 예산 (달러 기준)
+# 예산 (사용자별 / 전체 월 한도) 은 gpt_usage.py 의 DANI_GPT_USER_BUDGET, DANI_GPT_MONTH_BUDGET
+
+GPT_ABORTED = "\nX GPT 응답이 중간에 중단되었습니다. 다시 질문해 주세요."
+BUDGET_EXCEEDED = {
+    "month": "! GPT 무료 사용 한도를 초과했습니다. 다음 달에 다시 이용해 주세요.",
+    "user": "! 이번 달 개인 GPT 사용 한도를 모두 사용했습니다. 다음 달에 다시 이용해 주세요.",
+}
+
+try:
+    import h2  # noqa: F401  (있으면 HTTP/2 로 한 연결에서 여러 요청을 동시에)
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+
+class GPTError(Exception):
+    pass
+
+
+class GPTClient:
+    """업스트림 연결 풀 + 동시 요청 제한 + 재시도"""
+
+    def __init__(self, base_url: str = GPT_BASE_URL, max_concurrency: int = GPT_MAX_CONCURRENCY):
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self.client: Optional[httpx.AsyncClient] = None
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.first_token = deque(maxlen=LATENCY_SAMPLES)   # 스트리밍 첫 조각까지 걸린 시간
+
+    async def start(self):
+        if self.client is not None:
+            return
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={"Authorization": f"Bearer {API_KEY}"} if API_KEY else None,
+            http2=HTTP2,
+            timeout=httpx.Timeout(GPT_READ_TIMEOUT, connect=GPT_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=self.max_concurrency,
+                                max_keepalive_connections=self.max_concurrency,
+                                keepalive_expiry=120),
+        )
+        print(f"✅ GPT 클라이언트 준비 ({self.base_url}, 동시 {self.max_concurrency}, HTTP/2={HTTP2})")
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def post(self, path: str, payload: dict) -> dict:
+        """JSON POST - 재시도 가능한 오류는 백오프 후 다시, 끝내 실패하면 GPTError"""
+        if self.client is None:
+            await self.start()     # startup 전에 호출된 경우 (스크립트 등)
+        async with self.semaphore:
+            self.in_flight += 1
+            try:
+                return await self._post_with_retry(path, payload)
+            finally:
+                self.in_flight -= 1
+
+    async def _post_with_retry(self, path: str, payload: dict) -> dict:
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            self.requests += 1
+            retry_after = None
+            try:
+                response = await self.client.post(path, json=payload)
+                if response.status_code not in RETRY_STATUS:
+                    self.latencies.append(time.perf_counter() - started)
+                    return response.json()
+                error = GPTError(f"HTTP {response.status_code}")
+                retry_after = response.headers.get("retry-after")
+            except (httpx.TransportError, ValueError) as e:     # 연결/시간 초과, 잘린 JSON
+                error = GPTError(f"{type(e).__name__}: {e}")
+
+            attempt += 1
+            if attempt > GPT_MAX_RETRIES:
+                self.failures += 1
+                raise error
+            self.retries += 1
+            await asyncio.sleep(self._backoff(attempt, retry_after))
+
+    async def stream(self, path: str, payload: dict):
+        """SSE 스트림의 이벤트(JSON)를 하나씩 yield
+        재시도는 첫 이벤트를 받기 전까지만 (이미 보낸 조각이 중복되지 않도록)"""
+        if self.client is None:
+            await self.start()
+        async with self.semaphore:
+            self.in_flight += 1
+            try:
+                attempt = 0
+                while True:
+                    started = time.perf_counter()
+                    self.requests += 1
+                    retry_after = None
+                    received = False
+                    try:
+                        async with self.client.stream("POST", path, json=payload) as response:
+                            if response.status_code in RETRY_STATUS:
+                                error = GPTError(f"HTTP {response.status_code}")
+                                retry_after = response.headers.get("retry-after")
+                            elif response.status_code >= 400:
+                                yield json.loads(await response.aread())   # {"error": ...} 그대로 전달
+                                return
+                            else:
+                                async for line in response.aiter_lines():
+                                    if not line.startswith("data:"):
+                                        continue    # 빈 줄, 주석(: keep-alive) 등
+                                    data = line[5:].strip()
+                                    if data == "[DONE]":
+                                        break
+                                    if not received:
+                                        received = True
+                                        self.first_token.append(time.perf_counter() - started)
+                                    yield json.loads(data)
+                                self.latencies.append(time.perf_counter() - started)
+                                return
+                    except (httpx.TransportError, ValueError) as e:
+                        if received:
+                            self.failures += 1
+                            raise GPTError(f"스트림 중단: {type(e).__name__}: {e}")
+                        error = GPTError(f"{type(e).__name__}: {e}")
+
+                    attempt += 1
+                    if attempt > GPT_MAX_RETRIES:
+                        self.failures += 1
+                        raise error
+                    self.retries += 1
+                    await asyncio.sleep(self._backoff(attempt, retry_after))
+            finally:
+                self.in_flight -= 1
+
+    @staticmethod
+    def _backoff(attempt: int, retry_after) -> float:
+        try:
+            if retry_after is not None:
+                return min(float(retry_after), RETRY_MAX_DELAY)
+        except ValueError:
+            pass    # HTTP 날짜 형식이면 무시하고 기본 백오프
+        # full jitter: 여러 요청이 동시에 막혀도 같은 순간에 다시 몰리지 않도록
+        return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+
+    def stats(self) -> dict:
+        samples = sorted(self.latencies)
+
+        def pct(p):
+            if not samples:
+                return 0.0
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))] * 1000, 1)
+
+        first = sorted(self.first_token)
+        return {
+            "base_url": self.base_url,
+            "http2": HTTP2,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "retries": self.retries,
+            "failures": self.failures,
+            "latency_ms_p50": pct(0.50),
+            "latency_ms_p99": pct(0.99),
+            "first_token_ms_p50": round(first[len(first) // 2] * 1000, 1) if first else 0.0,
+        }
+
+
+gpt_client = GPTClient()
+
+
+def _chat_payload(prompt: str, stream: bool = False) -> dict:
+    # GPT 요청 메시지 구성: 항상 한국어로 답하라는 system  메시지 포함
+    payload = {
+        "model": TOGETHER_MODEL,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+    }
+    if stream:
+        payload["stream"] = True
+    return payload
+
+
+async def _record_usage(username: str, prompt: str, gpt_reply: str, usage: Optional[dict]):
+    # API 가 usage(실제 토큰 수)를 주면 그대로, 안 주면 글자 수로 추정
+    if usage:
+        prompt_tokens = int(usage.get("prompt_tokens") or 0)
+        completion_tokens = int(usage.get("completion_tokens") or 0)
+    else:
+        prompt_tokens, completion_tokens = len(prompt), len(gpt_reply)
+    cost = prompt_tokens * PROMPT_COST + completion_tokens * COMPLETION_COST
+    try:
+        await usage_ledger.record(username, TOGETHER_MODEL, prompt_tokens, completion_tokens, cost,
+                                  estimated=not usage)
+    except Exception as e:
+        print(f"⚠️ GPT 사용량 기록 실패 ({username}): {e}")
+        return
+
+    # 콘솔 출력으로 사용량 추적
+    print(f" [{username}] 사용 토큰: {prompt_tokens}+{completion_tokens}{'(추정)' if not usage else ''}, 비용: ${cost:.6f}")
 
-# 사용량 추적 변수 (전역)
-used_tokens = 0
-used_cost = 0.0
 
-async def ask_gpt_with_tracking(prompt: str) -> str:
+async def ask_gpt_with_tracking(prompt: str, username: str = "") -> str:
     """
-    Together.ai의 Mixtral 모델에 질문을 보내고 응답을 받아오는 함수,
+    Together.ai 모델에 질문을 보내고 응답을 받아오는 함수,
     또한 토큰 수와 예상 비용을 추적해서 예산 초과 여부도 관리함.
-    :param promt:
+    스트리밍 버전과 같은 경로(캐시, 중복 제거)를 거쳐 전체 답변을 한 번에 반환
+    :param prompt:
     :return:
     """
-    global used_tokens, used_cost
+    return "".join([delta async for delta in stream_gpt_with_tracking(prompt, username)])
 
-    # 한도 초과 체크
-    if used_cost >= MAX_BUDGET:
-        return "! GPT 무료 사용 한도를 초과했습니다. 다음 달에 다시 이용해 주세요."
 
+async def stream_gpt_with_tracking(prompt: str, username: str = "", notify=None):
+    """
+    답변 조각(str)을 생성되는 대로 yield
+    1) 캐시에 있으면 저장된 답변 한 번 (업스트림 호출, 비용 없음)
+    2) 같은 질문이 이미 업스트림에 나가 있으면 그 스트림을 처음부터 따라 받음
+    3) 아니면 예산 확인 → 공정 대기열에서 차례를 기다려 직접 호출, 정상으로 끝난 답변만 캐시에 저장
+    notify(dict): {"budget": {...}} (예산 확인 결과), {"position": n} (대기 순번, 0 = 생성 시작)
+    오류는 예외 대신 안내 문구 조각으로 (기존 함수와 같은 방식)
+    """
+    key = cache_key(prompt, TOGETHER_MODEL, SYSTEM_PROMPT)
+    while True:
+        try:
+            cached = await gpt_cache.get(key)
+        except Exception as e:
+            print(f"⚠️ GPT 캐시 조회 실패: {e}")
+            cached = None
+        if cached is not None:
+            yield cached
+            return
+
+        flight = gpt_cache.join(key)
+        if flight is None:
+            # await 없이 바로 등록 → 예산 확인/대기열에 있는 동안 온 같은 질문도 이 호출에 합류
+            flight = gpt_cache.begin(key)
+            break
+        async for delta in flight.follow():
+            yield delta
+        if not flight.abandoned:
+            return
+        # 먼저 온 질문자가 자기 예산 때문에 호출하지 못함 → 이 요청이 처음부터 직접 (자기 예산으로)
+
+    def report_position(position: int):
+        if notify:
+            notify({"position": position})
+
+    parts = []
+    usage = None
+    failure = None      # 따라 받는 요청에게도 알릴 실패 문구
     try:
-        # GPT 요청 메시지 구성: 항상 한국어로 답하라는 system  메시지 포함
-        messages = [
-            {"role": "system", "content": "당신은 친절하고 유익한 AI이며, 항상 한국어로 응답해야 합니다."},
-            {"role": "user", "content": prompt}
-        ]
-
-
-        # 비동기 HTTP POST 요청으로 GPT 호출
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://api.together.xyz/v1/chat/completions",
-                headers={"Authorization": f"Bearer {API_KEY}"},
-                json={
-                    "model": TOGETHER_MODEL,
-
-                    "messages": messages
-
-
-                }
-            )
-
-            # 응답 JSON 파싱
-            data = response.json()
-
-            # 오류 으답일 경우 메시지 리턴
-            if "error"  in data:
-                return f"x GPT 오류: {data['error'].get('message', '알 수 없는 오류')}"
-
-            # 응답 메시지 추출
-            gpt_reply = data["choices"][0]["message"]["content"]
-
-            # 사용량 추정(Together는 정확한 usage 제공 안 함 -> 임의 추정
-            estimated_tokens = len(prompt) + len(gpt_reply)
-            estimated_cost = estimated_tokens * (PROMPT_COST + COMPLETION_COST)
-
-            # 사용량 누적
-            used_tokens += estimated_tokens
-            used_cost += estimated_cost
-
-            # 콘솔 출력으로 사용량 추적
-            print(f" 사용 토큰: {used_tokens}, 사용 비용: &{used_cost:.4f}")
-
-            return gpt_reply
-
-    except Exception as e:
-        # 네트워크 또는 서버 오류 처리
-        return f"X GPT 응답 실패: {str(e)}"
-
-
-
-
-
-
-
-
-
-
-
-
-
-        """
-        response = await client.chat.completions.create(
-            model = "gpt-3.5-turbo",
-            messages=[{"role": "user", "content": promt}]
-        )
-        usage = response.usage
-        prompt_tk = usage.prompt_tokens
-        completion_tk = usage.completion_tokens
-        total_tk = usage.total_tokens
-
-        # 비용 계산
-        cost = prompt_tk * PROMPT_COST + completion_tk * COMPLETION_COST
-        used_tokens += total_tk
-        used_cost += cost
-
-        print(f"GPT 사용량: {used_tokens} tokens, ${used_cost:.4f} 사용됨")
-
-        return response.choices[0].message.content
-        """
+        # 한도 초과 체크 (캐시 답변은 비용이 없으므로 그 뒤에)
+        # 예산은 질문자 개인 사정 → 초과하면 Flight 를 포기만 하고 (따라 받던 요청이 자기 예산으로 다시 시도)
+        # 안내 문구는 이 질문자에게만
+        try:
+            budget = await usage_ledger.check(username)
+        except Exception as e:
+            print(f"⚠️ GPT 예산 확인 실패 ({username}): {e}")
+            budget = {"exceeded": None}
+        if notify:
+            notify({"budget": budget})
+        if budget["exceeded"]:
+            gpt_cache.abandon(key, flight)
+            yield BUDGET_EXCEEDED[budget["exceeded"]]
+            return
+
+        async with gpt_scheduler.slot(username, report_position):
+            # 기다리는 동안 같은 사용자의 앞선 질문들이 예산을 다 썼을 수 있음 → 차례가 오면 한 번 더 확인
+            exceeded = (await usage_ledger.check(username))["exceeded"]
+            if exceeded:
+                gpt_cache.abandon(key, flight)
+                yield BUDGET_EXCEEDED[exceeded]
+                return
+            events = gpt_client.stream("/chat/completions", _chat_payload(prompt, stream=True))
+            try:
+                async for event in events:
+                    if event.get("usage"):
+                        usage = event["usage"]      # 보통 마지막 이벤트에 실림
+                    if "error" in event:
+                        error = event["error"]
+                        message = error.get("message", "알 수 없는 오류") if isinstance(error, dict) else error
+                        failure = f"x GPT 오류: {message}"
+                        yield failure
+                        return
+                    choices = event.get("choices") or []
+                    delta = (choices[0].get("delta") or {}).get("content") if choices else None
+                    if delta:
+                        parts.append(delta)
+                        flight.push(delta)
+                        yield delta
+            finally:
+                await events.aclose()
+                if parts:
+                    # 중간에 끊긴 답변도 생성된 만큼은 비용이 나감 (자리를 넘기기 전에 기록 → 다음 차례의 예산 확인에 반영)
+                    await _record_usage(username, prompt, "".join(parts), usage)
+
+        # 정상 완료: 따라 받는 요청은 바로 끝내고, Flight 는 캐시에 저장한 뒤에 제거
+        # (그 사이에 온 같은 질문도 업스트림을 다시 부르지 않고 이 답변을 받음)
+        flight.finish()
+        try:
+            await gpt_cache.put(key, prompt, "".join(parts), TOGETHER_MODEL)
+        except Exception as e:
+            print(f"⚠️ GPT 캐시 저장 실패: {e}")
     except Exception as e:
-        return f"X GPT 응답 실패: {e}"
+        failure = ("\n" if parts else "") + f"X GPT 응답 실패: {str(e)}"
+        yield failure
+    finally:
+        # 실패하거나 질문자가 중간에 나가서(GeneratorExit) 끝나지 못했으면 따라 받는 요청에게 실패로 알림
+        gpt_cache.end(key, flight, error=None if flight.done else (failure or GPT_ABORTED))
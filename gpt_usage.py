@@ -0,0 +1,121 @@
+# gpt_usage.py
+# GPT 사용량 원장 + 사용자별/월별 예산
+# - 호출이 끝날 때마다 gpt_usage 에 1행 (API 응답의 usage 토큰, 없으면 글자 수로 추정)
+# - 같은 트랜잭션에서 gpt_usage_monthly (월, 사용자) 합계를 누적 → 예산 확인/집계는 합계 테이블만 읽음
+# - 예산은 달마다 새로 시작 (month = YYYY-MM), 재시작해도 DB 에 남아 있음
+#     사용자 한 명의 월 예산 : DANI_GPT_USER_BUDGET (USD)
+#     전체 월 예산          : DANI_GPT_MONTH_BUDGET (USD)
+import os
+import time
+from datetime import datetime
+from typing import Optional
+
+from database import pool
+
+USER_MONTH_BUDGET = float(os.getenv("DANI_GPT_USER_BUDGET", "0.5"))
+MONTH_BUDGET = float(os.getenv("DANI_GPT_MONTH_BUDGET", "5.0"))
+
+
+def current_month(now: Optional[datetime] = None) -> str:
+    return (now or datetime.now()).strftime("%Y-%m")
+
+
+class UsageLedger:
+    def __init__(self, user_budget: float = USER_MONTH_BUDGET, month_budget: float = MONTH_BUDGET):
+        self.user_budget = user_budget
+        self.month_budget = month_budget
+        self.recorded = 0
+        self.estimated = 0
+        self.rejected = 0
+
+    async def record(self, username: str, model: str, prompt_tokens: int, completion_tokens: int,
+                     cost: float, estimated: bool = False):
+        month = current_month()
+        async with pool.write() as db:
+            await db.execute("""
+                INSERT INTO gpt_usage (username, month, ts, model, prompt_tokens, completion_tokens, cost, estimated)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (username, month, int(time.time()), model, prompt_tokens, completion_tokens, cost, int(estimated)))
+            await db.execute("""
+                INSERT INTO gpt_usage_monthly (month, username, requests, prompt_tokens, completion_tokens, cost)
+                VALUES (?, ?, 1, ?, ?, ?)
+                ON CONFLICT(month, username) DO UPDATE SET
+                    requests = requests + 1,
+                    prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                    completion_tokens = completion_tokens + excluded.completion_tokens,
+                    cost = cost + excluded.cost
+            """, (month, username, prompt_tokens, completion_tokens, cost))
+            await db.commit()
+        self.recorded += 1
+        if estimated:
+            self.estimated += 1
+
+    async def user_month(self, username: str, month: Optional[str] = None) -> dict:
+        """한 사용자의 월 합계 (기본키 조회)"""
+        async with pool.read() as db:
+            async with db.execute("""
+                SELECT requests, prompt_tokens, completion_tokens, cost FROM gpt_usage_monthly
+                WHERE month = ? AND username = ?
+            """, (month or current_month(), username)) as cursor:
+                row = await cursor.fetchone()
+        requests, prompt_tokens, completion_tokens, cost = row or (0, 0, 0, 0.0)
+        return {"requests": requests, "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens, "cost": cost}
+
+    async def month_total(self, month: Optional[str] = None) -> dict:
+        """월 전체 합계 (그 달 사용자 수만큼의 행만 읽음)"""
+        async with pool.read() as db:
+            async with db.execute("""
+                SELECT COUNT(*), COALESCE(SUM(requests), 0), COALESCE(SUM(prompt_tokens), 0),
+                       COALESCE(SUM(completion_tokens), 0), COALESCE(SUM(cost), 0)
+                FROM gpt_usage_monthly WHERE month = ?
+            """, (month or current_month(),)) as cursor:
+                users, requests, prompt_tokens, completion_tokens, cost = await cursor.fetchone()
+        return {"users": users, "requests": requests, "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens, "cost": cost}
+
+    async def month_by_user(self, month: Optional[str] = None, limit: int = 50) -> list:
+        """월 사용량 상위 사용자"""
+        async with pool.read() as db:
+            async with db.execute("""
+                SELECT username, requests, prompt_tokens, completion_tokens, cost FROM gpt_usage_monthly
+                WHERE month = ? ORDER BY cost DESC LIMIT ?
+            """, (month or current_month(), limit)) as cursor:
+                rows = await cursor.fetchall()
+        return [{"username": username, "requests": requests, "prompt_tokens": prompt_tokens,
+                 "completion_tokens": completion_tokens, "cost": cost}
+                for username, requests, prompt_tokens, completion_tokens, cost in rows]
+
+    async def check(self, username: str) -> dict:
+        """
+        질문 전 예산 확인 → {"used", "limit", "month_used", "month_limit", "exceeded"}
+        exceeded: None(여유 있음) / "user"(개인 월 예산) / "month"(전체 월 예산)
+        """
+        user = await self.user_month(username)
+        total = await self.month_total()
+        exceeded = None
+        if total["cost"] >= self.month_budget:
+            exceeded = "month"
+        elif user["cost"] >= self.user_budget:
+            exceeded = "user"
+        if exceeded:
+            self.rejected += 1
+        return {
+            "used": round(user["cost"], 6),
+            "limit": self.user_budget,
+            "month_used": round(total["cost"], 6),
+            "month_limit": self.month_budget,
+            "exceeded": exceeded,
+        }
+
+    def stats(self) -> dict:
+        return {
+            "user_budget": self.user_budget,
+            "month_budget": self.month_budget,
+            "recorded": self.recorded,
+            "estimated": self.estimated,
+            "rejected": self.rejected,
+        }
+
+
+usage_ledger = UsageLedger()
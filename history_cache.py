@@ -0,0 +1,144 @@
+# history_cache.py
+# 최근 메시지 링 버퍼 (메모리) + 미리 직렬화해 둔 히스토리
+# - 메시지 한 건 = (id, ts, JSON 문자열) 튜플. 저장할 때 한 번만 json.dumps
+# - 오늘 히스토리 JSON 배열은 새 메시지가 올 때만 다시 만듦
+#   → 와이파이가 끊겨서 200명이 한꺼번에 재접속해도 DB 조회 없이 직렬화 1번
+# - 버퍼가 다루지 못하는 범위(버퍼보다 오래된 after_id, 자정 이전이 밀려난 경우)는 None → 호출한 쪽에서 DB 조회
+import bisect
+import json
+from collections import deque, namedtuple
+from itertools import islice
+from datetime import datetime, date, time
+from typing import Optional
+
+from database import load_messages_before
+
+HOT_CAPACITY = 5000     # 메모리에 유지할 최근 메시지 수
+
+# 클라이언트로 보낼 메시지 묶음 (messages = 이미 직렬화된 JSON 배열 문자열)
+HistorySlice = namedtuple("HistorySlice", "messages first_id last_id count")
+
+EMPTY_SLICE = HistorySlice("[]", None, None, 0)
+
+
+def encode_message(message: dict) -> str:
+    return json.dumps(message)
+
+
+def make_slice(entries) -> HistorySlice:
+    if not entries:
+        return EMPTY_SLICE
+    return HistorySlice("[" + ", ".join(e[2] for e in entries) + "]", entries[0][0], entries[-1][0], len(entries))
+
+
+def slice_from_messages(messages: list) -> HistorySlice:
+    """DB 에서 읽은 메시지 딕셔너리 리스트 → HistorySlice (버퍼가 다루지 못할 때)"""
+    return make_slice([(m["id"], None, encode_message(m)) for m in messages])
+
+
+def encode_packet(packet_type: str, history: HistorySlice, **fields) -> str:
+    """{"type": ..., "messages": <미리 직렬화된 배열>, ...fields} 를 배열 재직렬화 없이 조립"""
+    head = json.dumps({"type": packet_type})[:-1]
+    tail = json.dumps(fields)[1:] if fields else "}"
+    return head + ', "messages": ' + history.messages + (", " + tail if fields else tail)
+
+
+class HistoryCache:
+    def __init__(self, capacity: int = HOT_CAPACITY):
+        self.entries = deque(maxlen=capacity)   # (id, ts, json) - id 오름차순
+        self.ids = deque(maxlen=capacity)       # bisect 용 id 목록 (entries 와 같은 순서)
+        self.complete = False                   # True 면 DB 의 모든 메시지가 버퍼에 있음 (아직 밀려난 게 없음)
+        self._today = None                      # (자정 ts, 마지막 id, HistorySlice)
+        self.hits = 0
+        self.misses = 0
+        self.builds = 0
+
+    async def warm(self):
+        """서버 시작 시 최근 메시지로 채움"""
+        capacity = self.entries.maxlen
+        messages = await load_messages_before(2 ** 63 - 1, capacity)
+        self.entries.clear()
+        self.ids.clear()
+        for m in messages:
+            self._push((m["id"], timestamp_to_ts(m["timestamp"]), encode_message(m)))
+        self.complete = len(messages) < capacity
+        self._today = None
+        print(f"✅ 최근 메시지 {len(self.entries)}건 메모리에 적재")
+
+    def append(self, message: dict, ts: int):
+        """save_message 직후 호출 (message 는 row_to_message 와 같은 모양)"""
+        entry = (message["id"], ts, encode_message(message))
+        if self.ids and entry[0] < self.ids[-1]:
+            # 묶음 커밋 후 순서가 뒤바뀌어 도착한 경우 - 제자리에 끼워 넣음
+            index = bisect.bisect_left(self.ids, entry[0])
+            if len(self.entries) == self.entries.maxlen:
+                if index == 0:
+                    return      # 버퍼보다 오래된 메시지
+                self._evict()
+                index -= 1
+            self.entries.insert(index, entry)
+            self.ids.insert(index, entry[0])
+        else:
+            self._push(entry)
+        self._today = None
+
+    def _push(self, entry):
+        if len(self.entries) == self.entries.maxlen:
+            self._evict()
+        self.entries.append(entry)
+        self.ids.append(entry[0])
+
+    def _evict(self):
+        self.entries.popleft()
+        self.ids.popleft()
+        self.complete = False
+
+    def today(self) -> Optional[HistorySlice]:
+        """오늘 00:00 이후 메시지 (버퍼에 오늘 것이 다 있을 때만)"""
+        midnight = int(datetime.combine(date.today(), time.min).timestamp())
+        last_id = self.ids[-1] if self.ids else None
+        cached = self._today
+        if cached is not None and cached[0] == midnight and cached[1] == last_id:
+            self.hits += 1
+            return cached[2]
+
+        # 버퍼 맨 앞이 자정 이전이면 오늘 메시지는 모두 버퍼 안에 있음
+        if not self.complete and (not self.entries or self.entries[0][1] >= midnight):
+            self.misses += 1
+            return None
+
+        start = len(self.entries)
+        while start > 0 and self.entries[start - 1][1] >= midnight:
+            start -= 1
+        history = make_slice(list(islice(self.entries, start, None)))
+        self._today = (midnight, last_id, history)
+        self.builds += 1
+        return history
+
+    def after(self, after_id: int, limit: int) -> Optional[HistorySlice]:
+        """after_id 이후 메시지 최대 limit 개 (after_id 가 버퍼보다 오래됐으면 None)"""
+        if not self.complete and (not self.ids or after_id < self.ids[0] - 1):
+            self.misses += 1
+            return None
+        self.hits += 1
+        start = bisect.bisect_right(self.ids, after_id)
+        end = min(len(self.entries), start + limit)
+        return make_slice(list(islice(self.entries, start, end)))
+
+    def stats(self) -> dict:
+        return {
+            "messages": len(self.entries),
+            "capacity": self.entries.maxlen,
+            "complete": self.complete,
+            "hits": self.hits,
+            "misses": self.misses,
+            "today_builds": self.builds,
+        }
+
+
+def timestamp_to_ts(timestamp: str) -> int:
+    # messages.timestamp(로컬 시간 문자열, 예전 행은 ISO "T" 형식) → messages.ts 와 같은 epoch 초
+    return int(datetime.fromisoformat(timestamp).timestamp())
+
+
+history_cache = HistoryCache()
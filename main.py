@@ -1,7 +1,9 @@
 #main.py
+import asyncio
 import base64
 import json
 
+from datetime import datetime, timedelta
 from typing import Optional
 import aiosqlite
 import openai
@@ -12,9 +14,29 @@ from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from win32print import JOB_READ
 
-from database import init_db, save_message, load_today_messages, init_read_state, save_read_count, \
-    save_last_read_id, DB_PATH, load_last_read_id
-from gpt_service import ask_gpt_with_tracking
+from database import init_db, save_message, load_today_messages, save_read_count, \
+    DB_PATH, load_messages_after, load_messages_before, close_db, \
+    message_writer, load_all_last_read_ids, load_latest_message_id, search_messages, LOBBY_ROOM, \
+    save_private_message, load_private_messages, load_undelivered_private, mark_private_delivered
+from gpt_service import stream_gpt_with_tracking, gpt_client
+from gpt_cache import gpt_cache
+from gpt_scheduler import gpt_scheduler
+from gpt_usage import usage_ledger, current_month
+from fanout import FanoutHub
+from file_transfer import FileChannel
+from thumbnails import thumbnail_service, IMAGE_TYPES
+from attachment_store import init_attachment_store, get_attachment
+from avatar_store import put_avatar, get_avatar, has_avatar, user_avatars
+from packet_fields import PacketError, is_sha256, packet_hash, packet_int, packet_month, packet_str
+from read_state import read_state
+from receipts import receipts
+from history_cache import history_cache, slice_from_messages, encode_packet
+from maintenance import maintenance, search_archive, VACUUM_CONVERT
+from bus import bus
+from presence import presence
+from reaper import reaper
+from rooms import rooms, normalize_room
+from rate_limit import rate_limiter
 import os
 import uuid #  고유 reply_id 생성용
 
@@ -24,8 +46,8 @@ app = FastAPI()
 with open("images/ChatGPT.png", "rb") as f:
     gpt_icon_b64 = base64.b64encode(f.read()).decode("utf-8")
 
-# 이후 응답마다 이 변수만 사용
-gpt_profile = gpt_icon_b64
+# 이후 응답마다 아이콘 대신 이 해시만 사용 (startup 에서 avatar_store 에 등록)
+gpt_avatar_hash = None
 
 
 # CORS 설정: 모든 origin 허용 (개발 중에는 괜찮지만, 배포 시에는 제한하는 것이 안전)
@@ -38,55 +60,116 @@ app.add_middleware(
 )
 
 
-# 현재 연결된 클라이언트 {username: WebSocket}
-connected_clients = {}
-notice_clients = {}  # /notice/{username} for announcement
+# 재접속 시 한 번에 보내는 최대 증분 메시지 수 (넘으면 클라이언트가 화면을 새로 그림)
+SYNC_LIMIT = 500
+# 이전 메시지 불러오기 한 페이지 최대 크기
+OLDER_PAGE_LIMIT = 100
+# 검색 결과로 이동할 때 한 번에 채워 넣을 수 있는 최대 메시지 수 (넘으면 too_far)
+JUMP_LIMIT = 1000
+# 검색 결과 한 페이지 최대 크기
+SEARCH_PAGE_LIMIT = 50
+# 검색 페이지 번호 상한 (관련도 정렬은 최신 매치 RANK_WINDOW 개 안에서만이라 그보다 뒤는 의미 없음)
+SEARCH_MAX_PAGE = 1000
+# 1:1 대화 히스토리 한 페이지 최대 크기
+PRIVATE_PAGE_LIMIT = 100
+# GPT 답변 조각을 모아서 보내는 간격 (초) - 토큰마다 패킷을 만들지 않도록
+GPT_DELTA_INTERVAL = 0.1
+
+# 이 워커에 연결된 클라이언트 {username: ClientConnection} - 연결마다 송신 큐 + writer task
+# 다른 워커에 연결된 사용자에게는 bus 이벤트로 전달됨 (아래 on_bus_* 핸들러)
+chat_hub = FanoutHub("chat")
+notice_hub = FanoutHub("notice")  # /notice/{username} for announcement (예전 클라이언트용, 새 클라이언트는 /mux 의 notice 채널)
+
+# /mux 연결 하나에 실리는 논리 채널 - 패킷의 "ch" 필드로 구분 (없으면 chat)
+#   chat     : 메시지, 히스토리, 읽음 표시, 검색 ...
+#   notice   : 공지 (announcement)
+#   presence : 접속자 스냅샷/변화분 (user_list, presence_delta)
+#   control  : hello, validate, ping/pong
+MUX_CHANNELS = frozenset({"chat", "notice", "presence", "control"})
+# /mux 접속 후 hello 를 보내기까지 기다리는 최대 시간 (초)
+HELLO_TIMEOUT = 30
 
 # 서버 시작 시 DB 초기화
 @app.on_event("startup")
 async def startup():
-    await init_db()
-    await init_read_state()
+    global gpt_avatar_hash
+    await init_db()     # 스키마 마이그레이션 포함
+    if VACUUM_CONVERT:
+        await maintenance.convert_auto_vacuum()     # 예전 DB 의 1회 전환 (접속을 받기 전에)
+    await bus.start()
+    await rooms.load()
+    message_writer.start()
+    read_state.start()
+    receipts.load(await load_all_last_read_ids(), await load_latest_message_id(LOBBY_ROOM))
+    await history_cache.warm()
+    maintenance.start(is_leader=bus.is_leader)    # 여러 워커 중 하나만 실행
+    reaper.start()
+    init_attachment_store()
+    thumbnail_service.start()
+    await gpt_client.start()    # GPT 업스트림 연결 풀 (keep-alive)
+    gpt_avatar_hash = await put_avatar(gpt_icon_b64)
     print("✅ 서버 시작 및 DB 초기화 완료")
 
+@app.on_event("shutdown")
+async def shutdown():
+    thumbnail_service.shutdown()
+    await reaper.stop()
+    await gpt_client.close()
+    await maintenance.stop()
+    await read_state.stop()     # 남은 읽은 위치 기록
+    await bus.stop()
+    await close_db()
+    print("👋 서버 종료")
+
+# 하트비트 응답 (reaper.py 참고)
+PONG_PACKET = json.dumps({"ch": "control", "type": "pong"})
+
+
+def heartbeat_type(data: str) -> Optional[str]:
+    """ping/pong 패킷이면 그 type, 아니면 None"""
+    try:
+        packet_type = json.loads(data).get("type")
+    except (ValueError, AttributeError):
+        return None
+    return packet_type if packet_type in ("ping", "pong") else None
+
+
 # ✅ 공지용 WebSocket 엔드포인트 추가
 @app.websocket("/notice/{username}")
 async def notice_socket(websocket: WebSocket, username: str):
     await websocket.accept()
-    notice_clients[username] = websocket
-    print(f"📢 공지 연결됨: {username}, 현재 notice_clients = {list(notice_clients.keys())}")
+    conn = notice_hub.register(username, websocket)
+    reaper.watch(conn)
+    print(f"📢 공지 연결됨: {username}, 현재 notice_clients = {notice_hub.usernames()}")
 
 
     try:
         while True:
-            await websocket.receive_text()  # 연결 유지용 (아무 동작 없음)
+            data = await websocket.receive_text()  # 연결 유지용 - 받은 프레임은 생존 신호로만 사용
+            conn.touch()
+            heartbeat = heartbeat_type(data)
+            if heartbeat:
+                conn.answers_ping = True    # 하트비트를 아는 클라이언트 → 응답이 없으면 reaper 가 정리
+            if heartbeat == "ping":
+                conn.enqueue(PONG_PACKET)
     except WebSocketDisconnect:
         print(f"❌ 공지 연결 종료: {username}")
-        notice_clients.pop(username, None)
+    finally:
+        await notice_hub.unregister(conn)
 
 # 공지 전송 함수 예시 (사용 시 호출)
 async def broadcast_announcement(sender, message):
     print(f"📢 공지 브로드캐스트 시도: {sender} → {message}")  # ✅ 이 줄 추가
 
     packet = json.dumps({
+        "ch": "notice",
         "type": "announcement",
         "sender": sender,
         "message": message
     })
-    disconnected_users = []
-
-    for user, client in list(notice_clients.items()):
-        try:
-            await client.send_text(packet)
-        except Exception as e:
-            print(f"⚠️ {user} 에게 공지 전송 실패: {e}")
-            disconnected_users.append(user)
 
-    # ✅ 끊긴 사용자 제거
-    for user in disconnected_users:
-        notice_clients.pop(user, None)
-        print(f"( 공지용 )연결 끊긴 사용자 제거: {user}")
-        await broadcast_user_list()  # 🧩 이 위치에서도 갱신해야 함
+    # 모든 워커의 notice 연결 큐에 넣기만 하고 바로 반환, 느린/끊긴 연결은 hub 에서 정리됨
+    bus.publish("notice", {"text": packet})
 
 # GPT 에게 질문 요청 함수
 async def ask_gpt(prompt: str) -> str:
@@ -106,46 +189,119 @@ async def validate_nickname(websocket: WebSocket):
     nickname = data.get("nickname")  # ✅ 바로 사용
 
     try:
-        if nickname in connected_clients:   # 접속 중인 사용자로 확인
-            await websocket.send_text(json.dumps({"available": False}))
-        else:
-            await websocket.send_text(json.dumps({"available": True}))
+        await websocket.send_text(json.dumps({"available": await nickname_available(nickname)}))
     except Exception as e:
         print(f"⚠️ WebSocket 전송 실패: {e}")
 
 
-# 웹소켓 핸들링
-@app.websocket("/ws/{username}")
-async def websocket_endpoint(websocket: WebSocket, username: str):
-    await websocket.accept()
-    connected_clients[username] = websocket
-    print(f"📥 연결됨: {username}")
+# 모든 워커의 접속자 중에 같은 닉네임이 있는지 확인
+async def nickname_available(nickname) -> bool:
+    if not isinstance(nickname, str) or not nickname.strip():
+        return False
+    return nickname not in await bus.online_users()
 
-    """Websocket 연결 직후 -> 메시지+last_read_id 함께 전송"""
-    # 사용자별 마지막 일긍 메시지 ID 로드
-    last_read_id = await load_last_read_id(username)
 
-    await broadcast_user_list() #여기에서만 호출, 유저리스트 갱신
+async def validate_result(nickname) -> str:
+    return json.dumps({
+        "ch": "control",
+        "type": "validate_result",
+        "nickname": nickname,
+        "available": await nickname_available(nickname)
+    })
+
 
-    # DB에서 해당사용자의 읽은 메시지 수 조회
-    #read_count = await load_read_count(username)
-    #print(f"📌 {username}의 마지막 읽은 메시지 수: {read_count}")
+# 파일 전송 전용 채널: 청크 단위 업로드/다운로드 (채팅 소켓을 막지 않도록 분리)
+@app.websocket("/files/{username}")
+async def file_socket(websocket: WebSocket, username: str):
+    await websocket.accept()
+    print(f"📁 파일 채널 연결됨: {username}")
+    await FileChannel(websocket, username).run()
 
-    # 클라이언트가 연결되면 오늘 메시지 + 읽은 수 불러와서 전송
-    history = await load_today_messages()
 
+# 하나의 소켓으로 채팅/공지/접속자/제어 채널을 모두 처리 (/ws + /notice + /validate 를 대체)
+# 접속 직후는 control 채널만: validate 는 몇 번이든, hello 를 받으면 그 이름으로 채팅 세션 시작
+#   → {"ch": "control", "type": "hello", "username": "다니", "after_id": 123}
+@app.websocket("/mux")
+async def mux_socket(websocket: WebSocket):
+    await websocket.accept()
     try:
-        # 클라이언트에게 히스토리 + 마지막 읽은 메시지 ID 함께 전송
-        await websocket.send_text(json.dumps({
-            "type": "history",
-            "messages": history,
-            "last_read_id": last_read_id
-        }))
-    except Exception as e:
-        print(f"⚠️ WebSocket 전송 실패: {e}")
+        while True:
+            data = await asyncio.wait_for(websocket.receive_text(), HELLO_TIMEOUT)
+            try:
+                data_packet = json.loads(data)
+            except json.JSONDecodeError:
+                continue
+            if not isinstance(data_packet, dict):
+                continue
+
+            packet_type = data_packet.get("type")
+            if packet_type == "validate":
+                await websocket.send_text(await validate_result(data_packet.get("nickname")))
+            elif packet_type == "ping":
+                await websocket.send_text(PONG_PACKET)
+            elif packet_type == "hello":
+                username = data_packet.get("username")
+                if isinstance(username, str) and username.strip():
+                    await chat_session(websocket, username, data_packet.get("after_id"), MUX_CHANNELS)
+                    return
+                await websocket.send_text(json.dumps({"ch": "control", "type": "hello_error",
+                                                      "reason": "username required"}))
+    except asyncio.TimeoutError:
+        print("⌛ /mux hello 대기 시간 초과")
+        await websocket.close(code=1008)
+    except WebSocketDisconnect:
+        pass
+
+
+# 웹소켓 핸들링 (예전 클라이언트용 - 채팅 채널만)
+@app.websocket("/ws/{username}")
+async def websocket_endpoint(websocket: WebSocket, username: str):
+    await websocket.accept()
+    await chat_session(websocket, username, websocket.query_params.get("after_id"))
 
 
-    print("📦 오늘 메시지 수:", len(history))
+# 채팅 세션 본체: /ws/{username} 과 /mux(hello 이후) 가 공유
+async def chat_session(websocket: WebSocket, username: str, after_id, channels=frozenset()):
+    conn = chat_hub.register(username, websocket)
+    conn.channels = channels
+    conn.answers_ping = bool(channels)      # /mux 클라이언트는 ping 에 항상 pong. 예전 /ws 는 ping/pong 을 보낸 뒤부터
+    reaper.watch(conn)      # 일정 시간 조용하면 ping, 그래도 응답 없으면 정리
+    limits = rate_limiter.connection(username)     # 연결별 + 사용자별 토큰 버킷
+    session_gpt_tasks = set()       # 이 연결의 GPT 답변 task (연결이 끝나면 취소 → 대기열에서도 빠짐)
+    print(f"📥 연결됨: {username}")
+
+    """Websocket 연결 직후 -> 메시지+last_read_id 함께 전송"""
+    # 사용자별 마지막 일긍 메시지 ID 로드
+    last_read_id = await read_state.get(username)
+    if username not in receipts.positions:      # 처음 접속한 사용자는 모든 메시지를 안 읽은 상태
+        bus.publish("read_join", {"username": username, "position": last_read_id})
+
+    await bus.set_presence(username, True)     # presence 이벤트 → 모든 워커가 모아서 입장 delta 전송
+    conn.enqueue(presence.snapshot())           # 새 연결에는 현재 접속자 스냅샷 (이후는 delta)
+
+    # 재접속이면 클라이언트가 가진 마지막 ID(?after_id= 또는 hello 의 after_id) 이후만, 처음이면 오늘 메시지 전체
+    history, incremental, reset = await load_sync_history(after_id)
+
+    # 클라이언트에게 히스토리 + 마지막 읽은 메시지 ID 함께 전송 (메시지 배열은 미리 직렬화된 것을 그대로 사용)
+    conn.enqueue(encode_packet(
+        "history",
+        history,
+        last_read_id=last_read_id,
+        incremental=incremental,        # True 면 기존 화면 뒤에 이어 붙임
+        reset=reset,                    # True 면 빠진 메시지가 너무 많아 화면을 새로 그림
+        receipts=receipts.snapshot_range(history.first_id, history.last_id)
+    ))
+    conn.enqueue(json.dumps(rooms.packet(username)))   # 참여한 방 목록 (히스토리는 lobby 만, 방은 열 때 요청)
+
+    # 접속해 있지 않는 동안 온 1:1 메시지
+    pending = await load_undelivered_private(username)
+    if pending:
+        conn.enqueue(json.dumps({"type": "private_pending", "messages": pending}))
+        await mark_private_delivered(m["id"] for m in pending)
+        print(f"📨 {username} 에게 밀린 1:1 메시지 {len(pending)}건 전달")
+
+
+    print("📦 보낸 히스토리 메시지 수:", history.count, "(증분)" if incremental else "")
     print(" 마지막으로 읽은 메시지 id = ", last_read_id)
 
     # 이후 채팅 대기 루프 진입...
@@ -157,60 +313,282 @@ async def websocket_endpoint(websocket: WebSocket, username: str):
             except RuntimeError:
                 print("❌ 클라이언트가 먼저 연결을 끊음")
                 break
+            conn.touch()
 
             try:
                 data_packet = json.loads(data)  # 클라이언트로부터 받은 JSON 메시지 파싱
+                if not isinstance(data_packet, dict):
+                    continue
+
+                # 하트비트: 서버 ping 에 대한 pong 은 touch 로 충분, 클라이언트 ping 에는 pong 응답
+                if data_packet.get("type") == "pong":
+                    conn.answers_ping = True
+                    continue
+                if data_packet.get("type") == "ping":
+                    conn.answers_ping = True
+                    conn.enqueue(PONG_PACKET)
+                    continue
+
+                # 속도 제한: 예산을 넘으면 처리하지 않고 throttle 응답 (클라이언트가 retry_after 만큼 쉬었다가 재전송)
+                kind = packet_kind(data_packet)
+                retry_after = limits.check(kind) if kind else 0
+                if retry_after:
+                    if limits.abusive():
+                        print(f"🚫 throttle 을 무시하고 계속 보내서 연결 끊음: {username}")
+                        rate_limiter.disconnected += 1
+                        await conn.close(code=1008)     # 1008 = Policy Violation
+                        break
+                    conn.enqueue(throttle_packet(kind, retry_after, data_packet))
+                    continue
+
+                # 접속 중에도 control 채널로 닉네임 확인 가능 (별도 /validate 소켓 불필요)
+                if data_packet.get("type") == "validate":
+                    conn.enqueue(await validate_result(data_packet.get("nickname")))
+                    continue
 
                 """개인 메시지 처리: packet -> data_packet 수정"""
+                # 먼저 저장한 뒤 전달 → 받는 사람이 없으면 다음 접속 때 private_pending 으로 전달
                 if data_packet.get("type") == "private_room":
-                    sender = data_packet["sender"]
-                    receiver = data_packet["receiver"]
-                    msg = data_packet["message"]
-                    target_ws = connected_clients.get(receiver)
-                    sender_ws = connected_clients.get(sender)
-
-                    if target_ws:
-                        await target_ws.send_text(json.dumps({
-                            "type": "private_room",
-                            "sender": sender,
-                            "receiver": receiver,
-                            "message": msg
-                        }))
-                    if sender_ws:
-                        await sender_ws.send_text(json.dumps({
-                            "type": "private_room",
-                            "sender": sender,
-                            "receiver": receiver,
-                            "message": msg
-                        }))
+                    sender = username   # 패킷의 sender 대신 연결한 사용자 이름
+                    receiver = data_packet.get("receiver")
+                    msg = data_packet.get("message")
+                    if not isinstance(receiver, str) or not isinstance(msg, str) or not msg.strip():
+                        continue
+                    private_id, timestamp = await save_private_message(sender, receiver, msg)
+                    private_packet = json.dumps({
+                        "type": "private_room",
+                        "id": private_id,
+                        "sender": sender,
+                        "receiver": receiver,
+                        "message": msg,
+                        "timestamp": timestamp
+                    })
+                    bus.publish("private", {"users": [receiver, sender], "receiver": receiver,
+                                            "id": private_id, "text": private_packet})
                     continue    # 더 이상 처리하지 않고 다음 반복으로
 
-
-
-                # 메시지 타입이 "update_read_id"일 경우 (앱 종료 직전 클라이언트에서 전송)
+                # 1:1 대화 창을 열 때 / 위로 넘길 때: 최근(또는 before_id 이전) 한 페이지
+                if data_packet.get("type") == "private_history":
+                    partner = packet_str(data_packet, "partner")
+                    if partner is None:
+                        raise PacketError("partner")
+                    before_id = packet_int(data_packet, "before_id", 0) or None     # 없으면 최근 페이지
+                    limit = packet_int(data_packet, "limit", 50, 1, PRIVATE_PAGE_LIMIT)
+                    messages, has_more = await load_private_messages(username, partner, before_id, limit)
+                    conn.enqueue(json.dumps({
+                        "type": "private_history",
+                        "partner": partner,
+                        "before_id": before_id,
+                        "messages": messages,
+                        "has_more": has_more
+                    }))
+                    continue
+
+
+
+                # 아바타 등록: 접속 직후 1회, 이후 메시지에는 해시만 실림
+                if data_packet.get("type") == "avatar_put":
+                    avatar = await put_avatar(data_packet.get("data"))     # 비었거나/크거나/base64 가 아니면 None
+                    if avatar:
+                        user_avatars[username] = avatar
+                    conn.enqueue(json.dumps({"type": "avatar_ack", "hash": avatar}))
+                    continue
+
+                # 접속자 목록 버전이 건너뛰었을 때 클라이언트가 스냅샷 재요청
+                if data_packet.get("type") == "presence_sync":
+                    conn.enqueue(presence.snapshot())
+                    continue
+
+                # 처음 보는 해시의 아바타 요청
+                if data_packet.get("type") == "avatar_get":
+                    avatar_hash = packet_hash(data_packet, "hash")
+                    if avatar_hash is None:
+                        raise PacketError("hash")
+                    avatar_data = await get_avatar(avatar_hash)
+                    conn.enqueue(json.dumps({"type": "avatar", "hash": avatar_hash, "data": avatar_data}))
+                    continue
+
+                # 이전 메시지 불러오기 (스크롤 맨 위 도달 시): before_id 보다 오래된 메시지 한 페이지
+                # until_id 가 있으면 (검색 결과로 이동) 그 메시지까지 한 번에, 너무 멀면 too_far
+                if data_packet.get("type") == "load_older":
+                    room = requested_room(data_packet, username)
+                    if room is None:
+                        conn.enqueue(room_error(data_packet.get("room"), "not_member"))
+                        continue
+                    before_id = packet_int(data_packet, "before_id", 0)
+                    until_id = packet_int(data_packet, "until_id", 0)
+                    too_far = False
+                    if until_id > 0:
+                        older = await load_messages_before(before_id, JUMP_LIMIT + 1, min_id=until_id, room=room)
+                        too_far = len(older) > JUMP_LIMIT
+                        page, has_more = ([] if too_far else older), True
+                    else:
+                        limit = packet_int(data_packet, "limit", 50, 1, OLDER_PAGE_LIMIT)
+                        older = await load_messages_before(before_id, limit + 1, room=room) if before_id > 0 else []
+                        page, has_more = older[-limit:], len(older) > limit
+                    older_packet = {
+                        "type": "older",
+                        "before_id": before_id,
+                        "until_id": until_id or None,
+                        "too_far": too_far,
+                        "messages": page,
+                        "has_more": has_more,
+                    }
+                    if room == LOBBY_ROOM:
+                        older_packet["receipts"] = receipts.snapshot(page)   # 읽음 표시는 lobby 만
+                    else:
+                        older_packet["room"] = room
+                    conn.enqueue(json.dumps(older_packet))
+                    continue
+
+                # 방 목록 / 참여(없으면 만들기) / 나가기
+                if data_packet.get("type") == "room_list":
+                    conn.enqueue(json.dumps(rooms.packet(username)))
+                    continue
+
+                if data_packet.get("type") in ("room_join", "room_leave"):
+                    room = normalize_room(data_packet.get("room"))
+                    if room is None or room == LOBBY_ROOM:
+                        conn.enqueue(room_error(data_packet.get("room"), "invalid_room"))
+                        continue
+                    if data_packet["type"] == "room_join":
+                        await rooms.join(room, username)
+                    else:
+                        await rooms.leave(room, username)
+                    conn.enqueue(json.dumps(rooms.packet(username)))
+                    continue
+
+                # 클라이언트가 방 창을 열 때: 그 방의 오늘 메시지 (after_id 가 있으면 그 이후만)
+                if data_packet.get("type") == "room_history":
+                    room = requested_room(data_packet, username)
+                    if room is None or room == LOBBY_ROOM:
+                        conn.enqueue(room_error(data_packet.get("room"), "not_member"))
+                        continue
+                    after_id = data_packet.get("after_id")
+                    if isinstance(after_id, int):
+                        messages = await load_messages_after(after_id, SYNC_LIMIT, room=room)
+                    else:
+                        messages = await load_today_messages(room)
+                    conn.enqueue(encode_packet("room_history", slice_from_messages(messages), room=room))
+                    continue
+
+                # 전문 검색: 관련도 순 한 페이지 (보낸 사람, 기간 "YYYY-MM-DD" 필터 선택)
+                # archive 가 true 면 DB 에서 옮겨진 오래된 메시지(보관 파일)에서 검색 (month "YYYY-MM" 선택)
+                if data_packet.get("type") == "search" and data_packet.get("archive"):
+                    query = str(data_packet.get("query") or "").strip()[:100]
+                    room = requested_room(data_packet, username)
+                    if room is None:
+                        conn.enqueue(room_error(data_packet.get("room"), "not_member"))
+                        continue
+                    results = await search_archive(query, sender=packet_str(data_packet, "sender", max_len=100),
+                                                   month=packet_month(data_packet, "month"), limit=SEARCH_PAGE_LIMIT,
+                                                   room=room)
+                    conn.enqueue(json.dumps({
+                        "type": "search_results",
+                        "query": query,
+                        "page": 0,
+                        "archive": True,
+                        "results": [{"id": m["id"], "sender": m["sender"], "timestamp": m["timestamp"],
+                                     "snippet": m["message"][:80]} for m in results],
+                        "has_more": False
+                    }))
+                    continue
+
+                if data_packet.get("type") == "search":
+                    query = str(data_packet.get("query") or "").strip()[:100]
+                    page_size = packet_int(data_packet, "page_size", 20, 1, SEARCH_PAGE_LIMIT)
+                    page = packet_int(data_packet, "page", 0, 0, SEARCH_MAX_PAGE)
+                    sender = packet_str(data_packet, "sender", max_len=100)
+                    date_to = parse_search_date(data_packet.get("date_to"))
+                    room = requested_room(data_packet, username)
+                    if room is None:
+                        conn.enqueue(room_error(data_packet.get("room"), "not_member"))
+                        continue
+                    results, has_more = await search_messages(
+                        query,
+                        sender=sender,
+                        start=parse_search_date(data_packet.get("date_from")),
+                        end=date_to + timedelta(days=1) if date_to else None,    # date_to 당일 포함
+                        limit=page_size,
+                        offset=page * page_size,
+                        room=room)
+                    conn.enqueue(json.dumps({
+                        "type": "search_results",
+                        "query": query,
+                        "page": page,
+                        "results": results,
+                        "has_more": has_more
+                    }))
+                    continue
+
+                # 읽은 위치 보고 (스크롤/종료 시 클라이언트에서 전송) → 메모리만 갱신, DB 는 read_state 가 묶어서 기록
                 if data_packet.get("type") == "update_read_id":
-                    print("update_read_id")
-                    await save_last_read_id(data_packet.get("username"), data_packet.get("message_id"))
+                    advance_read_position(username, data_packet.get("message_id"))
+                    continue
+
+                # 처리하지 않는 제어 패킷이나 빈 메시지는 messages 테이블에 저장하지 않음
+                if data_packet.get("type") not in (None, "message") or \
+                        (not data_packet.get("message") and not data_packet.get("file")):
+                    print(f"⚠️ 처리하지 않는 패킷 무시: {data_packet.get('type')}")
+                    continue
 
 
 
                 # 일반 메시지 수신 처리
-                message_text = data_packet.get("message", "")
-                profile_image = data_packet.get("profile", None)
+                message_text = data_packet.get("message") or ""
                 file_info = data_packet.get("file", None)  # ✅ 파일 정보 가져오기
+                if not isinstance(message_text, str):
+                    raise PacketError("message")
+                if file_info is not None and not isinstance(file_info, dict):
+                    raise PacketError("file")
+
+                # 방 지정이 없으면 lobby. 구성원이 아닌 방에는 보낼 수 없음
+                room = requested_room(data_packet, username)
+                if room is None:
+                    conn.enqueue(room_error(data_packet.get("room"), "not_member"))
+                    continue
+
+                # 아바타 해시 (구버전 클라이언트가 base64 profile 을 보내면 저장 후 해시로 변환)
+                # 클라이언트가 보낸 해시는 저장소에 실제로 있을 때만, 아니면 avatar_put 으로 등록한 해시
+                avatar = data_packet.get("avatar")
+                if not (is_sha256(avatar) and await has_avatar(avatar)):
+                    avatar = user_avatars.get(username)
+                if not avatar and data_packet.get("profile"):
+                    avatar = await put_avatar(data_packet["profile"])
+                    if avatar:
+                        user_avatars[username] = avatar
+
+                # 파일 참조는 저장소에 실제로 있는 해시만 인정 (없는 파일을 가리키는 메시지 방지)
+                if file_info:
+                    file_id = file_info.get("id")
+                    attachment = await get_attachment(file_id) if is_sha256(file_id) else None
+                    if attachment is None:
+                        print(f"⚠️ 저장소에 없는 첨부파일 참조 무시: {file_info.get('id')}")
+                        file_info = None
+                    else:
+                        attachment["name"] = os.path.basename(str(file_info.get("name") or attachment["name"]))
+                        file_info = attachment
 
                 # 일반 메시지 저장 후 ID 획득
-                message_id = await save_message(username, message_text)
+                now = datetime.now()
+                message_id = await save_message(username, message_text, avatar,
+                                                file_info["id"] if file_info else None, now=now, room=room)
+                bus.publish("message_saved", {
+                    "message": stored_message(message_id, username, message_text, now, avatar, file_info, room),
+                    "ts": int(now.timestamp())
+                })
+                if room == LOBBY_ROOM:
+                    advance_read_position(username, message_id)     # 보낸 사람은 자기 메시지까지 읽은 것으로 처리
 
                 #await save_message(username, message_text)  # DB에 메시지 저장
-                # ✅ 공지용 메시지인 경우 broadcast_announcement 호출
-                if message_text.startswith("@"):
+                # ✅ 공지용 메시지인 경우 broadcast_announcement 호출 (공지/GPT 명령은 lobby 에서만)
+                if room == LOBBY_ROOM and message_text.startswith("@"):
                     print("공지 출력", message_text)
                     await broadcast_announcement(username, message_text[1:].strip())
 
 
                 # GPT 메시지인 경우
-                if message_text.startswith('#'):     #gpt 메시지인지 확인
+                if room == LOBBY_ROOM and message_text.startswith('#'):     #gpt 메시지인지 확인
                     print("this is gpt message")
                     message = message_text
 
@@ -225,29 +603,18 @@ async def websocket_endpoint(websocket: WebSocket, username: str):
                         "type": "message",
                         "sender": "GPT",
                         "message": "⏳ 답변을 생성 중입니다", # 깜빡이는 건 클라이언트가 함
-                        "profile": gpt_profile,
+                        "avatar": gpt_avatar_hash,
                         "reply_id": reply_id  # 고유 식별자 추가
                     }
-                    await websocket.send_text(json.dumps(thinking_packet))
+                    conn.enqueue(json.dumps(thinking_packet))
 
-                    # 2. 실제 GPT 호출
-                    gpt_response = await ask_gpt_with_tracking(prompt)
-
-                    # 3. 실제 응답 전송
-                    # GPT 응답을 질문자에게만 전달 ->
-                    gpt_packet = {
-                        "type": "message",
-                        "sender": "GPT",
-                        "message": gpt_response,
-                        "profile": gpt_profile,
-                        "reply_id": reply_id  # 고유 식별자 추가
-                    }
-
-                    #for client in connected_clients.values():
-                        #await client.send_text(json.dumps(gpt_packet))
-                    # 질문자에게만 답변
-                    await websocket.send_text(json.dumps(gpt_packet))
-                    #await websocket.send_text(json.dumps(gpt_packet))
+                    # 2. 실제 GPT 호출 - 생성되는 대로 질문자에게 스트리밍
+                    #    수신 루프를 막지 않도록 별도 task (답변 중에도 pong, 다른 메시지 처리)
+                    task = asyncio.create_task(stream_gpt_reply(conn, username, reply_id, prompt))
+                    gpt_tasks.add(task)
+                    session_gpt_tasks.add(task)
+                    task.add_done_callback(gpt_tasks.discard)
+                    task.add_done_callback(session_gpt_tasks.discard)
 
 
                 # 일반 텍스트/파일 메시지 처리
@@ -257,12 +624,24 @@ async def websocket_endpoint(websocket: WebSocket, username: str):
                         "type": "message", # 명시적으로 type 포함
                         "sender": username,
                         "message": message_text,
-                        "profile": profile_image,
+                        "avatar": avatar,
                         "id": message_id,
                     }
+                    if room == LOBBY_ROOM:
+                        message_packet["unread"] = receipts.unread_count(message_id)   # 읽음 표시는 lobby 만
+                    else:
+                        message_packet["room"] = room
+                    # 보낸 사람이 자기 말풍선에 ID 를 연결할 수 있도록 임시 ID 를 그대로 돌려줌
+                    if isinstance(data_packet.get("client_id"), str):
+                        message_packet["client_id"] = data_packet["client_id"][:64]
 
                     if file_info:
                         message_packet["file"] = file_info  # 파일 정보 포함
+                        # 이미지는 180px 썸네일만 바로 실어 보내고, 원본은 필요할 때 파일 채널로 받아감
+                        if file_info["type"] in IMAGE_TYPES:
+                            thumb = await thumbnail_service.read_b64(file_info["id"])
+                            if thumb:
+                                message_packet["file"] = dict(file_info, thumb=thumb)
 
                     print(f"💬 메시지 수신 from {username}: {message_text} ")
 
@@ -272,42 +651,291 @@ async def websocket_endpoint(websocket: WebSocket, username: str):
                         print(f"⚠️ 공백 메시지 무시됨: {username}")
                         continue
 
-                    # 전체 클라이언트에게 메시지 전송
-                    for client in connected_clients.values():
-                        await client.send_text(json.dumps(message_packet))
+                    # 전체 클라이언트에게 메시지 전송 (한 번만 직렬화, 워커마다 각 연결 큐에 동시 투입)
+                    # 방 메시지는 각 워커에서 그 방 구성원의 연결에만
+                    bus.publish("broadcast", {"text": json.dumps(message_packet), "room": room})
 
 
 
 
             except json.JSONDecodeError:
                 print("❌ 메시지 파싱 실패")
+            except PacketError as e:
+                # 잘못된 필드 하나 때문에 세션 전체가 끊기지 않도록 그 패킷만 거절
+                print(f"⚠️ 잘못된 패킷 필드 ({username}): {data_packet.get('type')}.{e.field}")
+                conn.enqueue(e.packet(data_packet))
 
     except WebSocketDisconnect:
         print(f"❌ 연결 종료: {username}")
-        if username in connected_clients:
-            del connected_clients[username]
-        await broadcast_user_list() # 유저 리스트 갱신
+    finally:
+        # 질문자가 나갔으면 답변도 필요 없음 - 대기 중이면 GPTScheduler 대기열에서 빠지고, 생성 중이면 업스트림을 끊음
+        for task in list(session_gpt_tasks):
+            task.cancel()
+        await chat_hub.unregister(conn)
+        await bus.set_presence(username, False)    # 퇴장 delta (debounce 후)
+
 
+# 접속 시 보낼 히스토리 결정 → (메시지 목록, 증분 여부, 화면 리셋 여부)
+# 반환: (HistorySlice, 증분 여부, 화면 새로 그리기 여부). 최근 메시지는 history_cache 에서, 없으면 DB
+async def load_sync_history(after_id):
+    try:
+        after_id = int(after_id) if after_id is not None else None
+    except (TypeError, ValueError):     # hello 의 after_id 가 숫자가 아닌 값(리스트 등)
+        after_id = None
 
-# 유저 목록 브로드캐스트
-async def broadcast_user_list():
-    print("📡 유저 목록 전송")
-    disconnected_clients = []
-    users_list = list(connected_clients.keys()) # 유저 이름 리스트
+    if after_id is None:
+        return await load_today_history(), False, False
+
+    newer = history_cache.after(after_id, SYNC_LIMIT + 1)
+    if newer is None:
+        newer = slice_from_messages(await load_messages_after(after_id, SYNC_LIMIT + 1))
+    if newer.count > SYNC_LIMIT:
+        # 너무 오래 끊겨 있었음 → 처음 접속한 것처럼 오늘 메시지로 화면을 새로 그리게 함
+        return await load_today_history(), False, True
+    return newer, True, False
 
-    packet = json.dumps({
-        "type" : "user_list",
-        "users": users_list
-    })
 
-    for username, client in list(connected_clients.items()):  # ✅ 리스트로 복사
-        try:
-            await client.send_text(packet)
-        except Exception as e:
-            print(f"❌ 유저 목록 전송 실패: {username} → {e}")
-            disconnected_clients.append(username)
+async def load_today_history():
+    history = history_cache.today()
+    if history is None:
+        history = slice_from_messages(await load_today_messages())
+    return history
 
-    # 끊긴 클라이언트 제거
-    for username in disconnected_clients:
-        connected_clients.pop(username, None)  # 안전하게 제거
 
+# 방금 저장한 메시지 → DB 에서 읽었을 때(row_to_message)와 같은 모양 (history_cache 용)
+def stored_message(message_id, sender, message_text, now, avatar, file_info, room=LOBBY_ROOM) -> dict:
+    message = {
+        "id": message_id,
+        "sender": sender,
+        "message": message_text,
+        "timestamp": now.strftime("%Y-%m-%d %H:%M:%S"),
+        "avatar": avatar
+    }
+    if file_info:
+        message["file"] = {k: file_info[k] for k in ("id", "name", "type", "size")}
+    if room != LOBBY_ROOM:
+        message["room"] = room
+    return message
+
+
+# 진행 중인 GPT 답변 task (참조를 잡아 두지 않으면 도중에 GC 될 수 있음)
+gpt_tasks = set()
+
+
+async def stream_gpt_reply(conn, username: str, reply_id: str, prompt: str):
+    """
+    GPT 답변을 질문자에게만 전달
+    - 예산 확인 결과와 대기 순번은 {"type": "gpt_status", "reply_id", "budget" | "position"} 로 (0 = 생성 시작)
+    - 조각은 GPT_DELTA_INTERVAL 마다 모아서 {"type": "gpt_delta", "reply_id", "delta"} 로 전송
+      (직전 전송 후 간격이 지났으면 바로, 아니면 타이머로 간격이 찰 때 → 업스트림이 멈춰도 모인 조각은 나감)
+      첫 조각은 바로 나감 → 체감 지연 = 첫 토큰까지의 시간
+    - 끝나면 전체 답변을 예전과 같은 message 패킷으로 한 번 더 (done: True)
+      → 화면 내용을 확정, gpt_delta 를 모르는 예전 클라이언트도 그대로 동작
+    """
+    loop = asyncio.get_running_loop()
+    parts, pending = [], []
+    last_sent = loop.time() - GPT_DELTA_INTERVAL     # 첫 조각은 기다리지 않고 바로
+    flush_timer = None
+
+    def flush():
+        nonlocal last_sent, flush_timer
+        if flush_timer is not None:
+            flush_timer.cancel()
+            flush_timer = None
+        if pending and not conn.closed:
+            conn.enqueue(json.dumps({"type": "gpt_delta", "reply_id": reply_id, "delta": "".join(pending)}))
+            last_sent = loop.time()
+        pending.clear()
+
+    def notify(status: dict):
+        if not conn.closed:
+            conn.enqueue(json.dumps({"type": "gpt_status", "reply_id": reply_id, **status}))
+
+    stream = stream_gpt_with_tracking(prompt, username, notify)
+    try:
+        async for delta in stream:
+            if conn.closed:
+                break       # 질문자가 나갔으면 생성 중단
+            parts.append(delta)
+            pending.append(delta)
+            wait = last_sent + GPT_DELTA_INTERVAL - loop.time()
+            if wait <= 0:
+                flush()
+            elif flush_timer is None:
+                flush_timer = loop.call_later(wait, flush)
+    finally:
+        await stream.aclose()   # 업스트림 연결과 동시 요청 슬롯을 바로 반납
+        flush()
+    if conn.closed:
+        return
+
+    gpt_packet = {
+        "type": "message",
+        "sender": "GPT",
+        "message": "".join(parts),
+        "avatar": gpt_avatar_hash,
+        "reply_id": reply_id,   # 고유 식별자 추가
+        "done": True
+    }
+    conn.enqueue(json.dumps(gpt_packet))
+
+
+# 속도 제한 예산 종류 (rate_limit.py). None 이면 제한 없음 (메모리만 건드리는 가벼운 요청)
+RATE_EXEMPT = {"pong", "ping", "avatar_get", "update_read_id", "presence_sync"}
+
+
+def packet_kind(data_packet: dict) -> Optional[str]:
+    packet_type = data_packet.get("type")
+    if packet_type in RATE_EXEMPT:
+        return None
+    if packet_type in (None, "message"):
+        message = data_packet.get("message")
+        return "gpt" if isinstance(message, str) and message.startswith("#") else "text"
+    if packet_type == "private_room":
+        return "text"
+    return "control"
+
+
+def throttle_packet(kind: str, retry_after: float, data_packet: dict) -> str:
+    packet = {"type": "throttle", "kind": kind, "retry_after": retry_after, "request": data_packet.get("type")}
+    if isinstance(data_packet.get("client_id"), str):
+        packet["client_id"] = data_packet["client_id"][:64]     # 클라이언트가 이 메시지를 다시 보낼 수 있도록
+    return json.dumps(packet)
+
+
+# 패킷의 "room" (없으면 lobby) → 이 사용자가 구성원이면 방 이름, 아니면 None
+def requested_room(data_packet: dict, username: str) -> Optional[str]:
+    if data_packet.get("room") is None:
+        return LOBBY_ROOM
+    room = normalize_room(data_packet.get("room"))
+    if room is None or not rooms.is_member(room, username):
+        return None
+    return room
+
+
+def room_error(room, reason: str) -> str:
+    return json.dumps({"type": "room_error", "room": room if isinstance(room, str) else None, "reason": reason})
+
+
+# 검색 기간 필터 "YYYY-MM-DD" → 그날 00:00 (형식이 틀리면 필터 없음)
+def parse_search_date(value) -> Optional[datetime]:
+    try:
+        parsed = datetime.strptime(str(value), "%Y-%m-%d") if value else None
+    except ValueError:
+        return None
+    # epoch 이전/아주 먼 날짜는 timestamp() 나 +1일 계산이 실패할 수 있음 → 필터 없음
+    return parsed if parsed is None or 1970 < parsed.year < 9999 else None
+
+
+# 읽은 위치 이동 → DB 기록은 이 워커의 read_state 가 묶어서, 읽음 표시는 모든 워커가 수가 바뀐 구간만 알림
+def advance_read_position(username: str, message_id):
+    # 이 워커가 아는 최신 lobby 메시지보다 큰 ID 는 거기까지만 인정
+    message_id = read_state.update(username, message_id, receipts.latest_id)
+    if message_id is not None:
+        bus.publish("read", {"username": username, "message_id": message_id})
+
+
+# ---------------------------------------------------------------------------
+# bus 이벤트 핸들러 - 이벤트를 보낸 워커를 포함한 모든 워커에서 실행
+# 각 워커는 자기에게 연결된 소켓과 자기 메모리 상태(history_cache, receipts)만 갱신
+# ---------------------------------------------------------------------------
+def on_bus_broadcast(payload):
+    room = payload.get("room", LOBBY_ROOM)
+    if room == LOBBY_ROOM:
+        chat_hub.broadcast(payload["text"])
+    else:
+        # 방 구성원 색인으로 O(방 인원) 전달
+        rooms.note_fanout(chat_hub.send_to_many(rooms.members_of(room), payload["text"]))
+
+
+def on_bus_private(payload):
+    text = payload["text"]
+    receiver = payload.get("receiver")
+    chat_hub.send_to_many(set(payload["users"]) - {receiver}, text)
+    # 받는 사람이 이 워커에 연결돼 있으면 전달 완료 (어느 워커에도 없으면 다음 접속 때 전달)
+    if receiver is not None and chat_hub.send_to(receiver, text) and payload.get("id"):
+        return mark_private_delivered([payload["id"]])
+
+
+def on_bus_notice(payload):
+    notice_hub.broadcast(payload["text"])
+    chat_hub.broadcast(payload["text"], channel="notice")   # /mux 연결은 같은 소켓의 notice 채널로
+
+
+def on_bus_message_saved(payload):
+    message = payload["message"]
+    if message.get("room", LOBBY_ROOM) != LOBBY_ROOM:
+        return      # 읽음 표시와 최근 메시지 버퍼는 lobby 만 (방 히스토리는 DB 의 (room, id) 인덱스로)
+    receipts.note_message(message["id"])
+    history_cache.append(message, payload["ts"])
+
+
+def on_bus_read(payload):
+    delta = receipts.advance(payload["username"], payload["message_id"])
+    if delta is not None:
+        chat_hub.broadcast(json.dumps(delta))
+
+
+def on_bus_read_join(payload):
+    delta = receipts.join(payload["username"], payload["position"])
+    if delta is not None:
+        chat_hub.broadcast(json.dumps(delta))
+
+
+def on_bus_room_member(payload):
+    rooms.apply(payload)
+
+
+def on_bus_presence(payload):
+    presence.mark_dirty()   # 입장/퇴장은 잠시 모아서 delta 한 번으로
+
+
+# 접속자 delta 는 이 워커의 연결 전체에게 (끊긴 클라이언트는 writer task 에서 hub 로부터 제거됨)
+presence.broadcast = chat_hub.broadcast
+
+
+bus.subscribe("broadcast", on_bus_broadcast)
+bus.subscribe("private", on_bus_private)
+bus.subscribe("notice", on_bus_notice)
+bus.subscribe("message_saved", on_bus_message_saved)
+bus.subscribe("read", on_bus_read)
+bus.subscribe("read_join", on_bus_read_join)
+bus.subscribe("presence", on_bus_presence)
+bus.subscribe("room_member", on_bus_room_member)
+
+
+# 브로드캐스트 상태 확인용 (연결 수, 큐 적재량, 전송 지연 p50/p99)
+@app.get("/stats")
+async def stats():
+    return {
+        "chat": chat_hub.stats(),
+        "notice": notice_hub.stats(),
+        "bus": bus.stats(),
+        "presence": presence.stats(),
+        "thumbnails": thumbnail_service.stats(),
+        "db_writer": message_writer.stats(),
+        "read_state": read_state.stats(),
+        "receipts": receipts.stats(),
+        "history_cache": history_cache.stats(),
+        "maintenance": maintenance.stats(),
+        "reaper": reaper.stats(),
+        "rooms": rooms.stats(),
+        "rate_limit": rate_limiter.stats(),
+        "gpt": gpt_client.stats(),
+        "gpt_cache": {**gpt_cache.stats(), "entries": await gpt_cache.count()},
+        "gpt_scheduler": gpt_scheduler.stats(),
+        "gpt_usage": {**usage_ledger.stats(), "month": await usage_ledger.month_total()},
+    }
+
+
+# GPT 월 사용량 (전체 합계 + 사용자별 상위) - gpt_usage_monthly 합계 테이블만 읽음
+@app.get("/gpt/usage")
+async def gpt_usage(month: Optional[str] = None, limit: int = 50):
+    month = month or current_month()
+    return {
+        "month": month,
+        "total": await usage_ledger.month_total(month),
+        "users": await usage_ledger.month_by_user(month, max(1, min(limit, 500))),
+        "user_budget": usage_ledger.user_budget,
+        "month_budget": usage_ledger.month_budget,
+    }
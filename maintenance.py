@@ -0,0 +1,252 @@
+# maintenance.py
+# chat_log.db 백그라운드 유지보수 - 한가할 때(최근 IDLE_SECONDS 동안 메시지 저장이 없을 때)만 실행
+# - 보관(archive): ARCHIVE_AFTER_DAYS 보다 오래된 메시지를 월별 gzip JSONL 파일로 옮기고 DB 에서 삭제
+#   archive/messages-2025-04.jsonl.gz (한 줄 = row_to_message 와 같은 모양의 메시지 하나)
+# - 증분 VACUUM: 삭제로 생긴 빈 페이지를 조금씩 파일에서 반환 (auto_vacuum=INCREMENTAL)
+#   새 DB 는 처음부터 INCREMENTAL. 예전 DB 를 바꾸려면 전체 VACUUM 이 필요해서 자동으로 하지 않음
+#   → DANI_DB_VACUUM_CONVERT=1 로 시작하면 서버 시작 단계(접속 받기 전)에서 1회 전환, 아니면 증분 VACUUM 생략
+# - WAL 체크포인트: 매 주기 PASSIVE, 한가할 때 TRUNCATE 로 -wal 파일 크기 제한
+# - ANALYZE: 하루 1번 (쿼리 플래너 통계 갱신)
+import asyncio
+import glob
+import gzip
+import json
+import os
+import re
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from database import pool, message_writer, MESSAGE_SELECT, row_to_message, LOBBY_ROOM
+
+ARCHIVE_DIR = "archive"
+ARCHIVE_AFTER_DAYS = int(os.getenv("DANI_ARCHIVE_DAYS", "180"))    # 이보다 오래된 메시지는 보관 파일로
+ARCHIVE_BATCH = 2000            # 한 트랜잭션에서 옮길 메시지 수
+MAINTENANCE_INTERVAL = 300      # 유지보수 확인 주기 (초)
+IDLE_SECONDS = 120              # 이 시간 동안 메시지 저장이 없으면 한가한 것으로 봄
+VACUUM_PAGES = 2000             # 증분 VACUUM 한 번에 반환할 최대 페이지 수
+ANALYZE_INTERVAL = 24 * 3600
+VACUUM_CONVERT = os.getenv("DANI_DB_VACUUM_CONVERT", "0") == "1"
+
+_MONTH_RE = re.compile(r"messages-(\d{4}-\d{2})\.jsonl\.gz$")
+ARCHIVE_MONTH_RE = re.compile(r"^\d{4}-\d{2}$")     # 보관 파일 단위 "YYYY-MM"
+
+
+def is_archive_month(month) -> bool:
+    return isinstance(month, str) and ARCHIVE_MONTH_RE.fullmatch(month) is not None
+
+
+def archive_path(month: str) -> str:
+    if not is_archive_month(month):
+        raise ValueError(f"잘못된 보관 월: {month!r}")     # 파일 이름에 그대로 들어가므로 archive/ 밖을 가리키지 않도록
+    return os.path.join(ARCHIVE_DIR, f"messages-{month}.jsonl.gz")
+
+
+def _append_archive(month: str, messages: list):
+    # gzip 은 이어 붙이면 멤버가 하나 더 생기고, gzip.open 으로 읽으면 전체가 이어서 읽힘
+    data = "".join(json.dumps(m, ensure_ascii=False) + "\n" for m in messages).encode("utf-8")
+    with open(archive_path(month), "ab") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="ab") as f:
+            f.write(data)
+        raw.flush()
+        os.fsync(raw.fileno())     # DB 에서 지우기 전에 디스크에 확실히 기록
+
+
+def _scan_archive(path: str, text: str, sender: Optional[str], room: str, limit: int) -> list:
+    found, seen = [], set()
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            message = json.loads(line)
+            if message["id"] in seen:
+                continue    # 보관 도중 서버가 죽어서 두 번 기록된 줄
+            seen.add(message["id"])
+            if message.get("room", LOBBY_ROOM) != room:
+                continue
+            if sender and message["sender"] != sender:
+                continue
+            if text.lower() in message["message"].lower():
+                found.append(message)
+    return found[-limit:]
+
+
+class MaintenanceScheduler:
+    def __init__(self, interval: float = MAINTENANCE_INTERVAL):
+        self.interval = interval
+        self.task: Optional[asyncio.Task] = None
+        self.last_analyze: Optional[float] = None
+        self.archived = 0
+        self.vacuumed_pages = 0
+        self.checkpoints = 0
+        self.auto_vacuum: Optional[int] = None     # PRAGMA auto_vacuum (2 = INCREMENTAL)
+        self.runs = 0
+        self.last_run: Optional[str] = None
+        self.last_error: Optional[str] = None
+        self.is_leader: Callable[[], bool] = lambda: True
+
+    def start(self, is_leader: Optional[Callable[[], bool]] = None):
+        """is_leader: 워커가 여러 개일 때 이 워커가 유지보수 담당인지 (bus.is_leader)"""
+        os.makedirs(ARCHIVE_DIR, exist_ok=True)
+        if is_leader is not None:
+            self.is_leader = is_leader
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    def is_idle(self) -> bool:
+        return time.perf_counter() - message_writer.last_write >= IDLE_SECONDS
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self.is_leader():
+                continue
+            try:
+                await self.run_once()
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"⚠️ DB 유지보수 실패: {e}")
+
+    async def run_once(self, force: bool = False):
+        await self.checkpoint("PASSIVE")
+        if not force and not self.is_idle():
+            return
+        moved = await self.archive_old_messages()
+        await self.incremental_vacuum()
+        await self.checkpoint("TRUNCATE")
+        if force or self.last_analyze is None or time.monotonic() - self.last_analyze >= ANALYZE_INTERVAL:
+            await self.analyze()
+        self.runs += 1
+        self.last_run = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        if moved:
+            print(f"🗄️ 오래된 메시지 {moved}건 보관 파일로 이동")
+
+    async def archive_old_messages(self) -> int:
+        cutoff = int((datetime.now() - timedelta(days=ARCHIVE_AFTER_DAYS)).timestamp())
+        moved = 0
+        while True:
+            async with pool.write() as db:
+                cursor = await db.execute(MESSAGE_SELECT + """
+                    WHERE m.ts < ?
+                    ORDER BY m.id
+                    LIMIT ?
+                """, (cutoff, ARCHIVE_BATCH))
+                rows = await cursor.fetchall()
+                if not rows:
+                    break
+
+                by_month = defaultdict(list)
+                for row in rows:
+                    message = row_to_message(row)
+                    by_month[message["timestamp"][:7]].append(message)
+                # 파일에 먼저 기록(fsync)한 뒤 DB 에서 삭제 (FTS 색인은 트리거가 같이 지움)
+                for month, messages in by_month.items():
+                    await asyncio.to_thread(_append_archive, month, messages)
+                await db.executemany("DELETE FROM messages WHERE id = ?", [(row[0],) for row in rows])
+                await db.commit()
+            moved += len(rows)
+            self.archived += len(rows)
+            if not self.is_idle():
+                break   # 대화가 다시 시작되면 다음 주기에 이어서
+        return moved
+
+    async def convert_auto_vacuum(self) -> bool:
+        """
+        예전 DB 를 auto_vacuum=INCREMENTAL 로 전환 (전체 VACUUM → DB 크기만큼 시간이 걸리고 그동안 쓰기 불가)
+        서버 시작 단계에서만 호출 (DANI_DB_VACUUM_CONVERT=1). 전환했으면 True
+        """
+        async with pool.write() as db:
+            async with db.execute("PRAGMA auto_vacuum") as cursor:
+                mode = (await cursor.fetchone())[0]
+            if mode == 2:
+                self.auto_vacuum = mode
+                return False
+            print("⏳ auto_vacuum=INCREMENTAL 전환 중 (전체 VACUUM)...")
+            await db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            await db.execute("VACUUM")
+        self.auto_vacuum = 2
+        print("✅ auto_vacuum=INCREMENTAL 전환 완료")
+        return True
+
+    async def incremental_vacuum(self):
+        async with pool.write() as db:
+            async with db.execute("PRAGMA auto_vacuum") as cursor:
+                mode = (await cursor.fetchone())[0]
+            if mode != 2:
+                # 예전 DB: 전환에 전체 VACUUM 이 필요 → 대화 중에 쓰기 연결을 오래 잡지 않도록 여기서는 하지 않음
+                if self.auto_vacuum is None:
+                    print("ℹ️ auto_vacuum 이 INCREMENTAL 이 아니라 증분 VACUUM 생략 (DANI_DB_VACUUM_CONVERT=1 로 시작하면 전환)")
+                self.auto_vacuum = mode
+                return
+            self.auto_vacuum = mode
+            async with db.execute("PRAGMA freelist_count") as cursor:
+                free = (await cursor.fetchone())[0]
+            if free:
+                await db.execute(f"PRAGMA incremental_vacuum({min(free, VACUUM_PAGES)})")
+                await db.commit()
+                self.vacuumed_pages += min(free, VACUUM_PAGES)
+
+    async def checkpoint(self, mode: str):
+        async with pool.write() as db:
+            await db.execute(f"PRAGMA wal_checkpoint({mode})")
+        self.checkpoints += 1
+
+    async def analyze(self):
+        async with pool.write() as db:
+            await db.execute("PRAGMA analysis_limit=1000")     # 큰 테이블도 표본만 보고 빠르게
+            await db.execute("ANALYZE")
+            await db.commit()
+        self.last_analyze = time.monotonic()
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "last_run": self.last_run,
+            "last_error": self.last_error,
+            "archived": self.archived,
+            "vacuumed_pages": self.vacuumed_pages,
+            "checkpoints": self.checkpoints,
+            "auto_vacuum": self.auto_vacuum,
+            "archive_after_days": ARCHIVE_AFTER_DAYS,
+        }
+
+
+def archive_months() -> list:
+    months = []
+    for path in glob.glob(os.path.join(ARCHIVE_DIR, "messages-*.jsonl.gz")):
+        match = _MONTH_RE.search(path)
+        if match:
+            months.append(match.group(1))
+    return sorted(months, reverse=True)
+
+
+# 보관된 메시지 검색 (필요할 때만 파일을 풀어서 찾음, 최신 월부터)
+# month("YYYY-MM") 를 주면 그 달만 (형식이 다르면 ValueError). 반환: 최신 메시지부터 최대 limit 개
+async def search_archive(text: str, sender: Optional[str] = None, month: Optional[str] = None,
+                         limit: int = 50, room: str = LOBBY_ROOM) -> list:
+    if month is not None and not is_archive_month(month):
+        raise ValueError(f"잘못된 보관 월: {month!r}")
+    text = text.strip()
+    if not text:
+        return []
+    results = []
+    for m in ([month] if month else archive_months()):
+        path = archive_path(m)
+        if not os.path.exists(path):
+            continue
+        found = await asyncio.to_thread(_scan_archive, path, text, sender, room, limit - len(results))
+        results.extend(reversed(found))
+        if len(results) >= limit:
+            break
+    return results[:limit]
+
+
+maintenance = MaintenanceScheduler()
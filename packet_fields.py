@@ -0,0 +1,73 @@
+# packet_fields.py
+# 클라이언트 패킷 필드 검사 - 잘못된 값 하나(숫자 자리에 문자열, 해시 자리에 리스트 등) 때문에 세션 전체가 끊기지 않도록
+# 검사 함수는 값이 잘못되면 PacketError 를 던지고, 수신 루프는 그 패킷만 {"type": "packet_error"} 로 거절한 뒤 계속 받음
+# 값이 없으면(None, "") 예외 없이 기본값
+import json
+import re
+from typing import Optional
+
+SHA256_RE = re.compile(r"^[0-9a-f]{64}$")     # 아바타/첨부파일 내용 해시 (소문자 16진수 64글자)
+MONTH_RE = re.compile(r"^\d{4}-\d{2}$")         # 월 단위 필터 "YYYY-MM"
+SQLITE_MAX_INT = 2 ** 63 - 1                   # 이보다 큰 정수는 SQLite 에 바인딩할 수 없음 (OverflowError)
+
+
+def is_sha256(value) -> bool:
+    return isinstance(value, str) and SHA256_RE.match(value) is not None
+
+
+class PacketError(ValueError):
+    """클라이언트 패킷의 필드 값이 잘못됨 → 세션은 유지하고 그 패킷만 거절"""
+
+    def __init__(self, field: str):
+        super().__init__(field)
+        self.field = field
+
+    def packet(self, data_packet: dict) -> str:
+        return json.dumps({"type": "packet_error", "request": data_packet.get("type"), "field": self.field})
+
+
+def packet_str(data_packet: dict, field: str, default: Optional[str] = None,
+               max_len: Optional[int] = None) -> Optional[str]:
+    """문자열 필드 (max_len 을 주면 그 길이까지만)"""
+    value = data_packet.get(field)
+    if value is None or value == "":
+        return default
+    if not isinstance(value, str):
+        raise PacketError(field)
+    return value[:max_len] if max_len else value
+
+
+def packet_int(data_packet: dict, field: str, default: int,
+               low: Optional[int] = None, high: Optional[int] = None) -> int:
+    """정수 필드 (정수 문자열도 허용, 0/없으면 default). low~high (기본은 SQLite 정수 범위) 로 맞춤"""
+    value = data_packet.get(field)
+    if not value:
+        return default
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise PacketError(field)
+    try:
+        value = int(value)
+    except ValueError:
+        raise PacketError(field)
+    value = max(-SQLITE_MAX_INT if low is None else low, value)
+    return min(SQLITE_MAX_INT if high is None else high, value)
+
+
+def packet_month(data_packet: dict, field: str) -> Optional[str]:
+    """월 필드 "YYYY-MM" (없으면 None)"""
+    value = data_packet.get(field)
+    if value is None or value == "":
+        return None
+    if not isinstance(value, str) or MONTH_RE.fullmatch(value) is None:
+        raise PacketError(field)
+    return value
+
+
+def packet_hash(data_packet: dict, field: str) -> Optional[str]:
+    """sha256 해시 필드 (없으면 None)"""
+    value = data_packet.get(field)
+    if value is None or value == "":
+        return None
+    if not is_sha256(value):
+        raise PacketError(field)
+    return value
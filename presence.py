@@ -0,0 +1,75 @@
+# presence.py
+# 접속자 목록: 버전이 붙은 스냅샷 + 입장/퇴장 변화분(delta)
+# - 접속/종료가 몰려도(아침 9시) PRESENCE_DEBOUNCE 동안 모아서 delta 1번 → 연결마다 전체 목록을 보내지 않음
+# - 버전은 delta 마다 1씩 증가. 클라이언트는 버전이 건너뛰면 presence_sync 로 스냅샷을 다시 요청
+#
+# /mux 에서는 presence 채널 ("ch": "presence")
+#   user_list      {"users": [...], "version": 12}                  (접속 직후 / presence_sync 응답)
+#   presence_delta {"version": 13, "joined": [...], "left": [...]}
+import asyncio
+import json
+from typing import Optional
+
+from bus import bus
+
+PRESENCE_DEBOUNCE = 0.25    # 초
+
+
+class PresenceTracker:
+    def __init__(self, debounce: float = PRESENCE_DEBOUNCE):
+        self.debounce = debounce
+        self.online = set()         # 마지막으로 알린 접속자 (모든 워커 기준)
+        self.version = 0
+        self.flush_handle: Optional[asyncio.Task] = None
+        self.dirty = False          # 마지막 flush 가 접속자 목록을 읽은 뒤에 이벤트가 있었음
+        self.broadcast = None       # delta 를 이 워커의 연결들에게 보내는 함수 (main.py 에서 연결)
+        self.deltas = 0
+        self.coalesced = 0
+
+    def snapshot(self) -> str:
+        return json.dumps({"ch": "presence", "type": "user_list", "users": sorted(self.online), "version": self.version})
+
+    def mark_dirty(self):
+        """presence 이벤트마다 호출 - 이미 대기 중이면 그 flush 에 합쳐짐"""
+        self.dirty = True
+        if self.flush_handle is not None and not self.flush_handle.done():
+            self.coalesced += 1
+            return
+        self.flush_handle = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self):
+        # flush 가 bus.online_users() 를 기다리는 동안 들어온 이벤트는 그 목록에 빠졌을 수 있음 → dirty 면 한 번 더
+        while self.dirty:
+            await asyncio.sleep(self.debounce)
+            self.dirty = False
+            await self.flush()
+
+    async def flush(self):
+        # 이벤트를 하나씩 적용하지 않고 현재 접속자 목록과 비교 (순서가 뒤섞이거나 유실돼도 결과가 맞음)
+        current = set(await bus.online_users())
+        joined = sorted(current - self.online)
+        left = sorted(self.online - current)
+        if not joined and not left:
+            return
+        self.online = current
+        self.version += 1
+        self.deltas += 1
+        if self.broadcast is not None:
+            self.broadcast(json.dumps({
+                "ch": "presence",
+                "type": "presence_delta",
+                "version": self.version,
+                "joined": joined,
+                "left": left
+            }))
+
+    def stats(self) -> dict:
+        return {
+            "online": len(self.online),
+            "version": self.version,
+            "deltas": self.deltas,
+            "coalesced": self.coalesced,
+        }
+
+
+presence = PresenceTracker()
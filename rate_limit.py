@@ -0,0 +1,147 @@
+# rate_limit.py
+# 토큰 버킷 기반 수신 속도 제한 (/ws, /mux 수신 루프와 /files 업로드 시작)
+# 멈춘 재시도 루프나 이미지 50개 드래그가 이벤트 루프와 DB writer 를 혼자 차지하지 않도록
+# - 연결별 버킷 + 사용자별 버킷 (같은 이름의 여러 연결이 나눠 씀, 워커 단위)
+# - 종류별 예산
+#     text    : 일반 메시지, 1:1 메시지 (파일 참조 메시지 포함)
+#     file    : 업로드 시작 (/files upload_init)
+#     gpt     : # 질문
+#     control : 검색, 이전 메시지, 방/아바타 요청 등 그 밖의 요청
+# - 초과하면 처리하지 않고 {"type": "throttle", "kind", "retry_after"} 응답 → 클라이언트가 그만큼 쉬었다가 다시 보냄
+# - throttle 을 무시하고 계속 보내는 연결은 끊음
+# DANI_RATE_<KIND>="초당 개수,버스트" (연결 기준), 사용자 버킷은 DANI_RATE_USER_FACTOR 배
+import os
+import time
+from collections import defaultdict, deque
+from typing import Dict
+
+DEFAULT_LIMITS = {
+    "text": (3.0, 15),
+    "file": (1.0, 20),
+    "gpt": (0.1, 3),        # 10초에 1번, 연속 3번까지
+    "control": (10.0, 40),
+}
+USER_FACTOR = float(os.getenv("DANI_RATE_USER_FACTOR", "2"))
+STRIKE_LIMIT = 30           # STRIKE_WINDOW 안에 이만큼 throttle 되면 연결을 끊음
+STRIKE_WINDOW = 10.0        # 초
+PRUNE_EVERY = 1000          # 사용자 버킷 정리 주기 (연결 생성 횟수)
+
+
+def _load_limits() -> dict:
+    limits = {}
+    for kind, default in DEFAULT_LIMITS.items():
+        value = os.getenv(f"DANI_RATE_{kind.upper()}")
+        try:
+            rate, burst = (float(v) for v in value.split(",")) if value else default
+        except ValueError:
+            print(f"⚠️ 잘못된 DANI_RATE_{kind.upper()}={value}, 기본값 사용")
+            rate, burst = default
+        limits[kind] = (rate, burst)
+    return limits
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now: float, cost: float = 1.0) -> float:
+        """토큰을 쓰면 0, 모자라면 다시 시도할 수 있을 때까지 남은 초"""
+        self._refill(now)
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate if self.rate > 0 else 60.0
+
+    def refund(self, cost: float = 1.0):
+        self.tokens = min(self.burst, self.tokens + cost)
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+class ConnectionLimits:
+    """연결 하나의 버킷 (사용자 버킷은 RateLimiter 가 공유)"""
+
+    def __init__(self, limiter: "RateLimiter", username: str):
+        self.limiter = limiter
+        self.username = username
+        self.buckets = {kind: TokenBucket(rate, burst) for kind, (rate, burst) in limiter.limits.items()}
+        self.strikes = deque()
+
+    def check(self, kind: str) -> float:
+        """허용이면 0, 아니면 retry_after (초)"""
+        now = time.monotonic()
+        bucket = self.buckets.get(kind)
+        if bucket is None:
+            return 0.0
+        retry_after = bucket.take(now)
+        if not retry_after:
+            retry_after = self.limiter.user_bucket(self.username, kind).take(now)
+            if retry_after:
+                bucket.refund()     # 사용자 예산에서 막혔으면 연결 토큰은 돌려줌
+        self.limiter.record(kind, bool(retry_after))
+        if retry_after:
+            self.strikes.append(now)
+            while self.strikes and self.strikes[0] < now - STRIKE_WINDOW:
+                self.strikes.popleft()
+        return round(retry_after, 3)
+
+    def abusive(self) -> bool:
+        """throttle 응답을 무시하고 계속 보내는 중"""
+        return len(self.strikes) >= STRIKE_LIMIT
+
+
+class RateLimiter:
+    def __init__(self):
+        self.limits = _load_limits()
+        self.users: Dict[tuple, TokenBucket] = {}     # (username, kind) → 버킷
+        self.allowed = defaultdict(int)
+        self.throttled = defaultdict(int)
+        self.disconnected = 0
+        self.created = 0
+
+    def connection(self, username: str) -> ConnectionLimits:
+        self.created += 1
+        if self.created % PRUNE_EVERY == 0:
+            self._prune()
+        return ConnectionLimits(self, username)
+
+    def user_bucket(self, username: str, kind: str) -> TokenBucket:
+        bucket = self.users.get((username, kind))
+        if bucket is None:
+            rate, burst = self.limits[kind]
+            bucket = self.users[(username, kind)] = TokenBucket(rate * USER_FACTOR, burst * USER_FACTOR)
+        return bucket
+
+    def _prune(self):
+        # 가득 찬 버킷은 새로 만든 것과 같음 → 지워도 동작이 바뀌지 않음
+        now = time.monotonic()
+        for key in [key for key, bucket in self.users.items() if bucket.is_full(now)]:
+            del self.users[key]
+
+    def record(self, kind: str, throttled: bool):
+        if throttled:
+            self.throttled[kind] += 1
+        else:
+            self.allowed[kind] += 1
+
+    def stats(self) -> dict:
+        return {
+            "limits": {kind: {"rate": rate, "burst": burst} for kind, (rate, burst) in self.limits.items()},
+            "user_factor": USER_FACTOR,
+            "allowed": dict(self.allowed),
+            "throttled": dict(self.throttled),
+            "disconnected": self.disconnected,
+            "user_buckets": len(self.users),
+        }
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,102 @@
+# read_state.py
+# 사용자별 마지막 읽은 메시지 ID - 메모리에서 갱신하고 DB(read_state)에는 주기적으로 한 번에 기록
+# 클라이언트가 스크롤할 때마다 읽은 위치를 보내도 쓰기는 FLUSH_INTERVAL 마다 1번 (upsert 묶음)
+import asyncio
+from typing import Dict, Optional
+
+from database import load_last_read_id, save_last_read_ids
+
+FLUSH_INTERVAL = 5.0    # 초
+
+
+class ReadStateTracker:
+    """읽은 위치는 앞으로만 이동 (늦게 도착한 예전 위치가 최신 위치를 덮어쓰지 않음)"""
+
+    def __init__(self, interval: float = FLUSH_INTERVAL):
+        self.interval = interval
+        self.positions: Dict[str, int] = {}     # username → 마지막 읽은 ID (메모리 기준 최신)
+        self.dirty: Dict[str, int] = {}         # 아직 DB 에 쓰지 않은 위치
+        self.task: Optional[asyncio.Task] = None
+        self.updates = 0
+        self.ignored = 0
+        self.clamped = 0
+        self.flushes = 0
+        self.flushed_rows = 0
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """주기 flush 중단 후 남은 위치 기록 (서버 종료 시)"""
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        await self.flush()
+
+    async def get(self, username: str) -> Optional[int]:
+        if username in self.positions:
+            return self.positions[username]
+        stored = await load_last_read_id(username)
+        if stored is not None:
+            # DB 를 읽는 동안 더 새로운 위치가 들어왔을 수 있음
+            self.positions[username] = max(stored, self.positions.get(username, stored))
+        return self.positions.get(username)
+
+    def update(self, username: str, message_id, latest_id: Optional[int] = None) -> Optional[int]:
+        """
+        메모리 위치만 갱신 (DB 쓰기 없음). 앞으로 이동한 경우에만 새 위치, 아니면 None
+        latest_id 를 주면 그보다 큰 ID(아직 없는 메시지)는 latest_id 까지만 읽은 것으로 봄
+        """
+        if isinstance(message_id, bool) or not isinstance(message_id, int) or message_id <= 0:
+            self.ignored += 1
+            return None
+        if latest_id is not None and message_id > latest_id:
+            message_id = latest_id
+            self.clamped += 1
+        current = self.positions.get(username)
+        if message_id <= 0 or (current is not None and message_id <= current):
+            self.ignored += 1
+            return None
+        self.positions[username] = message_id
+        self.dirty[username] = message_id
+        self.updates += 1
+        return message_id
+
+    async def flush(self):
+        if not self.dirty:
+            return
+        batch, self.dirty = self.dirty, {}
+        try:
+            await save_last_read_ids(batch.items())
+        except Exception as e:
+            print(f"⚠️ 읽은 위치 저장 실패 ({len(batch)}명): {e}")
+            for username, message_id in batch.items():     # 다음 주기에 다시 시도
+                if message_id > self.dirty.get(username, 0):
+                    self.dirty[username] = message_id
+            return
+        self.flushes += 1
+        self.flushed_rows += len(batch)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "tracked": len(self.positions),
+            "dirty": len(self.dirty),
+            "updates": self.updates,
+            "ignored": self.ignored,
+            "clamped": self.clamped,
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+        }
+
+
+read_state = ReadStateTracker()
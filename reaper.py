@@ -0,0 +1,123 @@
+# reaper.py
+# 하트비트 + 유휴 연결 정리 (/ws, /mux, /notice)
+# 노트북이 절전에 들어가면 TCP 는 끊겼는데 서버는 모른 채 접속자 목록에 몇 시간씩 남음
+# → 연결마다 sleep task 를 두지 않고 타이머 휠 하나(task 1개)로 모든 연결을 확인
+#   - 연결은 프레임을 받을 때마다 conn.touch() → last_seen 만 갱신 (휠은 건드리지 않음)
+#   - 휠이 한 칸 돌 때마다 그 칸에 있는 연결만 확인
+#       PING_INTERVAL 동안 조용했으면 {"type": "ping"} 전송 (클라이언트는 pong 으로 응답)
+#       IDLE_TIMEOUT 동안 아무 프레임도 없으면 소켓을 닫음 → 엔드포인트 finally 에서 정리 + 퇴장 처리
+#       아직 멀었으면 남은 시간 뒤 칸에 다시 등록
+# - JSON ping 에 답한다고 확인된 연결(conn.answers_ping)만 정리함
+#     /mux 연결, 그리고 ping/pong 패킷을 한 번이라도 보낸 /ws, /notice 연결
+#     예전 클라이언트(/ws, /notice 에 조용히 붙어만 있음)는 ping 만 받고 정리되지 않음
+#     → 끊긴 TCP 는 uvicorn 의 WebSocket 프로토콜 ping 으로 정리 (start_server.bat 의 --ws-ping-interval/--ws-ping-timeout)
+# DANI_PING_INTERVAL, DANI_IDLE_TIMEOUT (초) 로 조정
+import asyncio
+import json
+import math
+import os
+import time
+from typing import Optional
+
+PING_INTERVAL = float(os.getenv("DANI_PING_INTERVAL", "20"))
+IDLE_TIMEOUT = float(os.getenv("DANI_IDLE_TIMEOUT", "60"))
+WHEEL_TICK = 1.0        # 휠 한 칸 = 1초
+WHEEL_SLOTS = 64        # 한 바퀴보다 긴 대기는 확인 시점에 다시 등록됨
+
+IDLE_CLOSE_CODE = 1001  # Going Away
+PING_PACKET = json.dumps({"ch": "control", "type": "ping"})
+
+
+class Reaper:
+    def __init__(self, ping_interval: float = PING_INTERVAL, idle_timeout: float = IDLE_TIMEOUT,
+                 tick: float = WHEEL_TICK, slots: int = WHEEL_SLOTS):
+        self.ping_interval = ping_interval
+        self.idle_timeout = max(idle_timeout, ping_interval)
+        self.tick = tick
+        self.wheel = [[] for _ in range(slots)]
+        self.cursor = 0
+        self.task: Optional[asyncio.Task] = None
+        self.pings = 0
+        self.reaped = 0
+        self.checked = 0
+        self.last_tick_ms = 0.0
+        self.max_tick_ms = 0.0
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    def watch(self, conn):
+        """새 연결 등록 (연결이 닫히면 다음 확인 때 휠에서 빠짐)"""
+        conn.touch()
+        self._schedule(conn, self.ping_interval)
+
+    def _schedule(self, conn, delay: float):
+        ticks = min(max(1, math.ceil(delay / self.tick)), len(self.wheel) - 1)
+        self.wheel[(self.cursor + ticks) % len(self.wheel)].append(conn)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while True:
+            # sleep 오차가 쌓이지 않도록 절대 시각 기준
+            next_tick += self.tick
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+            started = time.perf_counter()
+            self.cursor = (self.cursor + 1) % len(self.wheel)
+            bucket, self.wheel[self.cursor] = self.wheel[self.cursor], []
+            now = time.monotonic()
+            for conn in bucket:
+                try:
+                    self._check(conn, now)
+                except Exception as e:
+                    print(f"⚠️ 연결 확인 실패 ({conn.username}): {e}")
+            self.last_tick_ms = (time.perf_counter() - started) * 1000
+            self.max_tick_ms = max(self.max_tick_ms, self.last_tick_ms)
+
+    def _check(self, conn, now: float):
+        if conn.closed:
+            return      # 이미 정리된 연결은 다시 등록하지 않음
+        self.checked += 1
+        idle = now - conn.last_seen
+        if idle >= self.idle_timeout and conn.answers_ping:
+            self._reap(conn, idle)
+        elif idle >= self.ping_interval:
+            if conn.enqueue(PING_PACKET):
+                self.pings += 1
+            # 예전 클라이언트는 정리 시각이 없으니 ping 주기로만 다시 확인
+            wait = min(self.ping_interval, self.idle_timeout - idle) if conn.answers_ping else self.ping_interval
+            self._schedule(conn, wait)
+        else:
+            self._schedule(conn, self.ping_interval - idle)
+
+    def _reap(self, conn, idle: float):
+        self.reaped += 1
+        print(f"💤 [{conn.hub.name}] {int(idle)}초 동안 응답 없어 연결 정리: {conn.username}")
+        # 브로드캐스트 대상에서 바로 빼고, 소켓을 닫으면 receive 가 끝나면서 엔드포인트가 퇴장 처리
+        conn.hub.discard(conn)
+        asyncio.ensure_future(conn.close(code=IDLE_CLOSE_CODE))
+
+    def stats(self) -> dict:
+        return {
+            "watched": sum(len(bucket) for bucket in self.wheel),
+            "ping_interval": self.ping_interval,
+            "idle_timeout": self.idle_timeout,
+            "pings": self.pings,
+            "reaped": self.reaped,
+            "checked": self.checked,
+            "last_tick_ms": round(self.last_tick_ms, 3),
+            "max_tick_ms": round(self.max_tick_ms, 3),
+        }
+
+
+reaper = Reaper()
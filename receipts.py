@@ -0,0 +1,100 @@
+# receipts.py
+# 메시지별 "안 읽은 사람 수" (읽음 표시)
+# - 사용자들의 읽은 위치를 정렬된 리스트로 유지 → 메시지 m 의 안 읽은 수 = 위치가 m 보다 작은 사용자 수 (bisect)
+# - 누군가의 위치가 old → new 로 이동하면 (old, new] 구간의 수만 하나씩 줄어듦
+#   → 메시지마다 다시 세지 않고 바뀐 구간만 계단 형태로 알림
+#
+# 알림 형식 (read_receipts)
+#   {"type": "read_receipts", "after": 10, "steps": [[14, 3], [20, 4]]}
+#   → id 11~14 는 3명, 15~20 은 4명이 안 읽음 (각 step 은 "앞 step 다음 ~ upper_id 까지 count")
+import bisect
+from typing import Dict, Optional
+
+
+class ReadReceipts:
+    def __init__(self):
+        self.positions: Dict[str, int] = {}     # username → 마지막 읽은 메시지 ID
+        self.sorted_positions = []              # positions 의 값들 (정렬 유지)
+        self.latest_id = 0                      # 지금까지 저장된 가장 큰 메시지 ID
+        self.deltas = 0
+
+    def load(self, positions: Dict[str, int], latest_id: int):
+        """서버 시작 시 read_state 전체로 초기화"""
+        self.positions = {u: p or 0 for u, p in positions.items()}
+        self.sorted_positions = sorted(self.positions.values())
+        self.latest_id = latest_id or 0
+
+    def note_message(self, message_id: int):
+        if message_id > self.latest_id:
+            self.latest_id = message_id
+
+    def unread_count(self, message_id: int) -> int:
+        return bisect.bisect_left(self.sorted_positions, message_id)
+
+    def steps(self, after_id: int, until_id: int) -> list:
+        """(after_id, until_id] 구간의 안 읽은 수 → [[upper_id, count], ...] (구간 안에 있는 읽은 위치 수 + 1 개)"""
+        positions = self.sorted_positions
+        result = []
+        lower = after_id
+        below = bisect.bisect_right(positions, lower)   # lower 이하까지 읽은 사람 수 = (lower, 다음 위치] 의 안 읽은 수
+        while lower < until_id:
+            upper = positions[below] if below < len(positions) and positions[below] < until_id else until_id
+            result.append([upper, below])
+            lower = upper
+            below = bisect.bisect_right(positions, lower, below)
+        return result
+
+    def snapshot(self, messages: list) -> Optional[dict]:
+        """히스토리/이전 메시지 한 묶음에 대한 현재 안 읽은 수"""
+        if not messages:
+            return None
+        return self.snapshot_range(messages[0]["id"], messages[-1]["id"])
+
+    def snapshot_range(self, first_id: Optional[int], last_id: Optional[int]) -> Optional[dict]:
+        if first_id is None:
+            return None
+        return self._packet(first_id - 1, self.steps(first_id - 1, last_id))
+
+    def join(self, username: str, position: Optional[int]) -> Optional[dict]:
+        """처음 보는 사용자 추가 - (position, 최신] 구간의 수가 하나씩 늘어남"""
+        if username in self.positions:
+            return None
+        position = min(position or 0, self.latest_id)
+        self.positions[username] = position
+        bisect.insort(self.sorted_positions, position)
+        return self._delta(position, self.latest_id)
+
+    def advance(self, username: str, message_id: int) -> Optional[dict]:
+        """읽은 위치 이동 (앞으로만). 바뀐 구간 (old, new] 의 알림 반환
+        아직 저장되지 않은 ID 는 최신 메시지까지만 (미래 메시지를 읽은 것으로 만들면 모두의 안 읽은 수가 틀어짐)"""
+        message_id = min(message_id, self.latest_id)
+        old = self.positions.get(username)
+        if old is None:
+            return self.join(username, message_id)
+        if message_id <= old:
+            return None
+        positions = self.sorted_positions
+        del positions[bisect.bisect_left(positions, old)]
+        bisect.insort(positions, message_id)
+        self.positions[username] = message_id
+        return self._delta(old, message_id)
+
+    def _delta(self, after_id: int, until_id: int) -> Optional[dict]:
+        if until_id <= after_id:
+            return None
+        self.deltas += 1
+        return self._packet(after_id, self.steps(after_id, until_id))
+
+    @staticmethod
+    def _packet(after_id: int, steps: list) -> dict:
+        return {"type": "read_receipts", "after": after_id, "steps": steps}
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self.positions),
+            "latest_id": self.latest_id,
+            "deltas": self.deltas,
+        }
+
+
+receipts = ReadReceipts()
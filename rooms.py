@@ -0,0 +1,99 @@
+# rooms.py
+# 방(채널) 구성원 색인 - room → 구성원 이름 집합 (모든 워커가 메모리에 같은 색인을 유지)
+# - 방 메시지는 구성원에게만 전달 → 메시지 하나의 비용이 전체 접속자 수가 아니라 방 인원 수에 비례
+# - lobby 는 모든 사용자가 자동으로 속한 기본 방 (구성원 목록 없이 전체 브로드캐스트)
+# - 참여/나가기는 room_members 에 기록한 뒤 bus "room_member" 이벤트로 모든 워커의 색인을 갱신
+from collections import defaultdict
+from typing import Dict, Optional, Set
+
+from bus import bus
+from database import LOBBY_ROOM, load_room_members, add_room_member, remove_room_member
+
+ROOM_NAME_MAX = 32
+
+
+def normalize_room(name) -> Optional[str]:
+    """클라이언트가 보낸 방 이름 검사 (잘못된 이름이면 None)"""
+    if not isinstance(name, str):
+        return None
+    name = name.strip()
+    if not name or len(name) > ROOM_NAME_MAX:
+        return None
+    return name
+
+
+class RoomRegistry:
+    def __init__(self):
+        self.members: Dict[str, Set[str]] = {}                      # room → 구성원
+        self.user_rooms: Dict[str, Set[str]] = defaultdict(set)    # username → 참여한 방 (lobby 제외)
+        self.room_messages = 0      # lobby 가 아닌 방으로 보낸 메시지 수 (이 워커 기준)
+        self.room_targets = 0       # 그 메시지들이 실제로 전달된 연결 수 합계
+
+    async def load(self):
+        """서버 시작 시 DB 의 구성원 목록으로 색인 생성"""
+        self.members = await load_room_members()
+        self.user_rooms = defaultdict(set)
+        for room, usernames in self.members.items():
+            for username in usernames:
+                self.user_rooms[username].add(room)
+        print(f"✅ 방 {len(self.members)}개 구성원 색인 적재")
+
+    def is_member(self, room: str, username: str) -> bool:
+        return room == LOBBY_ROOM or username in self.members.get(room, ())
+
+    def members_of(self, room: str) -> Set[str]:
+        return self.members.get(room, set())
+
+    def rooms_of(self, username: str) -> list:
+        return [LOBBY_ROOM] + sorted(self.user_rooms.get(username, ()))
+
+    def packet(self, username: str) -> dict:
+        """내가 참여한 방 + 참여할 수 있는 전체 방 목록 (인원 수 포함)"""
+        return {
+            "type": "rooms",
+            "joined": self.rooms_of(username),
+            "all": [{"name": room, "members": len(usernames)}
+                    for room, usernames in sorted(self.members.items())]
+        }
+
+    async def join(self, room: str, username: str) -> bool:
+        """방 참여 (없으면 새로 만듦). 새로 참여했으면 True"""
+        if room == LOBBY_ROOM:
+            return False
+        if not await add_room_member(room, username):
+            return False
+        bus.publish("room_member", {"room": room, "username": username, "joined": True})
+        return True
+
+    async def leave(self, room: str, username: str) -> bool:
+        if room == LOBBY_ROOM:
+            return False
+        if not await remove_room_member(room, username):
+            return False
+        bus.publish("room_member", {"room": room, "username": username, "joined": False})
+        return True
+
+    def apply(self, payload: dict):
+        """bus "room_member" 이벤트 → 이 워커의 색인 갱신"""
+        room, username = payload["room"], payload["username"]
+        if payload["joined"]:
+            self.members.setdefault(room, set()).add(username)
+            self.user_rooms[username].add(room)
+        else:
+            self.members.get(room, set()).discard(username)
+            self.user_rooms.get(username, set()).discard(room)
+
+    def note_fanout(self, targets: int):
+        self.room_messages += 1
+        self.room_targets += targets
+
+    def stats(self) -> dict:
+        return {
+            "rooms": len(self.members),
+            "memberships": sum(len(usernames) for usernames in self.members.values()),
+            "room_messages": self.room_messages,
+            "avg_room_fanout": round(self.room_targets / self.room_messages, 2) if self.room_messages else 0,
+        }
+
+
+rooms = RoomRegistry()
@@ -12,8 +12,13 @@ IF NOT EXIST .venv\Scripts\activate.bat (
 REM ✅ 가상환경 활성화
 call .venv\Scripts\activate.bat
 
+REM ✅ 워커 수 (기본 1). 2 이상이면 워커끼리 bus.db 로 메시지/접속자 공유 (bus.py)
+IF "%DANI_WORKERS%"=="" set DANI_WORKERS=1
+IF NOT "%DANI_WORKERS%"=="1" set DANI_BUS=sqlite
+
 REM ✅ 서버 실행
-uvicorn main:app --host 0.0.0.0 --port 30006 --ws websockets --ws-max-size 4194304
+REM    --ws-ping-*: WebSocket 프로토콜 ping. JSON ping 에 답하지 않는 예전 /ws, /notice 클라이언트의 끊긴 연결은 이것으로 정리 (reaper.py)
+uvicorn main:app --host 0.0.0.0 --port 30006 --ws websockets --ws-max-size 4194304 --ws-ping-interval 20 --ws-ping-timeout 20 --workers %DANI_WORKERS%
 
 REM ✅ 창 닫힘 방지
 pause
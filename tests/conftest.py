@@ -0,0 +1,66 @@
+# tests/conftest.py
+# 서버 모듈은 모두 최상위 파일이라 저장소 루트를 import 경로에 추가
+# DB 를 쓰는 테스트는 run_db 로 실행 → 테스트마다 빈 chat_log.db (tmp_path) 에 마이그레이션 적용 후 실행, 끝나면 연결 정리
+import asyncio
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import database  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """전역 pool 을 이 테스트 전용 DB 파일로 돌림 (잠금은 테스트마다 새 이벤트 루프에서 다시 만듦)"""
+    path = str(tmp_path / "chat_log.db")
+    database.pool.path = path
+    database.pool._write_lock = asyncio.Lock()
+    database.pool._open_lock = asyncio.Lock()
+    database.message_writer.task = None
+    yield path
+    database.pool.path = database.DB_PATH
+
+
+@pytest.fixture
+def run_db(db_path):
+    """run_db(async_fn) → init_db() 후 async_fn() 실행, 결과 반환 (항상 close_db)"""
+    def run(async_fn, migrate: bool = True):
+        async def main():
+            try:
+                if migrate:
+                    await database.init_db()
+                return await async_fn()
+            finally:
+                await database.close_db()
+        return asyncio.run(main())
+    return run
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """
+    GPT 업스트림 대신 정해진 조각을 흘려보내는 스트림 (gpt_client.stream 교체)
+    upstream.calls: 실제로 업스트림에 나간 질문 목록, upstream.chunks / delay 로 응답 모양 조정
+    """
+    import gpt_service
+
+    class FakeUpstream:
+        def __init__(self):
+            self.calls = []
+            self.chunks = ["안녕", "하세요"]
+            self.delay = 0.02
+
+        async def stream(self, path, payload):
+            self.calls.append(payload["messages"][-1]["content"])
+            for chunk in self.chunks:
+                await asyncio.sleep(self.delay)
+                yield {"choices": [{"delta": {"content": chunk}}]}
+            yield {"choices": [], "usage": {"prompt_tokens": 10, "completion_tokens": 5}}
+
+    fake = FakeUpstream()
+    monkeypatch.setattr(gpt_service.gpt_client, "stream", fake.stream)
+    return fake
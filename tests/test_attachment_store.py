@@ -0,0 +1,62 @@
+# 첨부파일 저장소 (attachment_store.py) - 내용 해시 기준으로 한 번만 저장
+import hashlib
+import os
+
+import pytest
+
+from attachment_store import (PARTIAL_DIR, add_attachment, attachment_path, get_attachment,
+                              init_attachment_store, sha256_file)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)     # attachments/ 는 작업 폴더 기준
+    init_attachment_store()
+
+
+def upload(name: str, data: bytes) -> str:
+    path = os.path.join(PARTIAL_DIR, name + ".part")
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def test_add_then_get_by_hash(run_db, store):
+    data = b"screenshot bytes" * 1000
+    file_hash = hashlib.sha256(data).hexdigest()
+
+    async def scenario():
+        path = upload("a", data)
+        assert sha256_file(path, chunk_size=4096) == file_hash
+        await add_attachment(file_hash, path, "화면.png", ".png", len(data), "A")
+        return await get_attachment(file_hash), os.path.exists(path)
+
+    info, partial_left = run_db(scenario)
+    assert info == {"id": file_hash, "name": "화면.png", "type": ".png", "size": len(data)}
+    assert attachment_path(file_hash) == os.path.join("attachments", file_hash[:2], file_hash)
+    assert open(attachment_path(file_hash), "rb").read() == data
+    assert not partial_left         # 임시 파일은 저장소로 옮겨짐
+
+
+def test_same_content_is_indexed_once(run_db, store):
+    data = b"same file"
+    file_hash = hashlib.sha256(data).hexdigest()
+
+    async def scenario():
+        await add_attachment(file_hash, upload("a", data), "first.txt", ".txt", len(data), "A")
+        await add_attachment(file_hash, upload("b", data), "second.txt", ".txt", len(data), "B")
+        return await get_attachment(file_hash)
+
+    assert run_db(scenario)["name"] == "first.txt"     # 처음 올린 이름 유지
+
+
+def test_unknown_hash_or_missing_file_is_none(run_db, store):
+    data = b"gone"
+    file_hash = hashlib.sha256(data).hexdigest()
+
+    async def scenario():
+        await add_attachment(file_hash, upload("a", data), "gone.txt", ".txt", len(data), "A")
+        os.remove(attachment_path(file_hash))       # 색인만 남고 파일은 지워짐
+        return await get_attachment(file_hash), await get_attachment("0" * 64)
+
+    assert run_db(scenario) == (None, None)
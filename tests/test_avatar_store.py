@@ -0,0 +1,62 @@
+# 아바타 저장소 (avatar_store.py) + 패킷 필드 검사 (packet_fields.py)
+import base64
+import hashlib
+import json
+
+import pytest
+
+import avatar_store
+from avatar_store import MAX_AVATAR_BYTES, get_avatar, has_avatar, put_avatar
+from packet_fields import PacketError, packet_hash, packet_str
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 32
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(avatar_store, "_avatars", {})
+
+
+def test_put_is_content_addressed_and_survives_cache_loss(run_db):
+    async def scenario():
+        data = base64.b64encode(PNG).decode()
+        first, again = await put_avatar(data), await put_avatar(data)
+        avatar_store._avatars.clear()           # 재시작 → DB 에서 다시 읽음
+        return first, again, await get_avatar(first), await has_avatar(first), await has_avatar("0" * 64)
+
+    first, again, data, known, unknown = run_db(scenario)
+    assert first == again == hashlib.sha256(PNG).hexdigest()
+    assert base64.b64decode(data) == PNG
+    assert known and not unknown
+
+
+@pytest.mark.parametrize("data", [
+    None, "", ["AAAA"], "!!!not base64!!!", "QUJD\nRA==",
+    "A" * ((MAX_AVATAR_BYTES + 2) // 3 * 4 + 4),
+])
+def test_put_rejects_empty_oversized_or_malformed_data(run_db, data):
+    async def scenario():
+        return await put_avatar(data)
+
+    assert run_db(scenario) is None
+
+
+@pytest.mark.parametrize("h", [["a"], {"h": 1}, 7, "ABC", "A" * 64, "g" * 64])
+def test_get_ignores_values_that_are_not_hashes(run_db, h):
+    async def scenario():
+        return await get_avatar(h)
+
+    assert run_db(scenario) is None
+
+
+def test_packet_field_helpers():
+    packet = {"type": "avatar_get", "hash": "a" * 64, "name": "다니", "bad": ["a"], "empty": ""}
+    assert packet_hash(packet, "hash") == "a" * 64
+    assert packet_hash(packet, "empty") is None and packet_hash(packet, "missing") is None
+    assert packet_str(packet, "name", max_len=1) == "다"
+    assert packet_str(packet, "missing", "기본") == "기본"
+    for check, field in [(packet_hash, "bad"), (packet_hash, "name"), (packet_str, "bad")]:
+        with pytest.raises(PacketError) as error:
+            check(packet, field)
+        assert json.loads(error.value.packet(packet)) == \
+            {"type": "packet_error", "request": "avatar_get", "field": field}
@@ -0,0 +1,79 @@
+# 연결별 송신 큐 브로드캐스트 (fanout.py)
+import asyncio
+
+from fanout import FanoutHub
+
+
+class GatedSocket:
+    """open 이 set 될 때까지 send_text 가 멈춰 있는 소켓 (느린 클라이언트)"""
+
+    def __init__(self, stalled=False):
+        self.sent = []
+        self.close_code = None
+        self.open = asyncio.Event()
+        if not stalled:
+            self.open.set()
+
+    async def send_text(self, text):
+        await self.open.wait()
+        self.sent.append(text)
+
+    async def close(self, code=1000):
+        self.close_code = code
+
+
+def test_slow_consumer_is_closed_without_blocking_others():
+    async def scenario():
+        hub = FanoutHub("chat", queue_size=4)
+        fast, slow = GatedSocket(), GatedSocket(stalled=True)
+        hub.register("fast", fast)
+        slow_conn = hub.register("slow", slow)
+        await asyncio.sleep(0)
+
+        # slow 는 첫 프레임 전송에서 멈춤 → 큐 4개가 차고 그다음 프레임에서 끊김
+        counts = []
+        for i in range(7):
+            counts.append(hub.broadcast(f"m{i}"))
+            await asyncio.sleep(0)      # fast 의 writer 는 바로바로 비움
+        await asyncio.sleep(0.01)
+        assert "slow" not in hub and slow_conn.closed
+        assert slow.close_code == 1013
+        assert hub.usernames() == ["fast"]
+        return counts, hub.stats(), fast.sent
+
+    counts, stats, fast_sent = asyncio.run(scenario())
+    assert counts == [2, 2, 2, 2, 2, 1, 1]
+    assert fast_sent == [f"m{i}" for i in range(7)]
+    assert stats["dropped_slow"] == 1
+    assert stats["sent"] == 12
+
+
+def test_broadcast_exclude_and_channel_filter():
+    async def scenario():
+        hub = FanoutHub("chat")
+        sockets = {name: GatedSocket() for name in ("a", "b", "c")}
+        for name, socket in sockets.items():
+            hub.register(name, socket)
+        hub.clients["b"].channels = frozenset({"chat", "presence"})
+        hub.broadcast("all", exclude="a")
+        hub.broadcast("presence", channel="presence")
+        await asyncio.sleep(0.01)
+        return {name: socket.sent for name, socket in sockets.items()}
+
+    sent = asyncio.run(scenario())
+    assert sent == {"a": [], "b": ["all", "presence"], "c": ["all"]}
+
+
+def test_reconnect_replaces_and_closes_old_connection():
+    async def scenario():
+        hub = FanoutHub("chat")
+        old_socket = GatedSocket()
+        old = hub.register("a", old_socket)
+        new = hub.register("a", GatedSocket())
+        await asyncio.sleep(0.01)
+        hub.discard(old)        # 이전 연결의 정리가 새 연결을 지우지 않음
+        assert hub.clients["a"] is new
+        return old, old_socket
+
+    old, old_socket = asyncio.run(scenario())
+    assert old.closed and old_socket.close_code == 1000
@@ -0,0 +1,60 @@
+# /files 채널 (file_transfer.py) - 잘못된 헤더는 error 응답만 하고 채널은 유지
+import asyncio
+import json
+
+from fastapi import WebSocketDisconnect
+
+import file_transfer
+from file_transfer import FileChannel
+
+FILE_ID = "0" * 64
+
+
+class ScriptedSocket:
+    """받을 텍스트 프레임을 순서대로 돌려주고, 다 쓰면 연결 종료"""
+
+    def __init__(self, frames):
+        self.frames = list(frames)
+        self.sent = []
+
+    async def receive_text(self):
+        if not self.frames:
+            raise WebSocketDisconnect()
+        return json.dumps(self.frames.pop(0))
+
+    async def receive_bytes(self):
+        return b""
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text))
+
+    async def send_bytes(self, data):
+        pass
+
+
+def run_channel(frames, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    socket = ScriptedSocket(frames)
+    asyncio.run(FileChannel(socket, "tester").run())
+    return socket.sent
+
+
+def test_malformed_numbers_are_rejected_without_closing(tmp_path, monkeypatch):
+    sent = run_channel([
+        {"op": "upload_init", "file_id": FILE_ID, "size": "big"},
+        {"op": "upload_init", "file_id": FILE_ID, "size": -1},
+        {"op": "read", "file_id": FILE_ID, "offset": -5},
+        {"op": "read", "file_id": FILE_ID, "offset": [1]},
+        ["not", "a", "header"],
+        {"op": "cancel", "file_id": FILE_ID},
+    ], tmp_path, monkeypatch)
+
+    assert [packet["op"] for packet in sent] == ["error"] * 5 + ["cancelled"]
+    assert sent[0]["message"] == "잘못된 size"
+    assert sent[1]["message"] == "잘못된 size"
+    assert sent[2]["message"] == "잘못된 offset"
+
+
+def test_check_offset_accepts_numeric_strings():
+    assert file_transfer._check_offset("42", "offset") == 42
+    assert file_transfer._check_offset(None, "offset") == 0
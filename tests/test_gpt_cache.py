@@ -0,0 +1,157 @@
+# GPT 답변 캐시 (gpt_cache.py) + stream_gpt_with_tracking 의 캐시/single-flight 경로
+import asyncio
+
+import pytest
+
+import gpt_service
+from database import pool
+from gpt_cache import GPTCache, cache_key, normalize_prompt
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    fresh = GPTCache(ttl=3600, max_entries=100)
+    monkeypatch.setattr(gpt_service, "gpt_cache", fresh)
+    return fresh
+
+
+async def collect(stream) -> str:
+    return "".join([delta async for delta in stream])
+
+
+def test_normalized_prompts_share_a_key():
+    assert normalize_prompt("  오늘  점심 메뉴 추천?? ") == "오늘 점심 메뉴 추천"
+    assert cache_key("Excel VLOOKUP 사용법", "m", "s") == cache_key("excel  vlookup 사용법!", "m", "s")
+    assert cache_key("점심 추천", "m", "s") != cache_key("점심 추천", "other-model", "s")
+    assert cache_key("점심 추천", "m", "s") != cache_key("점심 추천", "m", "other system prompt")
+
+
+def test_put_get_and_ttl(run_db, cache):
+    async def scenario():
+        key = cache_key("점심 추천", "m", "s")
+        assert await cache.get(key) is None
+        await cache.put(key, "점심 추천", "김치찌개", "m")
+        assert await cache.get(key) == "김치찌개"
+
+        # TTL 지난 항목은 없는 것으로
+        async with pool.write() as db:
+            await db.execute("UPDATE gpt_cache SET created_at = created_at - 7200")
+            await db.commit()
+        assert await cache.get(key) is None
+        return cache.stats()
+
+    stats = run_db(scenario)
+    assert stats["hits"] == 1
+    assert stats["stored"] == 1
+
+
+def test_lru_eviction_keeps_recently_used(run_db, cache):
+    cache.max_entries = 2
+
+    async def scenario():
+        keys = [cache_key(p, "m", "s") for p in ("a", "b", "c")]
+        await cache.put(keys[0], "a", "A", "m")
+        await cache.put(keys[1], "b", "B", "m")
+        async with pool.write() as db:     # a 를 더 최근에 쓴 것으로
+            await db.execute("UPDATE gpt_cache SET last_used = last_used - 100 WHERE key = ?", (keys[1],))
+            await db.commit()
+        await cache.put(keys[2], "c", "C", "m")
+        return [await cache.get(key) for key in keys], await cache.count()
+
+    answers, count = run_db(scenario)
+    assert answers == ["A", None, "C"]
+    assert count == 2
+
+
+def test_repeated_prompt_is_served_from_cache(run_db, cache, upstream):
+    async def scenario():
+        first = await collect(gpt_service.stream_gpt_with_tracking("점심 추천", "A"))
+        second = await collect(gpt_service.stream_gpt_with_tracking("점심  추천?", "B"))
+        return first, second
+
+    first, second = run_db(scenario)
+    assert first == second == "안녕하세요"
+    assert len(upstream.calls) == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_follower_sees_failure_when_leader_goes_away(run_db, cache, upstream):
+    upstream.chunks = ["안녕", "하세요", " 반갑", "습니다"]
+
+    async def scenario():
+        leader = gpt_service.stream_gpt_with_tracking("인사해 줘", "A")
+        first = await leader.__anext__()
+        follower = asyncio.create_task(collect(gpt_service.stream_gpt_with_tracking("인사해 줘", "B")))
+        while cache.shared == 0:
+            await asyncio.sleep(0.005)
+        await leader.aclose()       # 질문자 연결이 끊김
+        return first, await follower
+
+    first, followed = run_db(scenario)
+    assert first == "안녕"
+    assert followed.startswith("안녕")
+    assert followed.endswith(gpt_service.GPT_ABORTED)
+    assert cache.flights == {}
+    assert len(upstream.calls) == 1
+
+
+def test_identical_prompt_while_answer_is_being_stored_joins_the_flight(run_db, cache, upstream, monkeypatch):
+    async def slow_put(*args, _put=cache.put):
+        await asyncio.sleep(0.1)
+        await _put(*args)
+
+    monkeypatch.setattr(cache, "put", slow_put)
+
+    async def scenario():
+        leader = asyncio.create_task(collect(gpt_service.stream_gpt_with_tracking("점심 추천", "A")))
+        key = cache_key("점심 추천", gpt_service.TOGETHER_MODEL, gpt_service.SYSTEM_PROMPT)
+        while not (key in cache.flights and cache.flights[key].done):
+            await asyncio.sleep(0.005)
+        # 답변은 끝났지만 아직 캐시에 저장 중
+        late = await collect(gpt_service.stream_gpt_with_tracking("점심 추천", "B"))
+        return await leader, late
+
+    first, late = run_db(scenario)
+    assert first == late == "안녕하세요"
+    assert len(upstream.calls) == 1
+    assert cache.flights == {}
+
+
+
+def test_concurrent_identical_prompts_make_one_upstream_call(run_db, cache, upstream):
+    prompts = ["점심 추천?", "점심 추천", "점심  추천!", "점심 추천", "점심 추천"]
+
+    async def scenario():
+        return await asyncio.gather(*[
+            collect(gpt_service.stream_gpt_with_tracking(prompt, f"user{i}"))
+            for i, prompt in enumerate(prompts)])
+
+    answers = run_db(scenario)
+    assert answers == ["안녕하세요"] * len(prompts)
+    assert len(upstream.calls) == 1
+    assert cache.stats()["shared"] == len(prompts) - 1
+
+
+def test_leader_over_budget_hands_the_call_to_a_follower(run_db, cache, upstream, monkeypatch):
+    from gpt_usage import usage_ledger
+
+    async def slow_check(username, _check=usage_ledger.check):
+        await asyncio.sleep(0.05)   # 예산 확인 중에 B 가 합류하도록
+        return await _check(username)
+
+    monkeypatch.setattr(usage_ledger, "check", slow_check)
+
+    async def scenario():
+        await usage_ledger.record("A", "m", 0, 0, cost=usage_ledger.user_budget)     # A 는 이번 달 예산 소진
+        key = cache_key("점심 추천", gpt_service.TOGETHER_MODEL, gpt_service.SYSTEM_PROMPT)
+        a = asyncio.create_task(collect(gpt_service.stream_gpt_with_tracking("점심 추천", "A")))
+        while key not in cache.flights:
+            await asyncio.sleep(0.001)
+        b = asyncio.create_task(collect(gpt_service.stream_gpt_with_tracking("점심 추천", "B")))
+        return await a, await b
+
+    answer_a, answer_b = run_db(scenario)
+    assert answer_a == gpt_service.BUDGET_EXCEEDED["user"]
+    assert answer_b == "안녕하세요"       # 남의 예산 초과 문구를 받지 않고 자기 예산으로 답변
+    assert len(upstream.calls) == 1
+    assert cache.stats()["shared"] == 1
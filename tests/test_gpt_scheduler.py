@@ -0,0 +1,91 @@
+# GPT 공정 대기열 (gpt_scheduler.py)
+import asyncio
+
+from gpt_scheduler import GPTScheduler
+
+
+def run_jobs(scheduler, jobs, hold=0.01):
+    """jobs: [(username, label)] 를 순서대로 대기열에 넣고 실행 순서와 순번 알림을 돌려줌"""
+    order, positions = [], {}
+
+    async def job(username, label):
+        positions[label] = []
+        async with scheduler.slot(username, positions[label].append):
+            order.append(label)
+            await asyncio.sleep(hold)
+
+    async def main():
+        tasks = []
+        for username, label in jobs:
+            tasks.append(asyncio.create_task(job(username, label)))
+            await asyncio.sleep(0)      # 들어온 순서 고정
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    return order, positions
+
+
+def test_round_robin_between_users():
+    scheduler = GPTScheduler(concurrency=1)
+    jobs = [("A", "a0"), ("A", "a1"), ("A", "a2"), ("A", "a3"), ("B", "b0"), ("C", "c0")]
+    order, _ = run_jobs(scheduler, jobs)
+    # a0 은 바로 실행, 나머지는 사용자별로 번갈아
+    assert order == ["a0", "a1", "b0", "c0", "a2", "a3"]
+    assert scheduler.running == 0
+    assert scheduler.stats()["waiting"] == 0
+
+
+def test_concurrency_is_bounded():
+    scheduler = GPTScheduler(concurrency=2)
+    peak = 0
+
+    async def job(username):
+        nonlocal peak
+        async with scheduler.slot(username):
+            peak = max(peak, scheduler.running)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        await asyncio.gather(*[job(f"user{i % 3}") for i in range(8)])
+
+    asyncio.run(main())
+    assert peak == 2
+    assert scheduler.stats()["granted"] == 8
+
+
+def test_positions_are_reported_until_start():
+    scheduler = GPTScheduler(concurrency=1)
+    _, positions = run_jobs(scheduler, [("A", "a0"), ("A", "a1"), ("B", "b0")])
+    assert positions["a0"] == [0]
+    assert positions["a1"] == [1, 0]
+    assert positions["b0"] == [2, 1, 0]
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    scheduler = GPTScheduler(concurrency=1)
+
+    async def main():
+        release = asyncio.Event()
+
+        async def holder():
+            async with scheduler.slot("A"):
+                await release.wait()
+
+        async def waiter(username):
+            async with scheduler.slot(username):
+                return username
+
+        first = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        cancelled = asyncio.create_task(waiter("B"))
+        survivor = asyncio.create_task(waiter("C"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        assert scheduler.stats()["waiting"] == 1
+        release.set()
+        await first
+        return await survivor
+
+    assert asyncio.run(main()) == "C"
+    assert scheduler.running == 0
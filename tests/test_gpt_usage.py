@@ -0,0 +1,39 @@
+# GPT 사용량 원장 / 사용자별·월별 예산 (gpt_usage.py)
+import pytest
+
+from gpt_usage import UsageLedger, current_month
+
+
+def test_ledger_aggregates_per_user_and_month(run_db):
+    ledger = UsageLedger(user_budget=0.5, month_budget=1.0)
+
+    async def scenario():
+        await ledger.record("A", "m", 100, 50, 0.2)
+        await ledger.record("A", "m", 10, 5, 0.1, estimated=True)
+        await ledger.record("B", "m", 1, 1, 0.05)
+        return (await ledger.user_month("A"), await ledger.month_total(),
+                await ledger.month_by_user(), await ledger.user_month("A", "1999-01"))
+
+    user, total, by_user, other_month = run_db(scenario)
+    assert user == {"requests": 2, "prompt_tokens": 110, "completion_tokens": 55, "cost": pytest.approx(0.3)}
+    assert total["users"] == 2 and total["requests"] == 3
+    assert [row["username"] for row in by_user] == ["A", "B"]
+    assert other_month["requests"] == 0
+    assert ledger.stats()["estimated"] == 1
+    assert current_month().count("-") == 1
+
+
+def test_budget_check_per_user_then_month(run_db):
+    ledger = UsageLedger(user_budget=0.5, month_budget=1.0)
+
+    async def scenario():
+        await ledger.record("A", "m", 0, 0, 0.6)
+        over_user, fine = await ledger.check("A"), await ledger.check("B")
+        await ledger.record("B", "m", 0, 0, 0.45)
+        return over_user, fine, await ledger.check("C")
+
+    over_user, fine, over_month = run_db(scenario)
+    assert over_user["exceeded"] == "user"
+    assert fine["exceeded"] is None and fine["month_used"] == 0.6
+    assert over_month["exceeded"] == "month"
+    assert ledger.stats()["rejected"] == 2
@@ -0,0 +1,78 @@
+# 최근 메시지 링 버퍼 (history_cache.HistoryCache) - 순서, 뒤바뀐 도착, 버퍼가 다루지 못하는 범위
+import json
+from datetime import datetime, timedelta
+
+from database import save_message
+from history_cache import HistoryCache, encode_packet
+
+NOW = datetime.now().replace(microsecond=0)
+TS = int(NOW.timestamp())
+
+
+def message(message_id: int) -> dict:
+    return {"id": message_id, "sender": "A", "message": f"m{message_id}",
+            "timestamp": NOW.strftime("%Y-%m-%d %H:%M:%S"), "avatar": None}
+
+
+def filled(capacity: int, *ids) -> HistoryCache:
+    cache = HistoryCache(capacity)
+    for message_id in ids:
+        cache.append(message(message_id), TS)
+    return cache
+
+
+def ids_of(history) -> list:
+    return [m["id"] for m in json.loads(history.messages)]
+
+
+def test_ring_buffer_keeps_the_newest_messages_in_order():
+    cache = filled(3, 1, 2, 3, 4, 5)
+    assert list(cache.ids) == [3, 4, 5]
+    assert [e[0] for e in cache.entries] == [3, 4, 5]
+    history = cache.after(2, 10)
+    assert ids_of(history) == [3, 4, 5]
+    assert (history.first_id, history.last_id, history.count) == (3, 5, 3)
+    assert ids_of(cache.after(3, 1)) == [4]
+    assert cache.after(5, 10).count == 0
+    assert cache.after(1, 10) is None       # 2 는 이미 밀려남 → DB 에서
+    assert cache.stats()["misses"] == 1
+
+
+def test_out_of_order_appends_are_inserted_in_place():
+    cache = filled(5, 1, 3, 2, 5, 4)
+    assert list(cache.ids) == [1, 2, 3, 4, 5]
+    assert ids_of(cache.after(0, 10)) == [1, 2, 3, 4, 5]
+
+    full = filled(3, 2, 4, 5)
+    full.append(message(3), TS)             # 가득 찬 버퍼: 가장 오래된 것을 밀어내고 제자리에
+    assert list(full.ids) == [3, 4, 5]
+    full.append(message(1), TS)             # 버퍼보다 오래된 메시지는 버림
+    assert list(full.ids) == [3, 4, 5]
+    assert list(full.ids) == [e[0] for e in full.entries]
+
+
+def test_today_history_is_built_once_per_new_message(run_db):
+    async def scenario():
+        yesterday = await save_message("A", "어제", now=NOW - timedelta(days=1, hours=1))
+        today = [await save_message("B", f"오늘 {i}", now=NOW) for i in range(3)]
+        cache = HistoryCache(10)
+        await cache.warm()
+        return yesterday, today, cache
+
+    yesterday, today, cache = run_db(scenario)
+    assert cache.complete
+    history = cache.today()
+    assert ids_of(history) == today and yesterday not in ids_of(history)
+    assert cache.today() is history                 # 새 메시지가 없으면 다시 만들지 않음
+    cache.append(message(today[-1] + 1), TS)
+    assert ids_of(cache.today()) == today + [today[-1] + 1]
+    assert (cache.stats()["hits"], cache.stats()["today_builds"]) == (1, 2)
+
+    packet = json.loads(encode_packet("history", history, last_read_id=7))
+    assert packet["type"] == "history" and packet["last_read_id"] == 7
+    assert [m["id"] for m in packet["messages"]] == today
+
+
+def test_today_is_unknown_when_older_messages_were_evicted():
+    cache = filled(2, 1, 2, 3)      # 밀려난 메시지가 있고 버퍼 전체가 오늘 → 오늘 것이 다 있는지 알 수 없음
+    assert cache.today() is None
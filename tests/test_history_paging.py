@@ -0,0 +1,67 @@
+# 재접속 증분 동기화 / 위로 스크롤 페이지 (database.load_messages_after / load_messages_before)
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import load_messages_after, load_messages_before, save_message
+from packet_fields import PacketError, packet_int
+
+NOW = datetime.now().replace(microsecond=0)
+
+
+async def seed(count: int = 10) -> list:
+    ids = []
+    for i in range(count):
+        ids.append(await save_message("A", f"m{i}", now=NOW + timedelta(seconds=i)))
+        await save_message("B", f"dev{i}", now=NOW + timedelta(seconds=i), room="dev")   # 다른 방은 섞이지 않음
+    return ids
+
+
+def texts(messages) -> list:
+    return [m["message"] for m in messages]
+
+
+def test_sync_after_id_returns_newer_messages_oldest_first(run_db):
+    async def scenario():
+        ids = await seed()
+        return (await load_messages_after(ids[6], 50), await load_messages_after(ids[2], 3),
+                await load_messages_after(ids[-1], 50))
+
+    newer, limited, none = run_db(scenario)
+    assert texts(newer) == ["m7", "m8", "m9"]
+    assert texts(limited) == ["m3", "m4", "m5"]
+    assert none == []
+
+
+def test_scroll_back_pages_walk_to_the_first_message(run_db):
+    async def scenario():
+        ids = await seed()
+        pages, before_id = [], ids[-1] + 1
+        while True:
+            page = await load_messages_before(before_id, 4)
+            if not page:
+                return ids, pages
+            pages.append(texts(page))
+            before_id = page[0]["id"]
+
+    ids, pages = run_db(scenario)
+    assert pages == [["m6", "m7", "m8", "m9"], ["m2", "m3", "m4", "m5"], ["m0", "m1"]]
+
+
+def test_jump_loads_everything_down_to_until_id(run_db):
+    async def scenario():
+        ids = await seed()
+        return await load_messages_before(ids[8], 100, min_id=ids[3])
+
+    assert texts(run_db(scenario)) == ["m3", "m4", "m5", "m6", "m7"]
+
+
+def test_packet_int_defaults_clamps_and_rejects():
+    packet = {"limit": "500", "page": -3, "before_id": 0, "bad": "abc", "list": [1], "flag": True}
+    assert packet_int(packet, "limit", 50, 1, 200) == 200
+    assert packet_int(packet, "page", 0, 0) == 0
+    assert packet_int(packet, "before_id", 7) == 7
+    assert packet_int(packet, "missing", 50) == 50
+    for field in ("bad", "list", "flag"):
+        with pytest.raises(PacketError):
+            packet_int(packet, field, 0)
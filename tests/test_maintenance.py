@@ -0,0 +1,85 @@
+# DB 유지보수 (maintenance) - 오래된 메시지 보관 → 보관 검색, 보관 월 검사, auto_vacuum 전환
+import asyncio
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+import maintenance
+from database import save_message, search_messages
+from maintenance import MaintenanceScheduler, archive_months, archive_path, search_archive
+
+NOW = datetime.now().replace(microsecond=0)
+
+
+@pytest.fixture
+def archive_dir(tmp_path, monkeypatch):
+    path = str(tmp_path / "archive")
+    os.makedirs(path)
+    monkeypatch.setattr(maintenance, "ARCHIVE_DIR", path)
+    return path
+
+
+def test_old_messages_move_to_monthly_archive_and_stay_searchable(run_db, archive_dir):
+    old = NOW - timedelta(days=maintenance.ARCHIVE_AFTER_DAYS + 40)
+
+    async def scenario():
+        ids = {
+            "old": await save_message("A", "작년 회의록 정리", now=old),
+            "old_b": await save_message("B", "작년 회의록 확인", now=old + timedelta(minutes=1)),
+            "old_dev": await save_message("C", "개발팀 회의록", now=old, room="dev"),
+            "new": await save_message("A", "오늘 회의록", now=NOW),
+        }
+        scheduler = MaintenanceScheduler()
+        moved = await scheduler.archive_old_messages()
+        in_db, _ = await search_messages("회의록")
+        return ids, moved, in_db, {
+            "all": await search_archive("회의록"),
+            "sender": await search_archive("회의록", sender="B"),
+            "month": await search_archive("회의록", month=old.strftime("%Y-%m")),
+            "other_month": await search_archive("회의록", month="1999-01"),
+            "room": await search_archive("회의록", room="dev"),
+        }
+
+    ids, moved, in_db, found = run_db(scenario)
+    assert moved == 3
+    assert [m["id"] for m in in_db] == [ids["new"]]      # 보관된 메시지는 DB 에서 빠짐
+    assert archive_months() == [old.strftime("%Y-%m")]
+    assert [m["id"] for m in found["all"]] == [ids["old_b"], ids["old"]]    # 최신순
+    assert [m["id"] for m in found["sender"]] == [ids["old_b"]]
+    assert [m["id"] for m in found["month"]] == [ids["old_b"], ids["old"]]
+    assert found["other_month"] == []
+    assert [m["id"] for m in found["room"]] == [ids["old_dev"]]
+
+
+@pytest.mark.parametrize("month", ["../../etc/passwd", "2024-1", "2024-01/../x", "202401", " 2024-01", "2024-01\n", 202401])
+def test_malformed_month_is_rejected(archive_dir, month):
+    with pytest.raises(ValueError):
+        archive_path(month)
+    with pytest.raises(ValueError):
+        asyncio.run(search_archive("회의록", month=month))
+
+
+def test_new_database_uses_incremental_vacuum(run_db):
+    async def scenario():
+        scheduler = MaintenanceScheduler()
+        await scheduler.incremental_vacuum()
+        return scheduler.auto_vacuum, await scheduler.convert_auto_vacuum()
+
+    assert run_db(scenario) == (2, False)
+
+
+def test_old_database_is_converted_only_on_request(run_db, db_path):
+    with sqlite3.connect(db_path) as db:     # auto_vacuum 없이 만들어진 예전 DB
+        db.execute("CREATE TABLE legacy (x INTEGER)")
+
+    async def scenario():
+        scheduler = MaintenanceScheduler()
+        await scheduler.incremental_vacuum()    # 정기 유지보수는 전체 VACUUM 을 하지 않음
+        skipped = scheduler.auto_vacuum
+        converted = await scheduler.convert_auto_vacuum()
+        await scheduler.incremental_vacuum()
+        return skipped, converted, scheduler.auto_vacuum
+
+    assert run_db(scenario) == (0, True, 2)
@@ -0,0 +1,94 @@
+# 메시지 저장 묶음 커밋 (database.MessageWriter)
+import asyncio
+
+import pytest
+
+from database import LOBBY_ROOM, MessageWriter, pool
+
+
+def row(i: int) -> tuple:
+    return ("A", f"m{i}", "2026-10-18 09:00:00", 1_792_000_000 + i, None, None, LOBBY_ROOM)
+
+
+async def stored_messages() -> list:
+    async with pool.read() as db:
+        async with db.execute("SELECT id, message FROM messages ORDER BY id") as cursor:
+            return await cursor.fetchall()
+
+
+def test_concurrent_messages_share_one_commit(run_db):
+    writer = MessageWriter(interval=0.05)
+
+    async def scenario():
+        ids = await asyncio.gather(*[writer.submit(row(i)) for i in range(50)])
+        await writer.stop()
+        return ids, await stored_messages()
+
+    ids, stored = run_db(scenario)
+    assert ids == sorted(ids) and len(set(ids)) == 50       # 보낸 순서대로 id
+    assert stored == [(message_id, f"m{i}") for i, message_id in enumerate(ids)]
+    stats = writer.stats()
+    assert (stats["rows"], stats["batches"]) == (50, 1)
+    assert stats["batch_size_max"] == 50
+
+
+def test_batches_are_capped_at_max_rows(run_db):
+    writer = MessageWriter(interval=0.05, max_rows=10)
+
+    async def scenario():
+        await asyncio.gather(*[writer.submit(row(i)) for i in range(25)])
+        await writer.stop()
+
+    run_db(scenario)
+    stats = writer.stats()
+    assert (stats["rows"], stats["batches"], stats["batch_size_max"]) == (25, 3, 10)
+
+
+def test_stop_commits_everything_still_queued(run_db):
+    writer = MessageWriter(interval=1.0)     # 묶음을 오래 모으는 중에 종료
+
+    async def scenario():
+        pending = [asyncio.create_task(writer.submit(row(i))) for i in range(5)]
+        await asyncio.sleep(0.01)
+        await writer.stop()
+        return [task.result() for task in pending], await stored_messages()
+
+    ids, stored = run_db(scenario)
+    assert [message_id for message_id, _ in stored] == ids
+    assert writer.task is None
+
+
+@pytest.mark.parametrize("durability", ["strict", "normal", "relaxed"])
+def test_every_durability_mode_returns_ids(run_db, durability):
+    writer = MessageWriter(durability=durability)
+
+    async def scenario():
+        ids = [await writer.submit(row(i)) for i in range(3)]
+        await writer.stop()
+        return ids, await stored_messages()
+
+    ids, stored = run_db(scenario)
+    assert ids == [message_id for message_id, _ in stored]
+
+
+@pytest.mark.parametrize("durability", ["normal", "relaxed"])
+def test_bad_row_fails_alone_and_the_rest_of_the_batch_commits(run_db, durability):
+    writer = MessageWriter(durability=durability, interval=0.05)
+    bad_rows = [
+        ("A", "dict avatar", "2026-10-18 09:00:00", 1, {"x": 1}, None, LOBBY_ROOM),   # 바인딩 불가
+        (None, "no sender", "2026-10-18 09:00:00", 1, None, None, LOBBY_ROOM),        # NOT NULL 위반
+        ("A", "short row"),
+    ]
+
+    async def scenario():
+        submitted = [writer.submit(row(0))] + [writer.submit(bad) for bad in bad_rows] + [writer.submit(row(1))]
+        results = await asyncio.gather(*submitted, return_exceptions=True)
+        await writer.stop()
+        return results, await stored_messages()
+
+    results, stored = run_db(scenario)
+    good, failed = [results[0], results[-1]], results[1:-1]
+    assert all(isinstance(result, Exception) for result in failed)
+    assert stored == [(good[0], "m0"), (good[1], "m1")]     # 같은 묶음의 정상 메시지는 저장되고 id 반환
+    stats = writer.stats()
+    assert (stats["rows"], stats["failed"], stats["batches"]) == (2, 3, 1)
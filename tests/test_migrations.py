@@ -0,0 +1,116 @@
+# 스키마 마이그레이션 (database.init_db / MIGRATIONS)
+import sqlite3
+from datetime import datetime
+
+import database
+from database import MIGRATIONS, init_db, pool
+
+
+async def schema() -> dict:
+    """테이블/인덱스 이름 → 종류, 적용된 버전 목록, messages 컬럼"""
+    async with pool.read() as db:
+        async with db.execute("SELECT name, type FROM sqlite_master WHERE name NOT LIKE 'sqlite_%'") as cursor:
+            objects = dict(await cursor.fetchall())
+        async with db.execute("SELECT version FROM schema_version ORDER BY version") as cursor:
+            versions = [row[0] for row in await cursor.fetchall()]
+        async with db.execute("PRAGMA table_info(messages)") as cursor:
+            columns = [row[1] for row in await cursor.fetchall()]
+    return {"objects": objects, "versions": versions, "columns": columns}
+
+
+def assert_latest(state: dict):
+    assert state["versions"] == [version for version, _, _ in MIGRATIONS]
+    assert state["columns"] == ["id", "sender", "message", "timestamp", "created_at",
+                                "avatar", "attachment", "ts", "room"]
+    for table in ("messages", "read_state", "avatars", "attachments", "messages_fts", "rooms",
+                  "room_members", "private_messages", "gpt_cache", "gpt_usage", "gpt_usage_monthly"):
+        assert state["objects"].get(table) == "table", table
+    for index in ("idx_messages_ts", "idx_messages_room_id", "idx_private_conv_id", "idx_gpt_usage_month"):
+        assert state["objects"].get(index) == "index", index
+
+
+def test_empty_db_gets_every_migration(run_db):
+    async def scenario():
+        first = await schema()
+        await init_db()         # 두 번째 시작은 아무 것도 하지 않음
+        return first, await schema()
+
+    first, second = run_db(scenario)
+    assert_latest(first)
+    assert second == first
+
+
+def test_pre_versioning_db_is_upgraded_in_place(db_path, run_db):
+    # 버전 관리 이전 서버가 만든 chat_log.db (messages + created_at 컬럼, read_state)
+    with sqlite3.connect(db_path) as db:
+        db.executescript("""
+            CREATE TABLE messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                sender TEXT NOT NULL,
+                message TEXT NOT NULL,
+                timestamp TEXT NOT NULL
+            , created_at TEXT);
+            CREATE TABLE read_state (username TEXT PRIMARY KEY, last_read_id INTEGER);
+            INSERT INTO messages (sender, message, timestamp, created_at)
+                VALUES ('A', '오늘 회의는 3시', '2025-03-02 14:05:00', '2025-03-02 05:05:00');
+            INSERT INTO messages (sender, message, timestamp, created_at)
+                VALUES ('B', '점심 뭐 먹지', '2025-03-03 11:30:00', '2025-03-03 02:30:00');
+            INSERT INTO read_state VALUES ('A', 2);
+        """)
+
+    async def scenario():
+        state = await schema()
+        async with pool.read() as db:
+            async with db.execute("SELECT id, ts, room, created_at FROM messages ORDER BY id") as cursor:
+                rows = await cursor.fetchall()
+            async with db.execute("SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?", ('"회의는"',)) as cursor:
+                found = [row[0] for row in await cursor.fetchall()]
+            async with db.execute("SELECT last_read_id FROM read_state WHERE username = 'A'") as cursor:
+                last_read = (await cursor.fetchone())[0]
+        return state, rows, found, last_read
+
+    state, rows, found, last_read = run_db(scenario)
+    assert_latest(state)
+    local = [datetime(2025, 3, 2, 14, 5), datetime(2025, 3, 3, 11, 30)]
+    assert rows == [(1, int(local[0].timestamp()), "lobby", "2025-03-02 05:05:00"),
+                    (2, int(local[1].timestamp()), "lobby", "2025-03-03 02:30:00")]
+    assert found == [1]         # 기존 메시지도 색인됨
+    assert last_read == 2
+
+
+def test_partially_migrated_db_continues_from_its_version(run_db, monkeypatch):
+    monkeypatch.setattr(database, "MIGRATIONS", MIGRATIONS[:5])
+    run_db(schema)
+
+    applied = []
+
+    def recording(version, migrate):
+        async def run(db):
+            applied.append(version)
+            await migrate(db)
+        return run
+
+    monkeypatch.setattr(database, "MIGRATIONS", [(version, description, recording(version, migrate))
+                                                 for version, description, migrate in MIGRATIONS])
+    state = run_db(schema)
+    assert applied == [6, 7, 8, 9, 10]
+    assert_latest(state)
+
+
+def test_failed_migration_rolls_back_and_keeps_its_version_pending(run_db, monkeypatch):
+    async def broken(db):
+        await db.execute("CREATE TABLE half_done (x INTEGER)")
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(database, "MIGRATIONS", MIGRATIONS + [(99, "broken", broken)])
+
+    async def scenario():
+        try:
+            await init_db()
+        except RuntimeError:
+            pass
+        return await schema()
+
+    state = run_db(scenario, migrate=False)
+    assert state["versions"] == [version for version, _, _ in MIGRATIONS]
+    assert "half_done" not in state["objects"]
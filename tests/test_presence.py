@@ -0,0 +1,79 @@
+# 접속자 목록 (presence.PresenceTracker) - debounce 로 모은 delta 와 버전 순서
+import asyncio
+import json
+
+import presence
+from presence import PresenceTracker
+
+
+class FakeBus:
+    """online_users() 가 호출 시점의 목록을 읽은 뒤 delay 만큼 늦게 돌려줌 (SQLiteBus 조회처럼)"""
+
+    def __init__(self, delay: float = 0.0):
+        self.users = set()
+        self.delay = delay
+        self.calls = 0
+
+    async def online_users(self) -> list:
+        self.calls += 1
+        users = list(self.users)
+        await asyncio.sleep(self.delay)
+        return users
+
+
+def tracker(monkeypatch, bus: FakeBus):
+    monkeypatch.setattr(presence, "bus", bus)
+    t = PresenceTracker(debounce=0.01)
+    t.sent = []
+    t.broadcast = lambda packet: t.sent.append(json.loads(packet))
+    return t
+
+
+def deltas(t):
+    return [(p["version"], p["joined"], p["left"]) for p in t.sent]
+
+
+async def settle(t):
+    while t.flush_handle is not None and not t.flush_handle.done():
+        await t.flush_handle
+
+
+def test_burst_is_coalesced_into_versioned_deltas(monkeypatch):
+    bus = FakeBus()
+    t = tracker(monkeypatch, bus)
+
+    async def scenario():
+        for name in ("a", "b", "c"):
+            bus.users.add(name)
+            t.mark_dirty()
+        await settle(t)
+        bus.users -= {"a", "b"}
+        bus.users.add("d")
+        t.mark_dirty()
+        t.mark_dirty()
+        await settle(t)
+        t.mark_dirty()             # 바뀐 것 없음 → delta 없음, 버전 그대로
+        await settle(t)
+
+    asyncio.run(scenario())
+    assert deltas(t) == [(1, ["a", "b", "c"], []), (2, ["d"], ["a", "b"])]
+    assert json.loads(t.snapshot()) == {"ch": "presence", "type": "user_list", "users": ["c", "d"], "version": 2}
+    assert t.stats() == {"online": 2, "version": 2, "deltas": 2, "coalesced": 3}
+
+
+def test_event_during_flush_is_not_lost(monkeypatch):
+    bus = FakeBus(delay=0.05)
+    t = tracker(monkeypatch, bus)
+
+    async def scenario():
+        bus.users.add("a")
+        t.mark_dirty()
+        await asyncio.sleep(t.debounce + 0.02)     # flush 가 online_users() 를 기다리는 중
+        bus.users.add("b")
+        t.mark_dirty()
+        await settle(t)
+
+    asyncio.run(scenario())
+    assert deltas(t) == [(1, ["a"], []), (2, ["b"], [])]
+    assert bus.calls == 2
+    assert t.online == {"a", "b"}
@@ -0,0 +1,79 @@
+# 1:1 대화 저장 (database.private_messages) - 대화별 페이지, 밀린 메시지 전달 표시
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import (conversation_key, load_private_messages, load_undelivered_private,
+                      mark_private_delivered, save_private_message)
+from packet_fields import PacketError, packet_int
+
+NOW = datetime.now().replace(microsecond=0)
+
+
+async def seed(count: int = 7) -> list:
+    ids = []
+    for i in range(count):
+        sender, receiver = ("a", "b") if i % 2 == 0 else ("b", "a")
+        message_id, _ = await save_private_message(sender, receiver, f"pm {i}", now=NOW + timedelta(seconds=i))
+        ids.append(message_id)
+        await save_private_message("a", "c", f"other {i}", now=NOW)     # 다른 대화는 섞이지 않음
+    return ids
+
+
+def test_pages_walk_back_through_one_conversation(run_db):
+    async def scenario():
+        ids = await seed()
+        pages, before_id = [], None
+        while True:
+            messages, has_more = await load_private_messages("b", "a", before_id, limit=3)
+            pages.append(([m["id"] for m in messages], has_more))
+            if not has_more:
+                return ids, pages
+            before_id = messages[0]["id"]
+
+    ids, pages = run_db(scenario)
+    assert pages == [(ids[4:], True), (ids[1:4], True), (ids[:1], False)]    # 각 페이지는 오래된 것부터
+
+
+def test_page_shape_and_exact_fit(run_db):
+    async def scenario():
+        ids = await seed(3)
+        return ids, await load_private_messages("a", "b", limit=3), await load_private_messages("a", "b", ids[0])
+
+    ids, (messages, has_more), (older, older_more) = run_db(scenario)
+    assert has_more is False and (older, older_more) == ([], False)
+    assert messages[0] == {"id": ids[0], "sender": "a", "receiver": "b", "message": "pm 0",
+                           "timestamp": NOW.strftime("%Y-%m-%d %H:%M:%S")}
+    assert conversation_key("a", "b") == conversation_key("b", "a")
+
+
+def test_undelivered_messages_are_delivered_once(run_db):
+    async def scenario():
+        ids = await seed(4)
+        pending = await load_undelivered_private("b")
+        await mark_private_delivered(m["id"] for m in pending)
+        await mark_private_delivered([])
+        return ids, pending, await load_undelivered_private("b"), await load_undelivered_private("c")
+
+    ids, pending, after, other = run_db(scenario)
+    assert [m["id"] for m in pending] == [ids[0], ids[2]]      # b 가 받는 메시지만, 오래된 것부터
+    assert after == []
+    assert len(other) == 4
+
+
+@pytest.mark.parametrize("packet, before_id, limit", [
+    ({}, None, 50),
+    ({"before_id": 10, "limit": 500}, 10, 100),
+    ({"before_id": "10", "limit": 0}, 10, 50),
+    ({"before_id": 10 ** 30, "limit": -5}, 2 ** 63 - 1, 1),
+])
+def test_private_history_paging_fields(packet, before_id, limit):
+    # main.py private_history 와 같은 검사
+    assert (packet_int(packet, "before_id", 0) or None, packet_int(packet, "limit", 50, 1, 100)) == (before_id, limit)
+
+
+@pytest.mark.parametrize("field, value", [("before_id", [1]), ("before_id", True), ("limit", "many")])
+def test_bad_private_history_paging_fields_are_rejected(field, value):
+    with pytest.raises(PacketError) as error:
+        packet_int({field: value}, field, 50, 1, 100)
+    assert error.value.field == field
@@ -0,0 +1,37 @@
+# 토큰 버킷 속도 제한 (rate_limit.py)
+import rate_limit
+from rate_limit import RateLimiter, TokenBucket
+
+
+def test_bucket_burst_then_retry_after():
+    bucket = TokenBucket(rate=2.0, burst=3)
+    bucket.updated = 0.0
+    assert [bucket.take(0.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.take(0.0) == 0.5      # 토큰 1개 = 0.5초
+    assert bucket.take(0.5) == 0.0      # 0.5초 뒤 다시 1개
+
+
+def test_user_bucket_is_shared_between_connections(monkeypatch):
+    monkeypatch.setattr(rate_limit, "USER_FACTOR", 1.5)
+    limiter = RateLimiter()
+    limiter.limits["text"] = (0.001, 4)     # 사용자 버킷 = 6
+    first, second = limiter.connection("A"), limiter.connection("A")
+    allowed = [first.check("text") == 0 for _ in range(4)] + [second.check("text") == 0 for _ in range(4)]
+    assert allowed.count(True) == 6     # 연결마다 4개지만 같은 사용자는 합쳐서 6개
+    # 사용자 예산에서 막힌 연결 토큰은 돌려받음
+    assert second.buckets["text"].tokens >= 1.9
+    assert limiter.stats()["throttled"]["text"] == 2
+
+
+def test_abusive_connection_after_strikes():
+    limiter = RateLimiter()
+    limiter.limits["gpt"] = (0.0001, 1)
+    conn = limiter.connection("B")
+    conn.check("gpt")
+    for _ in range(rate_limit.STRIKE_LIMIT):
+        assert conn.check("gpt") > 0
+    assert conn.abusive()
+
+
+def test_unknown_kind_is_not_limited():
+    assert RateLimiter().connection("C").check("nothing") == 0
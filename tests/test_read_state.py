@@ -0,0 +1,68 @@
+# 읽은 위치 묶음 기록 (read_state.py)
+import asyncio
+
+import read_state as read_state_module
+from database import load_all_last_read_ids, save_last_read_ids
+from read_state import ReadStateTracker
+
+
+def test_updates_coalesce_in_memory_and_flush_as_one_batch(run_db):
+    tracker = ReadStateTracker()
+
+    async def scenario():
+        for message_id in (3, 7, 5, 9):         # 늦게 온 5 는 무시
+            tracker.update("a", message_id)
+        tracker.update("b", 4)
+        tracker.update("c", "12")               # 정수가 아니면 무시
+        before = await load_all_last_read_ids()
+        await tracker.flush()
+        await tracker.flush()                   # 바뀐 것이 없으면 쓰지 않음
+        return before, await load_all_last_read_ids()
+
+    before, after = run_db(scenario)
+    assert before == {}
+    assert after == {"a": 9, "b": 4}
+    stats = tracker.stats()
+    assert (stats["updates"], stats["ignored"], stats["flushes"], stats["flushed_rows"]) == (4, 2, 1, 2)
+    assert stats["dirty"] == 0
+
+
+def test_get_reads_through_to_the_db_and_never_moves_back(run_db):
+    async def scenario():
+        await save_last_read_ids([("a", 20)])
+        tracker = ReadStateTracker()
+        first = await tracker.get("a")
+        tracker.update("a", 15)                 # DB 값보다 예전 위치
+        await save_last_read_ids([("a", 10)])   # 저장도 뒤로 가지 않음
+        return first, await tracker.get("a"), await tracker.get("nobody"), await load_all_last_read_ids()
+
+    assert run_db(scenario) == (20, 20, None, {"a": 20})
+
+
+def test_failed_flush_keeps_positions_for_the_next_run(run_db, monkeypatch):
+    tracker = ReadStateTracker(interval=0.01)
+    calls = []
+
+    async def flaky(positions):
+        calls.append(dict(positions))
+        if len(calls) == 1:
+            raise OSError("disk busy")
+        await save_last_read_ids(positions)
+
+    monkeypatch.setattr(read_state_module, "save_last_read_ids", flaky)
+
+    async def scenario():
+        tracker.update("a", 5)
+        await tracker.flush()                   # 실패 → 다음 주기에 다시
+        failed_dirty = dict(tracker.dirty)
+        tracker.update("b", 3)
+        tracker.start()                         # 주기 flush 가 남은 위치를 기록
+        await asyncio.sleep(0.05)
+        tracker.update("c", 1)
+        await tracker.stop()                    # 종료 시 남은 위치까지
+        return failed_dirty, await load_all_last_read_ids()
+
+    failed_dirty, stored = run_db(scenario)
+    assert failed_dirty == {"a": 5}
+    assert stored == {"a": 5, "b": 3, "c": 1}
+    assert calls[:2] == [{"a": 5}, {"a": 5, "b": 3}]
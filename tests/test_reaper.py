@@ -0,0 +1,110 @@
+# 하트비트 + 유휴 연결 정리 (reaper.py) - 실제 FanoutHub/ClientConnection 에 가짜 소켓
+import asyncio
+import json
+
+from fanout import FanoutHub
+from reaper import IDLE_CLOSE_CODE, Reaper
+
+
+class RecordingSocket:
+    def __init__(self):
+        self.sent = []
+        self.close_code = None
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text))
+
+    async def close(self, code=1000):
+        self.close_code = code
+
+
+def connect(hub, username, answers_ping=True):
+    socket = RecordingSocket()
+    conn = hub.register(username, socket)
+    conn.answers_ping = answers_ping
+    return conn, socket
+
+
+def pings(socket):
+    return sum(1 for packet in socket.sent if packet.get("type") == "ping")
+
+
+def test_check_pings_then_reaps_silent_connection():
+    async def scenario():
+        reaper = Reaper(ping_interval=20, idle_timeout=60)
+        hub = FanoutHub("chat")
+        conn, socket = connect(hub, "A")
+        start = conn.last_seen
+
+        reaper._check(conn, start + 5)          # 아직 조용한 시간이 짧음 → 다음 확인만 예약
+        reaper._check(conn, start + 25)         # ping
+        await asyncio.sleep(0.01)
+        assert pings(socket) == 1 and "A" in hub
+
+        reaper._check(conn, start + 61)         # 응답 없음 → 정리
+        await asyncio.sleep(0.01)
+        return reaper, hub, conn, socket
+
+    reaper, hub, conn, socket = asyncio.run(scenario())
+    assert "A" not in hub
+    assert conn.closed and socket.close_code == IDLE_CLOSE_CODE
+    stats = reaper.stats()
+    assert (stats["checked"], stats["pings"], stats["reaped"]) == (3, 1, 1)
+    assert stats["watched"] == 2        # 앞의 두 확인이 다시 등록한 것만 (정리된 연결은 등록 안 함)
+
+
+def test_legacy_connection_is_pinged_but_never_reaped():
+    async def scenario():
+        reaper = Reaper(ping_interval=20, idle_timeout=60)
+        hub = FanoutHub("notice")
+        conn, socket = connect(hub, "legacy", answers_ping=False)
+        reaper._check(conn, conn.last_seen + 3600)
+        await asyncio.sleep(0.01)
+        assert "legacy" in hub and not conn.closed
+        return reaper, conn, socket
+
+    reaper, conn, socket = asyncio.run(scenario())
+    assert pings(socket) == 1
+    assert reaper.reaped == 0
+    # 정리 시각이 없으니 ping 주기 뒤에 다시 확인
+    assert reaper.wheel[20] == [conn]
+
+
+def test_long_delay_is_capped_to_one_wheel_turn():
+    reaper = Reaper(ping_interval=500, idle_timeout=1000, tick=1.0, slots=8)
+
+    class Conn:
+        pass
+
+    conn = Conn()
+    reaper._schedule(conn, 500)
+    assert reaper.wheel[7] == [conn]
+
+
+def test_wheel_reaps_silent_and_keeps_active_connections():
+    async def scenario():
+        reaper = Reaper(ping_interval=0.05, idle_timeout=0.15, tick=0.01, slots=64)
+        hub = FanoutHub("chat")
+        silent, silent_socket = connect(hub, "silent")
+        active, _ = connect(hub, "active")
+        closed, _ = connect(hub, "closed")
+        for conn in (silent, active, closed):
+            reaper.watch(conn)
+        await closed.close()
+        reaper.start()
+        try:
+            for _ in range(20):     # active 는 계속 프레임을 보냄
+                await asyncio.sleep(0.02)
+                active.touch()
+        finally:
+            await reaper.stop()
+        assert hub.usernames() == ["active"]
+        return reaper, silent, silent_socket
+
+    reaper, silent, silent_socket = asyncio.run(scenario())
+    assert silent.closed and pings(silent_socket) >= 1
+    stats = reaper.stats()
+    assert stats["reaped"] == 1
+    assert stats["watched"] == 1        # 닫힌 연결과 정리된 연결은 휠에서 빠짐
+    assert stats["max_tick_ms"] >= stats["last_tick_ms"] >= 0
+    assert reaper.task is None
@@ -0,0 +1,55 @@
+# 메시지별 안 읽은 사람 수 (receipts.py) + 읽은 위치 상한 (read_state.update 의 latest_id)
+from read_state import ReadStateTracker
+from receipts import ReadReceipts
+
+
+def loaded() -> ReadReceipts:
+    receipts = ReadReceipts()
+    receipts.load({"a": 5, "b": 10, "c": None}, latest_id=12)
+    return receipts
+
+
+def test_unread_counts_follow_the_read_positions():
+    receipts = loaded()
+    assert [receipts.unread_count(m) for m in (1, 5, 6, 10, 11, 12)] == [1, 1, 2, 2, 3, 3]
+    # 1~5 는 1명, 6~10 은 2명, 11~12 는 3명이 안 읽음
+    assert receipts.snapshot_range(1, 12) == {"type": "read_receipts", "after": 0,
+                                              "steps": [[5, 1], [10, 2], [12, 3]]}
+    assert receipts.snapshot([{"id": 6}, {"id": 9}])["steps"] == [[9, 2]]
+    assert receipts.snapshot([]) is None
+
+
+def test_advance_sends_only_the_changed_range():
+    receipts = loaded()
+    assert receipts.advance("c", 7) == {"type": "read_receipts", "after": 0, "steps": [[5, 0], [7, 1]]}
+    assert receipts.advance("c", 6) is None            # 뒤로는 이동하지 않음
+    assert receipts.advance("a", 12)["steps"] == [[7, 0], [10, 1], [12, 2]]
+    assert [receipts.unread_count(m) for m in (3, 8, 11)] == [0, 1, 2]
+    assert receipts.stats() == {"users": 3, "latest_id": 12, "deltas": 2}
+
+
+def test_future_ids_are_clamped_to_the_latest_message():
+    receipts = loaded()
+    assert receipts.advance("c", 999)["steps"] == [[5, 0], [10, 1], [12, 2]]
+    assert receipts.positions["c"] == 12
+    receipts.note_message(13)                           # 새 메시지는 c 도 아직 안 읽음
+    assert receipts.unread_count(13) == 3
+    assert receipts.join("d", 10 ** 9) is None         # DB 에 남은 잘못된 위치도 최신까지만 → 바뀐 수 없음
+    assert receipts.positions["d"] == 13
+    assert receipts.unread_count(13) == 3
+
+
+def test_join_of_a_new_user_raises_counts_after_their_position():
+    receipts = loaded()
+    assert receipts.join("d", 8) == {"type": "read_receipts", "after": 8, "steps": [[10, 3], [12, 4]]}
+    assert receipts.join("d", 0) is None               # 이미 있는 사용자
+    assert receipts.unread_count(12) == 4
+
+
+def test_read_state_update_clamps_to_latest_id():
+    tracker = ReadStateTracker()
+    assert tracker.update("a", 10 ** 9, latest_id=40) == 40
+    assert tracker.update("a", 41, latest_id=40) is None
+    assert tracker.update("a", 45, latest_id=50) == 45
+    assert tracker.dirty == {"a": 45}
+    assert tracker.stats()["clamped"] == 2
@@ -0,0 +1,59 @@
+# 방 구성원 색인 (rooms.RoomRegistry) - 참여/나가기가 DB 에 남고, 다른 워커(새 색인)가 같은 목록을 읽음
+import pytest
+
+import rooms
+from bus import LocalBus
+from rooms import RoomRegistry, normalize_room
+
+
+@pytest.fixture
+def local_bus(monkeypatch):
+    """room_member 이벤트를 이 테스트의 색인에만 전달"""
+    test_bus = LocalBus()
+    monkeypatch.setattr(rooms, "bus", test_bus)
+    return test_bus
+
+
+def test_membership_is_persisted_and_reloaded(run_db, local_bus):
+    worker = RoomRegistry()
+    local_bus.subscribe("room_member", worker.apply)
+
+    async def scenario():
+        results = [
+            await worker.join("dev", "a"),
+            await worker.join("dev", "b"),
+            await worker.join("dev", "a"),         # 이미 참여
+            await worker.join("design", "b"),
+            await worker.join("lobby", "a"),       # lobby 는 구성원 목록 없음
+            await worker.leave("design", "b"),
+            await worker.leave("design", "b"),     # 이미 나감
+        ]
+        restarted = RoomRegistry()
+        await restarted.load()
+        return results, restarted
+
+    results, restarted = run_db(scenario)
+    assert results == [True, True, False, True, False, True, False]
+    assert local_bus.published == 4
+    for registry in (worker, restarted):
+        assert registry.members_of("dev") == {"a", "b"}
+        assert registry.members_of("design") == set()      # 방은 남고 구성원만 빠짐
+        assert registry.rooms_of("b") == ["lobby", "dev"]
+        assert registry.is_member("lobby", "nobody") and not registry.is_member("design", "b")
+    assert restarted.packet("a") == {"type": "rooms", "joined": ["lobby", "dev"],
+                                     "all": [{"name": "design", "members": 0}, {"name": "dev", "members": 2}]}
+
+
+def test_room_fanout_stats():
+    registry = RoomRegistry()
+    registry.apply({"room": "dev", "username": "a", "joined": True})
+    registry.note_fanout(3)
+    registry.note_fanout(1)
+    assert registry.stats() == {"rooms": 1, "memberships": 1, "room_messages": 2, "avg_room_fanout": 2.0}
+
+
+@pytest.mark.parametrize("name, expected", [
+    (" dev ", "dev"), ("", None), ("   ", None), ("x" * 33, None), (["dev"], None), (None, None),
+])
+def test_room_names_are_normalized(name, expected):
+    assert normalize_room(name) == expected
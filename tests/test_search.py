@@ -0,0 +1,78 @@
+# 메시지 검색 (database.search_messages) - FTS5 경로와 짧은 단어 LIKE 경로
+from datetime import datetime, timedelta
+
+from database import save_message, search_messages
+
+NOW = datetime.now().replace(microsecond=0)
+
+
+async def seed():
+    ids = {}
+    for key, sender, text, days_ago, room in [
+        ("old",     "A", "작년 회의록 정리했습니다",      400, "lobby"),
+        ("minutes", "A", "오늘 회의록 공유드립니다",        2, "lobby"),
+        ("meeting", "B", "3시 회의 있어요",               1, "lobby"),
+        ("both",    "B", "회의록 보고 회의 준비해 주세요",   1, "lobby"),
+        ("room",    "C", "개발팀 회의록 초안",              1, "dev"),
+        ("percent", "C", "진행률 100% 완료",              1, "lobby"),
+        ("quote",   "A", 'say "hello OR bye" please',      1, "lobby"),
+    ]:
+        ids[key] = await save_message(sender, text, now=NOW - timedelta(days=days_ago), room=room)
+    return ids
+
+
+def search(run_db, *queries, **filters):
+    async def scenario():
+        ids = await seed()
+        return ids, [await search_messages(query, **filters) for query in queries]
+    return run_db(scenario)
+
+
+def found(result):
+    results, _ = result
+    return [r["id"] for r in results]
+
+
+def test_long_terms_use_the_full_text_index(run_db):
+    ids, (minutes, both, quoted) = search(run_db, "회의록", "회의록 보고", '"hello OR bye"')
+    assert sorted(found(minutes)) == sorted([ids["old"], ids["minutes"], ids["both"]])    # 기간 제한 없음
+    assert "[회의록]" in minutes[0][0]["snippet"]
+    assert found(both) == [ids["both"]]         # 긴 단어(색인) + 짧은 단어(LIKE) AND
+    assert found(quoted) == [ids["quote"]]      # FTS 연산자/따옴표는 글자 그대로
+
+
+def test_short_terms_fall_back_to_recent_like_search(run_db):
+    ids, (meeting, percent) = search(run_db, "회의", "0%")
+    # 1년 전 메시지는 최근 SHORT_QUERY_DAYS 일 밖이라 제외, 최신순
+    assert found(meeting) == sorted([ids["minutes"], ids["meeting"], ids["both"]], reverse=True)
+    assert meeting[0][0]["snippet"].count("[회의]") == 2
+    assert found(percent) == [ids["percent"]]   # % 는 와일드카드가 아님
+
+
+def test_filters_room_and_paging(run_db):
+    async def scenario():
+        ids = await seed()
+        return ids, {
+            "sender": await search_messages("회의록", sender="B"),
+            "room": await search_messages("회의록", room="dev"),
+            "range": await search_messages("회의록", start=NOW - timedelta(days=3), end=NOW),
+            "page0": await search_messages("회의록", limit=2),
+            "page1": await search_messages("회의록", limit=2, offset=2),
+            "empty": await search_messages("   "),
+        }
+
+    ids, results = run_db(scenario)
+    assert found(results["sender"]) == [ids["both"]]
+    assert found(results["room"]) == [ids["room"]]
+    assert sorted(found(results["range"])) == sorted([ids["minutes"], ids["both"]])
+    assert results["page0"][1] is True and results["page1"][1] is False
+    assert sorted(found(results["page0"]) + found(results["page1"])) == \
+        sorted([ids["old"], ids["minutes"], ids["both"]])
+    assert results["empty"] == ([], False)
+
+
+def test_huge_paging_values_are_clamped_to_sqlite_integers():
+    from packet_fields import SQLITE_MAX_INT, packet_int
+
+    assert packet_int({"until_id": 10 ** 30}, "until_id", 0) == SQLITE_MAX_INT
+    assert packet_int({"page": str(10 ** 30)}, "page", 0, 0, 1000) == 1000
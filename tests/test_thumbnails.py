@@ -0,0 +1,50 @@
+# 이미지 썸네일 (thumbnails.py) - 프로세스 풀 생성, 중복 요청 합치기, 백그라운드 task 관리
+import asyncio
+import os
+
+import pytest
+
+from attachment_store import attachment_path
+from thumbnails import THUMB_WIDTH, ThumbnailService, thumbnail_path
+
+Image = pytest.importorskip("PIL.Image")
+
+FILE_HASH = "ab" * 32
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(os.path.dirname(attachment_path(FILE_HASH)))
+    Image.new("RGB", (720, 360), "red").save(attachment_path(FILE_HASH), format="PNG")
+    service = ThumbnailService(workers=1)
+    service.start()
+    yield service
+    service.shutdown()
+
+
+def test_schedule_keeps_the_task_until_the_thumbnail_exists(service):
+    async def scenario():
+        service.schedule(FILE_HASH, ".txt")         # 이미지가 아니면 아무 것도 하지 않음
+        assert not service.tasks
+        service.schedule(FILE_HASH, ".PNG")
+        service.schedule(FILE_HASH, ".png")         # 같은 파일은 생성 1번
+        assert len(service.tasks) == 2
+        await asyncio.gather(*service.tasks)
+        await asyncio.sleep(0)
+        return service.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats == {"generated": 1, "failed": 0, "pending": 0, "background": 0}
+    with Image.open(thumbnail_path(FILE_HASH)) as thumb:
+        assert thumb.size == (THUMB_WIDTH, 90)
+
+
+def test_failed_render_is_counted_and_returns_none(service):
+    async def scenario():
+        with open(attachment_path(FILE_HASH), "wb") as f:
+            f.write(b"not an image")
+        return await service.ensure(FILE_HASH), await service.read_b64(FILE_HASH)
+
+    assert asyncio.run(scenario()) == (None, None)
+    assert service.failed == 2 and service.generated == 0
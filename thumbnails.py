@@ -0,0 +1,126 @@
+# thumbnails.py
+# 이미지 첨부파일 미리보기(썸네일) 생성 - 프로세스 풀에서 만들어 이벤트 루프를 막지 않음
+# 클라이언트는 말풍선에 180px 썸네일만 받고, 원본은 크게 보기/저장할 때만 받아감
+import asyncio
+import base64
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from attachment_store import ATTACHMENT_DIR, attachment_path
+
+THUMB_DIR = os.path.join(ATTACHMENT_DIR, "thumbs")
+THUMB_WIDTH = 180               # 클라이언트 말풍선 표시 폭 (scaledToWidth(180))
+THUMB_WORKERS = 2
+IMAGE_TYPES = {".png", ".jpg", ".jpeg", ".gif", ".bmp", ".webp"}
+
+
+def thumbnail_path(file_hash: str) -> str:
+    return os.path.join(THUMB_DIR, f"{file_hash}_{THUMB_WIDTH}")
+
+
+def render_thumbnail(src: str, dst: str, width: int) -> int:
+    """(워커 프로세스에서 실행) 원본 → 폭 width 의 썸네일. 투명도가 없으면 JPEG, 있으면 PNG"""
+    from PIL import Image
+
+    with Image.open(src) as img:
+        img.seek(0)     # GIF 는 첫 프레임
+        if img.width > width:
+            img = img.resize((width, max(1, img.height * width // img.width)), Image.LANCZOS)
+
+        tmp = dst + ".tmp"
+        if img.mode in ("RGBA", "LA", "P"):
+            img.convert("RGBA").save(tmp, format="PNG", optimize=True)
+        else:
+            img.convert("RGB").save(tmp, format="JPEG", quality=80, optimize=True)
+
+    os.replace(tmp, dst)
+    return os.path.getsize(dst)
+
+
+class ThumbnailService:
+    """썸네일 생성 요청을 프로세스 풀로 넘기고, 같은 파일에 대한 중복 요청은 하나로 합침"""
+
+    def __init__(self, workers: int = THUMB_WORKERS):
+        self.workers = workers
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.pending = {}   # hash → asyncio.Future
+        self.tasks = set()  # schedule 로 시작한 백그라운드 task (참조를 잡아 두어야 도중에 GC 되지 않음)
+        self.generated = 0
+        self.failed = 0
+
+    def start(self):
+        os.makedirs(THUMB_DIR, exist_ok=True)
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+        for task in list(self.tasks):
+            task.cancel()
+
+    def schedule(self, file_hash: str, ext: str):
+        """업로드 완료 직후 호출 - 기다리지 않고 백그라운드에서 생성 시작"""
+        if ext.lower() in IMAGE_TYPES:
+            task = asyncio.create_task(self.ensure(file_hash))
+            self.tasks.add(task)
+            task.add_done_callback(self._on_task_done)
+
+    def _on_task_done(self, task: asyncio.Task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"⚠️ 썸네일 백그라운드 작업 실패: {task.exception()}")
+
+    async def ensure(self, file_hash: str) -> Optional[str]:
+        """썸네일 파일 경로 반환 (없으면 생성, 실패하면 None)"""
+        dst = thumbnail_path(file_hash)
+        if os.path.exists(dst):
+            return dst
+        if self.pool is None:
+            return None
+
+        future = self.pending.get(file_hash)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self.pool, render_thumbnail, attachment_path(file_hash), dst, THUMB_WIDTH)
+            self.pending[file_hash] = future
+            future.add_done_callback(lambda f, h=file_hash: self._on_done(h, f))
+
+        try:
+            await asyncio.shield(future)
+            return dst
+        except Exception as e:
+            print(f"⚠️ 썸네일 생성 실패 ({file_hash[:12]}): {e}")
+            return None
+
+    def _on_done(self, file_hash, future):
+        self.pending.pop(file_hash, None)
+        if future.cancelled() or future.exception() is not None:
+            self.failed += 1
+        else:
+            self.generated += 1
+
+    async def read_b64(self, file_hash: str) -> Optional[str]:
+        """메시지에 바로 실어 보낼 썸네일 (base64)"""
+        path = await self.ensure(file_hash)
+        if path is None:
+            return None
+        data = await asyncio.to_thread(_read_file, path)
+        return base64.b64encode(data).decode("utf-8")
+
+    def stats(self) -> dict:
+        return {
+            "generated": self.generated,
+            "failed": self.failed,
+            "pending": len(self.pending),
+            "background": len(self.tasks),
+        }
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+thumbnail_service = ThumbnailService()